@@ -7,14 +7,20 @@ from routes.repartidor import repartidor_bp
 from routes.admin import admin_bp
 from routes.config import config_bp
 from routes.session import session_bp
-from utils.session_manager import session_manager
-import psycopg  # ✅ PostgreSQL (v3)
-from psycopg.rows import dict_row
-from flask_session import Session
+from utils.session_manager import session_manager, sessionless
+from utils.db_pool import db_pool  # ✅ PostgreSQL (v3) con pool de conexiones
+from utils.query_stats import query_stats  # 📊 Métricas de consultas SQL
+from utils.cache import cache  # 🧊 Caché compartida entre workers
+from utils.menu_cache import menu_cache  # 🍽️ Caché del menú de clientes
+from utils.category_cache import category_cache  # 🏷️ Caché de categorías
+from utils.single_flight import single_flight  # 🛬 Una sola carga en vuelo por clave
+from utils.session_store import session_store  # 🍪 Sesiones: cookie firmada / SQLite / PostgreSQL
+from utils.password_hashing import password_hasher  # 🔑 Hash de contraseñas en un pool acotado
+from utils.rate_limiter import login_limiter  # 🚦 Límite de intentos de login (memoria compartida)
+from utils.access_log import access_log  # 📝 Log de intentos de acceso en lotes
 from flask_mail import Mail
 from dotenv import load_dotenv
 import os
-import sys
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -38,63 +44,95 @@ def create_app():
     app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
     app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
 
-    # 🗄️ Configuración de base de datos PostgreSQL con reconexión automática
-    def get_db_connection():
-        """Obtener conexión a la base de datos PostgreSQL con reconexión automática"""
-        try:
-            connection = psycopg.connect(
-                host=app.config["DB_HOST"],
-                user=app.config["DB_USER"],
-                password=app.config["DB_PASSWORD"],
-                dbname=app.config["DB_NAME"],
-                row_factory=dict_row,
-                connect_timeout=10,
-                autocommit=True
-            )
-            print(f"✅ PostgreSQL conectado: {app.config['DB_HOST']}/{app.config['DB_NAME']}")
-            return connection
-        except Exception as e:
-            print(f"❌ Error conectando a PostgreSQL: {e}", file=sys.stderr)
-            print(f"Host: {app.config['DB_HOST']}, DB: {app.config['DB_NAME']}", file=sys.stderr)
-            return None
-    
-    # Función para obtener conexión segura
-    def get_db():
-        """Obtener conexión de base de datos con manejo de errores"""
-        if not hasattr(app, 'db') or app.db is None or app.db.closed:
-            app.db = get_db_connection()
-        
-        try:
-            # Probar la conexión actual
-            cursor = app.db.cursor()
-            cursor.execute("SELECT 1")
-            cursor.close()
-            return app.db
-        except:
-            # Si falla, crear nueva conexión
-            print("🔄 Reconectando a PostgreSQL...", file=sys.stderr)
-            app.db = get_db_connection()
-            return app.db
-    
-    # Establecer conexión inicial
-    app.db = get_db_connection()
-    app.get_db = get_db
+    # 🗄️ Pool de conexiones PostgreSQL (uno por worker de gunicorn)
+    app.config['DB_POOL_MIN_SIZE'] = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+    app.config['DB_POOL_MAX_SIZE'] = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+    app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+    app.config['DB_POOL_CHECK_IDLE_SECONDS'] = int(os.getenv('DB_POOL_CHECK_IDLE_SECONDS', '30'))
+    # Réplica de solo lectura (opcional) y ventana read-your-writes tras una escritura
+    app.config['DB_REPLICA_URL'] = os.getenv('DB_REPLICA_URL') or None
+    app.config['DB_READ_YOUR_WRITES_SECONDS'] = int(os.getenv('DB_READ_YOUR_WRITES_SECONDS', '5'))
+    db_pool.init_app(app)
+
+    # 📊 Instrumentación de consultas (log de lentas, agregados por ruta, Server-Timing)
+    app.config['DB_SLOW_QUERY_MS'] = float(os.getenv('DB_SLOW_QUERY_MS', '200'))
+    app.config['DB_SERVER_TIMING'] = os.getenv('DB_SERVER_TIMING', 'True').lower() == 'true'
+    query_stats.init_app(app)
+
+    # 📦 Importación masiva de productos (CSV/JSON)
+    app.config['PRODUCT_IMPORT_MAX_ROWS'] = int(os.getenv('PRODUCT_IMPORT_MAX_ROWS', '5000'))
+
+    # 🧊 Caché de dos niveles: memoria del worker + SQLite (WAL) compartido en el servidor
+    app.config['CACHE_BACKEND'] = os.getenv('CACHE_BACKEND', 'sqlite')
+    app.config['CACHE_SQLITE_PATH'] = os.getenv('CACHE_SQLITE_PATH') or None  # None = instance/ (privado, 0700)
+    app.config['CACHE_DEFAULT_TTL'] = int(os.getenv('CACHE_DEFAULT_TTL', '300'))
+    app.config['CACHE_LOCAL_MAX_ENTRIES'] = int(os.getenv('CACHE_LOCAL_MAX_ENTRIES', '1024'))
+    app.config['CACHE_SYNC_INTERVAL'] = float(os.getenv('CACHE_SYNC_INTERVAL', '1'))
+    cache.init_app(app)
 
-    # ⏰ Configurar Flask-Session con timeout y seguridad
-    app.config['SESSION_TYPE'] = 'filesystem'
+    # 🛬 Single-flight: espera máxima por una carga en curso y ventana de datos obsoletos
+    app.config['SINGLE_FLIGHT_TIMEOUT'] = float(os.getenv('SINGLE_FLIGHT_TIMEOUT', '5'))
+    app.config['SINGLE_FLIGHT_STALE_TTL'] = int(os.getenv('SINGLE_FLIGHT_STALE_TTL', '60'))
+    app.config['ORDER_LISTS_CACHE_TTL'] = int(os.getenv('ORDER_LISTS_CACHE_TTL', '5'))
+    single_flight.init_app(app)
+
+    # 🍽️ Caché del menú (se invalida por restaurante al cambiar productos)
+    app.config['MENU_CACHE_TTL'] = int(os.getenv('MENU_CACHE_TTL', '300'))
+    menu_cache.init_app(app)
+
+    # 🏷️ Lista de categorías versionada (admin la invalida al crear/eliminar)
+    app.config['CATEGORY_CACHE_TTL'] = int(os.getenv('CATEGORY_CACHE_TTL', '3600'))
+    category_cache.init_app(app)
+
+    # 🔑 Hash de contraseñas: método/costo (formato werkzeug), pool de procesos y admisión
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config['PASSWORD_HASH_PROCESSES'] = int(os.getenv('PASSWORD_HASH_PROCESSES', '1'))  # 0 = en línea
+    app.config['PASSWORD_HASH_CONCURRENCY'] = int(os.getenv('PASSWORD_HASH_CONCURRENCY', str(max(1, (os.cpu_count() or 2) // 2))))
+    app.config['PASSWORD_HASH_WAIT'] = float(os.getenv('PASSWORD_HASH_WAIT', '3'))
+    app.config['PASSWORD_HASH_TIMEOUT'] = float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+    app.config['PASSWORD_HASH_NICE'] = int(os.getenv('PASSWORD_HASH_NICE', '5'))
+    password_hasher.init_app(app)
+
+    # 🚦 Límite de intentos de login por IP y por email ("intentos/segundos"), antes de la BD
+    app.config['LOGIN_RATE_LIMIT'] = os.getenv('LOGIN_RATE_LIMIT', 'True').lower() == 'true'
+    app.config['LOGIN_RATE_LIMIT_IP'] = os.getenv('LOGIN_RATE_LIMIT_IP', '30/60')
+    app.config['LOGIN_RATE_LIMIT_EMAIL'] = os.getenv('LOGIN_RATE_LIMIT_EMAIL', '10/60')
+    app.config['RATE_LIMIT_PATH'] = os.getenv('RATE_LIMIT_PATH') or None  # None = instance/ (privado, 0700)
+    app.config['RATE_LIMIT_SLOTS'] = int(os.getenv('RATE_LIMIT_SLOTS', '65536'))
+    login_limiter.init_app(app)
+
+    # 📝 Log de intentos de acceso: buffer por worker, INSERT en lotes y particiones mensuales
+    app.config['ACCESS_LOG_BUFFERED'] = os.getenv('ACCESS_LOG_BUFFERED', 'True').lower() == 'true'
+    app.config['ACCESS_LOG_BATCH_SIZE'] = int(os.getenv('ACCESS_LOG_BATCH_SIZE', '200'))
+    app.config['ACCESS_LOG_FLUSH_INTERVAL'] = float(os.getenv('ACCESS_LOG_FLUSH_INTERVAL', '5'))
+    app.config['ACCESS_LOG_MAX_BUFFER'] = int(os.getenv('ACCESS_LOG_MAX_BUFFER', '10000'))
+    app.config['ACCESS_LOG_RETENTION_MONTHS'] = int(os.getenv('ACCESS_LOG_RETENTION_MONTHS', '6'))
+    access_log.init_app(app)
+
+    # 📡 GET condicional (ETag / 304) en menú, productos y mis pedidos
+    app.config['CONDITIONAL_GET'] = os.getenv('CONDITIONAL_GET', 'True').lower() == 'true'
+
+    # ⏰ Sesiones con timeout y seguridad (backend intercambiable, ver utils/session_store.py)
+    app.config['SESSION_BACKEND'] = os.getenv('SESSION_BACKEND', 'cookie')
     app.config['SESSION_PERMANENT'] = False
-    app.config['SESSION_FILE_DIR'] = './flask_session'
+    # Directorio del Flask-Session anterior: backend filesystem y migración de sesiones existentes
+    app.config['SESSION_FILE_DIR'] = os.getenv('SESSION_FILE_DIR', './flask_session')
+    app.config['SESSION_SQLITE_PATH'] = os.getenv('SESSION_SQLITE_PATH') or None  # None = instance/ (privado, 0700)
+    app.config['SESSION_PURGE_INTERVAL'] = int(os.getenv('SESSION_PURGE_INTERVAL', '300'))
     app.config['SESSION_COOKIE_SECURE'] = os.getenv('SESSION_COOKIE_SECURE', 'False').lower() == 'true'
     app.config['SESSION_COOKIE_HTTPONLY'] = True
     app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
     app.config['PERMANENT_SESSION_LIFETIME'] = 1800  # 30 minutos en segundos
-    Session(app)
+    session_store.init_app(app)
     
     # Configurar Flask-Mail
     mail = Mail(app)
     app.mail = mail
     
     # 🕐 Inicializar gestor de sesiones con timeout
+    # last_activity solo se reescribe cuando avanza al menos esta cantidad de segundos
+    app.config['SESSION_ACTIVITY_GRANULARITY'] = int(os.getenv('SESSION_ACTIVITY_GRANULARITY', '60'))
+    app.config['SESSION_STATUS_COOKIE'] = os.getenv('SESSION_STATUS_COOKIE', 'session_status')
     session_manager.init_app(app)
 
     # Registrar blueprints
@@ -116,25 +154,22 @@ def create_app():
         return render_template("offline.html")
     
     @app.route("/health")
+    @sessionless
     def health_check():
         """Endpoint de salud para Render"""
         try:
-            db_status = "connected" if app.db and not app.db.closed else "disconnected"
+            pool_stats = db_pool.stats()
+            db_status = "connected" if pool_stats['status'] == 'open' else "disconnected"
             return {
                 "status": "healthy",
                 "database": db_status,
+                "db_pool": pool_stats,
                 "environment": os.getenv('FLASK_ENV', 'development'),
                 "port": os.getenv('PORT', 'not set')
             }, 200
         except Exception as e:
             return {"status": "unhealthy", "error": str(e)}, 500
 
-    @app.teardown_appcontext
-    def close_db(error):
-        """Cerrar conexión al finalizar request"""
-        if hasattr(app, 'db') and app.db and not app.db.closed:
-            app.db.close()
-
     # Log de inicio
     port = os.getenv('PORT', '5000')
     print(f"🚀 DomiWeb iniciando en puerto {port}")
@@ -142,8 +177,10 @@ def create_app():
 
     return app
 
-# Para Gunicorn (producción)
-app = create_app()
+# Para Gunicorn (producción). Con python app.py los procesos del pool de hash
+# (forkserver) importan este archivo como __mp_main__: ahí no se crea la app
+if __name__ != "__mp_main__":
+    app = create_app()
 
 # Para desarrollo local
 if __name__ == "__main__":
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+🔑 Benchmark del hash de contraseñas (para elegir PASSWORD_HASH_METHOD)
+
+Mide en esta máquina, para cada método en formato werkzeug:
+- Latencia de generate_password_hash / check_password_hash (p50/p95)
+- Logins por segundo con N procesos en paralelo (lo que soporta el nodo
+  si PASSWORD_HASH_CONCURRENCY = N)
+
+y sugiere, por algoritmo, el método más costoso cuya verificación queda
+bajo --target-ms (scrypt es el de werkzeug por defecto y el preferido).
+No necesita base de datos.
+
+Ejemplos:
+  python benchmarks/password_hashing.py
+  python benchmarks/password_hashing.py --methods scrypt:16384:8:1 scrypt:32768:8:1 --concurrency 4
+  python benchmarks/password_hashing.py --target-ms 100 --json hash.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+PASSWORD = 'Bench123!'
+
+METODOS = [
+    'pbkdf2:sha256:260000',
+    'pbkdf2:sha256:600000',
+    'scrypt:16384:8:1',
+    'scrypt:32768:8:1',
+    'scrypt:65536:8:1',
+]
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def medir(funcion, iteraciones):
+    """Tiempos en ms de iteraciones llamadas"""
+    tiempos = []
+    for _ in range(iteraciones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+def verificar(hashed):
+    return check_password_hash(hashed, PASSWORD)
+
+
+def throughput(hashed, procesos, total):
+    """Verificaciones por segundo con procesos en paralelo"""
+    with ProcessPoolExecutor(max_workers=procesos) as executor:
+        list(executor.map(verificar, [hashed] * procesos))  # Arranque de los procesos
+        inicio = time.perf_counter()
+        list(executor.map(verificar, [hashed] * total))
+        return total / (time.perf_counter() - inicio)
+
+
+def run(args):
+    resultados = []
+    for metodo in args.methods:
+        try:
+            hashed = generate_password_hash(PASSWORD, metodo)
+        except ValueError as e:
+            print(f"⚠️ {metodo}: {e}")
+            continue
+        hash_ms = medir(lambda: generate_password_hash(PASSWORD, metodo), args.iterations)
+        verify_ms = medir(lambda: verificar(hashed), args.iterations)
+        por_segundo = throughput(hashed, args.concurrency, args.iterations * args.concurrency)
+        resultado = {
+            'metodo': metodo,
+            'hash_p50_ms': round(statistics.median(hash_ms), 1),
+            'verify_p50_ms': round(statistics.median(verify_ms), 1),
+            'verify_p95_ms': round(percentil(verify_ms, 95), 1),
+            'logins_por_segundo': round(por_segundo, 1),
+        }
+        resultados.append(resultado)
+        print(f"  {metodo:<24} hash p50 {resultado['hash_p50_ms']:>7} ms   "
+              f"verify p50 {resultado['verify_p50_ms']:>7} ms  p95 {resultado['verify_p95_ms']:>7} ms   "
+              f"{resultado['logins_por_segundo']:>7} logins/s con {args.concurrency} proceso(s)")
+
+    # Por algoritmo: el más costoso que cumple el objetivo
+    sugeridos = {}
+    for r in resultados:
+        algoritmo = r['metodo'].split(':', 1)[0]
+        actual = sugeridos.get(algoritmo)
+        if r['verify_p95_ms'] <= args.target_ms and (actual is None or r['verify_p50_ms'] > actual['verify_p50_ms']):
+            sugeridos[algoritmo] = r
+    print()
+    if not sugeridos:
+        print(f"⚠️ Ningún método verifica bajo {args.target_ms} ms en esta máquina")
+    for algoritmo, r in sugeridos.items():
+        print(f"✅ {algoritmo} (verify p95 <= {args.target_ms} ms): PASSWORD_HASH_METHOD={r['metodo']}")
+
+    reporte = {'cpu_count': os.cpu_count(), 'concurrencia': args.concurrency,
+               'target_ms': args.target_ms, 'resultados': resultados,
+               'sugeridos': {algoritmo: r['metodo'] for algoritmo, r in sugeridos.items()}}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+        print(f"💾 Reporte guardado en {args.json}")
+    return reporte
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del hash de contraseñas de DomiFlash')
+    parser.add_argument('--methods', nargs='+', default=METODOS, help='Métodos en formato werkzeug')
+    parser.add_argument('--iterations', type=int, default=10, help='Mediciones por método (default: 10)')
+    parser.add_argument('--concurrency', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='Procesos en paralelo para medir logins/s (default: CPUs / 2)')
+    parser.add_argument('--target-ms', type=float, default=250, help='Latencia máxima aceptable de un login (default: 250)')
+    parser.add_argument('--json', help='Guardar el reporte en este archivo JSON')
+    args = parser.parse_args()
+    print(f"🔑 Midiendo {len(args.methods)} método(s) en {os.cpu_count()} CPU(s)...")
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -161,19 +161,30 @@ CREATE INDEX idx_token_expiracion ON tokens_recuperacion (
     usado
 );
 
--- Tabla: log_intentos_acceso
+-- Tabla: log_intentos_acceso (particionada por mes; ver mantener_particiones_log)
+-- La aplicación escribe en lotes (utils/access_log.py)
 CREATE TABLE IF NOT EXISTS log_intentos_acceso (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     email VARCHAR(100) NOT NULL,
     ip_address VARCHAR(45) DEFAULT NULL,
     exito BOOLEAN DEFAULT FALSE,
-    fecha_intento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    fecha_intento TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     user_agent TEXT DEFAULT NULL,
-    motivo_fallo VARCHAR(100) DEFAULT NULL
-);
+    motivo_fallo VARCHAR(100) DEFAULT NULL,
+    PRIMARY KEY (id, fecha_intento)
+) PARTITION BY RANGE (fecha_intento);
 
 CREATE INDEX idx_log_email_fecha ON log_intentos_acceso (email, fecha_intento);
 
+-- Tabla: sesiones (SESSION_BACKEND=postgres; efímera, sin WAL)
+CREATE UNLOGGED TABLE IF NOT EXISTS sesiones (
+    sid VARCHAR(64) PRIMARY KEY,
+    datos TEXT NOT NULL,
+    expira TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_sesiones_expira ON sesiones (expira);
+
 -- =====================================================
 -- FUNCIONES Y PROCEDIMIENTOS ALMACENADOS
 -- =====================================================
@@ -401,6 +412,116 @@ BEGIN
 END;
 $$;
 
+-- Función: procesar_checkout
+-- Crea el pedido, registra el pago y calcula el tiempo estimado de entrega
+-- en una sola llamada (una sola transacción). Los parámetros de cálculo y los
+-- factores aleatorios vienen de DeliveryCalculator (Python).
+-- Si el carrito está vacío no crea nada y no retorna filas.
+-- Si el restaurante no tiene ubicación, tiempo, hora y distancia vuelven NULL.
+CREATE OR REPLACE FUNCTION procesar_checkout(
+    p_idusu INT,
+    p_idres INT,
+    p_metodo metodo_pago,
+    p_velocidad_kmh NUMERIC,
+    p_preparacion_base NUMERIC,
+    p_extra_por_producto NUMERIC,
+    p_factor_trafico NUMERIC,
+    p_buffer_minutos INT,
+    p_lat_simulada DECIMAL(10, 8),
+    p_lng_simulada DECIMAL(11, 8)
+)
+RETURNS TABLE(
+    id_pedido INT,
+    total DECIMAL(10, 2),
+    num_items INT,
+    tiempo_estimado INT,
+    hora_estimada TIMESTAMP,
+    distancia_km NUMERIC,
+    restaurante VARCHAR(100)
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_total DECIMAL(10, 2);
+    v_items INT;
+    v_idped INT;
+    v_lat_res DECIMAL(10, 8);
+    v_lng_res DECIMAL(11, 8);
+    v_nomres VARCHAR(100);
+    v_lat_usu DECIMAL(10, 8);
+    v_lng_usu DECIMAL(11, 8);
+    v_distancia NUMERIC;
+    v_minutos INT;
+    v_hora TIMESTAMP;
+BEGIN
+    -- Bloquear el carrito para evitar pedidos duplicados por doble envío
+    PERFORM 1 FROM carritos WHERE idusu = p_idusu FOR UPDATE;
+
+    -- Total del carrito (antes de vaciarlo)
+    SELECT COALESCE(SUM(c.canprocar * p.prepro), 0), COUNT(*)
+    INTO v_total, v_items
+    FROM carritos c
+    JOIN productos p ON c.idpro = p.idpro
+    WHERE c.idusu = p_idusu;
+
+    IF v_items = 0 OR v_total <= 0 THEN
+        RETURN;
+    END IF;
+
+    -- Crear pedido (pasa el carrito al detalle y lo vacía) y registrar pago
+    SELECT id_pedido_creado INTO v_idped FROM confirmar_pedido(p_idusu, p_idres);
+    CALL registrar_pago(v_idped, p_metodo, v_total);
+
+    -- Ubicaciones del restaurante y del usuario
+    SELECT lat_restaurante, lng_restaurante, nomres
+    INTO v_lat_res, v_lng_res, v_nomres
+    FROM restaurantes WHERE idres = p_idres;
+
+    SELECT lat_usuario, lng_usuario
+    INTO v_lat_usu, v_lng_usu
+    FROM usuarios WHERE idusu = p_idusu;
+
+    -- Si el usuario no tiene ubicación, guardar la simulada
+    IF v_lat_usu IS NULL THEN
+        v_lat_usu := p_lat_simulada;
+        v_lng_usu := p_lng_simulada;
+        UPDATE usuarios SET lat_usuario = v_lat_usu, lng_usuario = v_lng_usu
+        WHERE idusu = p_idusu;
+    END IF;
+
+    -- Distancia Haversine en km
+    v_distancia := 2 * 6371 * ASIN(SQRT(
+        POWER(SIN(RADIANS(v_lat_usu - v_lat_res) / 2), 2) +
+        COS(RADIANS(v_lat_res)) * COS(RADIANS(v_lat_usu)) *
+        POWER(SIN(RADIANS(v_lng_usu - v_lng_res) / 2), 2)
+    ));
+
+    -- Restaurante sin ubicación: el pedido queda creado, sin tiempo estimado
+    IF v_distancia IS NULL THEN
+        RETURN QUERY SELECT v_idped, v_total, v_items, NULL::INT, NULL::TIMESTAMP,
+                            NULL::NUMERIC, v_nomres;
+        RETURN;
+    END IF;
+
+    -- Preparación + viaje con tráfico + buffer, redondeado a múltiplos de 5 (20-60 min)
+    v_minutos := TRUNC(
+        p_preparacion_base + (v_items - 1) * p_extra_por_producto
+        + (v_distancia / p_velocidad_kmh) * 60 * p_factor_trafico
+        + p_buffer_minutos
+    );
+    v_minutos := ROUND(v_minutos / 5.0) * 5;
+    v_minutos := GREATEST(20, LEAST(60, v_minutos));
+    v_hora := LOCALTIMESTAMP + MAKE_INTERVAL(mins => v_minutos);
+
+    UPDATE pedidos
+    SET tiempo_estimado_minutos = v_minutos, hora_estimada_entrega = v_hora
+    WHERE idped = v_idped;
+
+    RETURN QUERY SELECT v_idped, v_total, v_items, v_minutos, v_hora,
+                        ROUND(v_distancia, 2), v_nomres;
+END;
+$$;
+
 -- Procedimiento: actualizar_estado_pago
 CREATE OR REPLACE PROCEDURE actualizar_estado_pago(p_idpag INT, p_estado estado_pago)
 LANGUAGE plpgsql
@@ -453,10 +574,7 @@ BEGIN
             ultimo_intento = CURRENT_TIMESTAMP
         WHERE corusu = p_email;
     END IF;
-    
-    INSERT INTO log_intentos_acceso (email, ip_address, exito, user_agent, motivo_fallo)
-    VALUES (p_email, p_ip, FALSE, p_user_agent, 
-            CASE WHEN intentos_actuales >= max_intentos THEN 'CUENTA_BLOQUEADA' ELSE 'CREDENCIALES_INCORRECTAS' END);
+    -- El intento se registra en log_intentos_acceso desde la aplicación (en lotes)
 END;
 $$;
 
@@ -470,9 +588,7 @@ LANGUAGE plpgsql
 AS $$
 BEGIN
     CALL reset_intentos_fallidos(p_email);
-    
-    INSERT INTO log_intentos_acceso (email, ip_address, exito, user_agent, motivo_fallo)
-    VALUES (p_email, p_ip, TRUE, p_user_agent, 'LOGIN_EXITOSO');
+    -- El acceso se registra en log_intentos_acceso desde la aplicación (en lotes)
 END;
 $$;
 
@@ -506,6 +622,88 @@ BEGIN
 END;
 $$;
 
+-- Función: autenticar_usuario (bloqueo + datos mínimos del usuario en un solo viaje)
+-- La contraseña se verifica en la aplicación. Si no hay usuario activo el intento
+-- ya es fallido y se registra aquí mismo (intento_registrado = TRUE)
+CREATE OR REPLACE FUNCTION autenticar_usuario(
+    p_email VARCHAR(100),
+    p_ip VARCHAR(45),
+    p_user_agent TEXT
+)
+RETURNS TABLE(idusu INT, nomusu VARCHAR(100), rolusu rol_usuario, conusu VARCHAR(255),
+              bloqueada BOOLEAN, intentos INT, tiempo_restante INT, intento_registrado BOOLEAN)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_idusu INT;
+    v_nomusu VARCHAR(100);
+    v_rolusu rol_usuario;
+    v_conusu VARCHAR(255);
+    v_estusu estado_usuario;
+    v_intentos INT;
+    v_bloqueo_hasta TIMESTAMP;
+BEGIN
+    SELECT u.idusu, u.nomusu, u.rolusu, u.conusu, u.estusu, u.intentos_fallidos, u.bloqueado_hasta
+    INTO v_idusu, v_nomusu, v_rolusu, v_conusu, v_estusu, v_intentos, v_bloqueo_hasta
+    FROM usuarios u WHERE u.corusu = p_email;
+    
+    -- Cuenta bloqueada: no se entregan credenciales
+    IF v_bloqueo_hasta IS NOT NULL AND v_bloqueo_hasta > CURRENT_TIMESTAMP THEN
+        RETURN QUERY SELECT NULL::INT, NULL::VARCHAR(100), NULL::rol_usuario, NULL::VARCHAR(255),
+            TRUE, COALESCE(v_intentos, 0),
+            EXTRACT(EPOCH FROM (v_bloqueo_hasta - CURRENT_TIMESTAMP))::INT / 60, FALSE;
+        RETURN;
+    END IF;
+    
+    -- Bloqueo vencido: se limpia
+    IF v_bloqueo_hasta IS NOT NULL THEN
+        UPDATE usuarios 
+        SET intentos_fallidos = 0, bloqueado_hasta = NULL, ultimo_intento = NULL
+        WHERE corusu = p_email;
+        v_intentos := 0;
+    END IF;
+    
+    -- Correo inexistente o usuario inactivo
+    IF v_idusu IS NULL OR v_estusu <> 'activo' THEN
+        CALL incrementar_intentos_fallidos(p_email, p_ip, p_user_agent);
+        RETURN QUERY SELECT NULL::INT, NULL::VARCHAR(100), NULL::rol_usuario, NULL::VARCHAR(255),
+            b.bloqueada, b.intentos, b.tiempo_restante, TRUE
+        FROM verificar_bloqueo_cuenta(p_email) b;
+        RETURN;
+    END IF;
+    
+    RETURN QUERY SELECT v_idusu, v_nomusu, v_rolusu, v_conusu, FALSE, COALESCE(v_intentos, 0), 0, FALSE;
+END;
+$$;
+
+-- Función: registrar_resultado_login (resultado de la verificación de la contraseña)
+-- Registra el intento y devuelve el estado de bloqueo resultante.
+-- p_nuevo_hash: hash recalculado con los parámetros actuales (rehash al iniciar sesión)
+CREATE OR REPLACE FUNCTION registrar_resultado_login(
+    p_email VARCHAR(100),
+    p_ip VARCHAR(45),
+    p_user_agent TEXT,
+    p_exito BOOLEAN,
+    p_nuevo_hash VARCHAR(255) DEFAULT NULL
+)
+RETURNS TABLE(bloqueada BOOLEAN, intentos INT, tiempo_restante INT)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF p_exito THEN
+        CALL login_exitoso(p_email, p_ip, p_user_agent);
+        IF p_nuevo_hash IS NOT NULL THEN
+            UPDATE usuarios SET conusu = p_nuevo_hash WHERE corusu = p_email;
+        END IF;
+        RETURN QUERY SELECT FALSE, 0, 0;
+    ELSE
+        CALL incrementar_intentos_fallidos(p_email, p_ip, p_user_agent);
+        RETURN QUERY SELECT b.bloqueada, b.intentos, b.tiempo_restante
+        FROM verificar_bloqueo_cuenta(p_email) b;
+    END IF;
+END;
+$$;
+
 -- Procedimiento: crear_token_recuperacion
 CREATE OR REPLACE PROCEDURE crear_token_recuperacion(
     p_email VARCHAR(100),
@@ -594,6 +792,62 @@ BEGIN
 END;
 $$;
 
+-- Función: crear_particion_log (partición mensual de log_intentos_acceso)
+CREATE OR REPLACE FUNCTION crear_particion_log(p_mes DATE)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_desde DATE := date_trunc('month', p_mes)::DATE;
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF log_intentos_acceso FOR VALUES FROM (%L) TO (%L)',
+        'log_intentos_acceso_' || to_char(v_desde, 'YYYY_MM'),
+        v_desde, (v_desde + INTERVAL '1 month')::DATE
+    );
+END;
+$$;
+
+-- Función: mantener_particiones_log
+-- Crea las particiones del mes actual y de los próximos meses y elimina las
+-- que superan la retención. Idempotente; la aplicación la ejecuta periódicamente
+CREATE OR REPLACE FUNCTION mantener_particiones_log(
+    p_meses_adelante INT DEFAULT 2,
+    p_meses_retencion INT DEFAULT 6
+)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_mes_actual DATE := date_trunc('month', CURRENT_DATE)::DATE;
+    v_limite DATE := (v_mes_actual - make_interval(months => p_meses_retencion))::DATE;
+    v_particion RECORD;
+    v_eliminadas INT := 0;
+BEGIN
+    -- Un solo worker a la vez (DDL sobre la misma tabla)
+    PERFORM pg_advisory_xact_lock(hashtext('mantener_particiones_log'));
+    
+    FOR i IN 0..p_meses_adelante LOOP
+        PERFORM crear_particion_log((v_mes_actual + make_interval(months => i))::DATE);
+    END LOOP;
+    
+    FOR v_particion IN
+        SELECT c.relname
+        FROM pg_inherits h
+        JOIN pg_class c ON c.oid = h.inhrelid
+        WHERE h.inhparent = 'log_intentos_acceso'::regclass
+          AND c.relname ~ '^log_intentos_acceso_[0-9]{4}_[0-9]{2}$'
+    LOOP
+        IF to_date(right(v_particion.relname, 7), 'YYYY_MM') < v_limite THEN
+            EXECUTE format('DROP TABLE %I', v_particion.relname);
+            v_eliminadas := v_eliminadas + 1;
+        END IF;
+    END LOOP;
+    
+    RETURN v_eliminadas;
+END;
+$$;
+
 -- Procedimiento: limpiar_tokens_expirados
 CREATE OR REPLACE PROCEDURE limpiar_tokens_expirados()
 LANGUAGE plpgsql
@@ -763,6 +1017,12 @@ FROM
     JOIN usuarios cli ON p.idusu = cli.idusu
     JOIN restaurantes res ON p.idres = res.idres;
 
+-- =====================================================
+-- PARTICIONES INICIALES DEL LOG DE ACCESOS
+-- =====================================================
+
+SELECT mantener_particiones_log();
+
 -- =====================================================
 -- DATOS INICIALES (Categorías)
 -- =====================================================
@@ -0,0 +1,118 @@
+-- =====================================================
+-- 🛒 Checkout en una sola llamada (POST /cliente/checkout)
+-- procesar_checkout: crea el pedido, registra el pago y calcula el tiempo
+-- estimado de entrega en una sola transacción (antes confirmar_pedido +
+-- registrar_pago + consultas del cálculo desde la aplicación)
+-- Ejecutar una vez sobre la base existente:
+--   psql -d dbflash -f database/migracion_checkout.sql
+-- =====================================================
+
+-- Función: procesar_checkout
+-- Crea el pedido, registra el pago y calcula el tiempo estimado de entrega
+-- en una sola llamada (una sola transacción). Los parámetros de cálculo y los
+-- factores aleatorios vienen de DeliveryCalculator (Python).
+-- Si el carrito está vacío no crea nada y no retorna filas.
+-- Si el restaurante no tiene ubicación, tiempo, hora y distancia vuelven NULL.
+CREATE OR REPLACE FUNCTION procesar_checkout(
+    p_idusu INT,
+    p_idres INT,
+    p_metodo metodo_pago,
+    p_velocidad_kmh NUMERIC,
+    p_preparacion_base NUMERIC,
+    p_extra_por_producto NUMERIC,
+    p_factor_trafico NUMERIC,
+    p_buffer_minutos INT,
+    p_lat_simulada DECIMAL(10, 8),
+    p_lng_simulada DECIMAL(11, 8)
+)
+RETURNS TABLE(
+    id_pedido INT,
+    total DECIMAL(10, 2),
+    num_items INT,
+    tiempo_estimado INT,
+    hora_estimada TIMESTAMP,
+    distancia_km NUMERIC,
+    restaurante VARCHAR(100)
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_total DECIMAL(10, 2);
+    v_items INT;
+    v_idped INT;
+    v_lat_res DECIMAL(10, 8);
+    v_lng_res DECIMAL(11, 8);
+    v_nomres VARCHAR(100);
+    v_lat_usu DECIMAL(10, 8);
+    v_lng_usu DECIMAL(11, 8);
+    v_distancia NUMERIC;
+    v_minutos INT;
+    v_hora TIMESTAMP;
+BEGIN
+    -- Bloquear el carrito para evitar pedidos duplicados por doble envío
+    PERFORM 1 FROM carritos WHERE idusu = p_idusu FOR UPDATE;
+
+    -- Total del carrito (antes de vaciarlo)
+    SELECT COALESCE(SUM(c.canprocar * p.prepro), 0), COUNT(*)
+    INTO v_total, v_items
+    FROM carritos c
+    JOIN productos p ON c.idpro = p.idpro
+    WHERE c.idusu = p_idusu;
+
+    IF v_items = 0 OR v_total <= 0 THEN
+        RETURN;
+    END IF;
+
+    -- Crear pedido (pasa el carrito al detalle y lo vacía) y registrar pago
+    SELECT id_pedido_creado INTO v_idped FROM confirmar_pedido(p_idusu, p_idres);
+    CALL registrar_pago(v_idped, p_metodo, v_total);
+
+    -- Ubicaciones del restaurante y del usuario
+    SELECT lat_restaurante, lng_restaurante, nomres
+    INTO v_lat_res, v_lng_res, v_nomres
+    FROM restaurantes WHERE idres = p_idres;
+
+    SELECT lat_usuario, lng_usuario
+    INTO v_lat_usu, v_lng_usu
+    FROM usuarios WHERE idusu = p_idusu;
+
+    -- Si el usuario no tiene ubicación, guardar la simulada
+    IF v_lat_usu IS NULL THEN
+        v_lat_usu := p_lat_simulada;
+        v_lng_usu := p_lng_simulada;
+        UPDATE usuarios SET lat_usuario = v_lat_usu, lng_usuario = v_lng_usu
+        WHERE idusu = p_idusu;
+    END IF;
+
+    -- Distancia Haversine en km
+    v_distancia := 2 * 6371 * ASIN(SQRT(
+        POWER(SIN(RADIANS(v_lat_usu - v_lat_res) / 2), 2) +
+        COS(RADIANS(v_lat_res)) * COS(RADIANS(v_lat_usu)) *
+        POWER(SIN(RADIANS(v_lng_usu - v_lng_res) / 2), 2)
+    ));
+
+    -- Restaurante sin ubicación: el pedido queda creado, sin tiempo estimado
+    IF v_distancia IS NULL THEN
+        RETURN QUERY SELECT v_idped, v_total, v_items, NULL::INT, NULL::TIMESTAMP,
+                            NULL::NUMERIC, v_nomres;
+        RETURN;
+    END IF;
+
+    -- Preparación + viaje con tráfico + buffer, redondeado a múltiplos de 5 (20-60 min)
+    v_minutos := TRUNC(
+        p_preparacion_base + (v_items - 1) * p_extra_por_producto
+        + (v_distancia / p_velocidad_kmh) * 60 * p_factor_trafico
+        + p_buffer_minutos
+    );
+    v_minutos := ROUND(v_minutos / 5.0) * 5;
+    v_minutos := GREATEST(20, LEAST(60, v_minutos));
+    v_hora := LOCALTIMESTAMP + MAKE_INTERVAL(mins => v_minutos);
+
+    UPDATE pedidos
+    SET tiempo_estimado_minutos = v_minutos, hora_estimada_entrega = v_hora
+    WHERE idped = v_idped;
+
+    RETURN QUERY SELECT v_idped, v_total, v_items, v_minutos, v_hora,
+                        ROUND(v_distancia, 2), v_nomres;
+END;
+$$;
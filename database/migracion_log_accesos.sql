@@ -0,0 +1,154 @@
+-- =====================================================
+-- 📝 Log de intentos de acceso particionado y escrito en lotes
+-- log_intentos_acceso pasa a estar particionada por mes (fecha_intento):
+-- las particiones nuevas y la retención las maneja mantener_particiones_log(),
+-- que la aplicación ejecuta periódicamente (utils/access_log.py).
+-- Los procedimientos de login ya no insertan en el log: la aplicación lo
+-- escribe en lotes fuera de la transacción del login.
+-- Se conservan las filas dentro de la retención (6 meses por defecto).
+-- Ejecutar una vez sobre la base existente:
+--   psql -d dbflash -f database/migracion_log_accesos.sql
+-- =====================================================
+
+BEGIN;
+
+-- Tabla anterior (sin particionar) a un lado
+ALTER TABLE log_intentos_acceso RENAME TO log_intentos_acceso_anterior;
+ALTER SEQUENCE log_intentos_acceso_id_seq RENAME TO log_intentos_acceso_anterior_id_seq;
+ALTER INDEX idx_log_email_fecha RENAME TO idx_log_email_fecha_anterior;
+
+CREATE TABLE log_intentos_acceso (
+    id SERIAL,
+    email VARCHAR(100) NOT NULL,
+    ip_address VARCHAR(45) DEFAULT NULL,
+    exito BOOLEAN DEFAULT FALSE,
+    fecha_intento TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    user_agent TEXT DEFAULT NULL,
+    motivo_fallo VARCHAR(100) DEFAULT NULL,
+    PRIMARY KEY (id, fecha_intento)
+) PARTITION BY RANGE (fecha_intento);
+
+CREATE INDEX idx_log_email_fecha ON log_intentos_acceso (email, fecha_intento);
+
+-- Función: crear_particion_log (partición mensual de log_intentos_acceso)
+CREATE OR REPLACE FUNCTION crear_particion_log(p_mes DATE)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_desde DATE := date_trunc('month', p_mes)::DATE;
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF log_intentos_acceso FOR VALUES FROM (%L) TO (%L)',
+        'log_intentos_acceso_' || to_char(v_desde, 'YYYY_MM'),
+        v_desde, (v_desde + INTERVAL '1 month')::DATE
+    );
+END;
+$$;
+
+-- Función: mantener_particiones_log
+-- Crea las particiones del mes actual y de los próximos meses y elimina las
+-- que superan la retención. Idempotente; la aplicación la ejecuta periódicamente
+CREATE OR REPLACE FUNCTION mantener_particiones_log(
+    p_meses_adelante INT DEFAULT 2,
+    p_meses_retencion INT DEFAULT 6
+)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_mes_actual DATE := date_trunc('month', CURRENT_DATE)::DATE;
+    v_limite DATE := (v_mes_actual - make_interval(months => p_meses_retencion))::DATE;
+    v_particion RECORD;
+    v_eliminadas INT := 0;
+BEGIN
+    -- Un solo worker a la vez (DDL sobre la misma tabla)
+    PERFORM pg_advisory_xact_lock(hashtext('mantener_particiones_log'));
+    
+    FOR i IN 0..p_meses_adelante LOOP
+        PERFORM crear_particion_log((v_mes_actual + make_interval(months => i))::DATE);
+    END LOOP;
+    
+    FOR v_particion IN
+        SELECT c.relname
+        FROM pg_inherits h
+        JOIN pg_class c ON c.oid = h.inhrelid
+        WHERE h.inhparent = 'log_intentos_acceso'::regclass
+          AND c.relname ~ '^log_intentos_acceso_[0-9]{4}_[0-9]{2}$'
+    LOOP
+        IF to_date(right(v_particion.relname, 7), 'YYYY_MM') < v_limite THEN
+            EXECUTE format('DROP TABLE %I', v_particion.relname);
+            v_eliminadas := v_eliminadas + 1;
+        END IF;
+    END LOOP;
+    
+    RETURN v_eliminadas;
+END;
+$$;
+
+-- Particiones de los meses retenidos, del actual y de los próximos
+SELECT crear_particion_log(m::DATE)
+FROM generate_series(date_trunc('month', CURRENT_DATE) - INTERVAL '6 months',
+                     date_trunc('month', CURRENT_DATE), INTERVAL '1 month') m;
+SELECT mantener_particiones_log(2, 6);
+
+-- Copiar el historial retenido conservando los ids
+INSERT INTO log_intentos_acceso (id, email, ip_address, exito, fecha_intento, user_agent, motivo_fallo)
+SELECT id, email, ip_address, exito, fecha_intento, user_agent, motivo_fallo
+FROM log_intentos_acceso_anterior
+WHERE fecha_intento >= date_trunc('month', CURRENT_DATE) - INTERVAL '6 months';
+
+SELECT setval('log_intentos_acceso_id_seq',
+              GREATEST((SELECT COALESCE(MAX(id), 0) FROM log_intentos_acceso_anterior), 1));
+
+DROP TABLE log_intentos_acceso_anterior;
+
+-- Procedimiento: incrementar_intentos_fallidos
+CREATE OR REPLACE PROCEDURE incrementar_intentos_fallidos(
+    p_email VARCHAR(100),
+    p_ip VARCHAR(45),
+    p_user_agent TEXT
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    intentos_actuales INT DEFAULT 0;
+    max_intentos INT DEFAULT 5;
+    tiempo_bloqueo INT DEFAULT 15;
+BEGIN
+    SELECT intentos_fallidos INTO intentos_actuales 
+    FROM usuarios WHERE corusu = p_email;
+    
+    intentos_actuales := COALESCE(intentos_actuales, 0) + 1;
+    
+    IF intentos_actuales >= max_intentos THEN
+        UPDATE usuarios 
+        SET intentos_fallidos = intentos_actuales,
+            bloqueado_hasta = CURRENT_TIMESTAMP + (tiempo_bloqueo || ' minutes')::INTERVAL,
+            ultimo_intento = CURRENT_TIMESTAMP
+        WHERE corusu = p_email;
+    ELSE
+        UPDATE usuarios 
+        SET intentos_fallidos = intentos_actuales,
+            ultimo_intento = CURRENT_TIMESTAMP
+        WHERE corusu = p_email;
+    END IF;
+    -- El intento se registra en log_intentos_acceso desde la aplicación (en lotes)
+END;
+$$;
+
+-- Procedimiento: login_exitoso
+CREATE OR REPLACE PROCEDURE login_exitoso(
+    p_email VARCHAR(100),
+    p_ip VARCHAR(45),
+    p_user_agent TEXT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    CALL reset_intentos_fallidos(p_email);
+    -- El acceso se registra en log_intentos_acceso desde la aplicación (en lotes)
+END;
+$$;
+
+COMMIT;
@@ -0,0 +1,95 @@
+-- =====================================================
+-- 🔐 Login en menos viajes a la base de datos
+-- autenticar_usuario: estado de bloqueo + datos mínimos del usuario en una
+-- sola llamada (antes verificar_bloqueo_cuenta + SELECT * FROM usuarios)
+-- registrar_resultado_login: registra el intento y devuelve el nuevo estado
+-- (antes login_exitoso, o incrementar_intentos_fallidos + verificar_bloqueo_cuenta)
+-- y guarda el hash recalculado si cambió PASSWORD_HASH_METHOD
+-- Ejecutar una vez sobre la base existente:
+--   psql -d dbflash -f database/migracion_login.sql
+-- =====================================================
+
+-- Función: autenticar_usuario (bloqueo + datos mínimos del usuario en un solo viaje)
+-- La contraseña se verifica en la aplicación. Si no hay usuario activo el intento
+-- ya es fallido y se registra aquí mismo (intento_registrado = TRUE)
+CREATE OR REPLACE FUNCTION autenticar_usuario(
+    p_email VARCHAR(100),
+    p_ip VARCHAR(45),
+    p_user_agent TEXT
+)
+RETURNS TABLE(idusu INT, nomusu VARCHAR(100), rolusu rol_usuario, conusu VARCHAR(255),
+              bloqueada BOOLEAN, intentos INT, tiempo_restante INT, intento_registrado BOOLEAN)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_idusu INT;
+    v_nomusu VARCHAR(100);
+    v_rolusu rol_usuario;
+    v_conusu VARCHAR(255);
+    v_estusu estado_usuario;
+    v_intentos INT;
+    v_bloqueo_hasta TIMESTAMP;
+BEGIN
+    SELECT u.idusu, u.nomusu, u.rolusu, u.conusu, u.estusu, u.intentos_fallidos, u.bloqueado_hasta
+    INTO v_idusu, v_nomusu, v_rolusu, v_conusu, v_estusu, v_intentos, v_bloqueo_hasta
+    FROM usuarios u WHERE u.corusu = p_email;
+    
+    -- Cuenta bloqueada: no se entregan credenciales
+    IF v_bloqueo_hasta IS NOT NULL AND v_bloqueo_hasta > CURRENT_TIMESTAMP THEN
+        RETURN QUERY SELECT NULL::INT, NULL::VARCHAR(100), NULL::rol_usuario, NULL::VARCHAR(255),
+            TRUE, COALESCE(v_intentos, 0),
+            EXTRACT(EPOCH FROM (v_bloqueo_hasta - CURRENT_TIMESTAMP))::INT / 60, FALSE;
+        RETURN;
+    END IF;
+    
+    -- Bloqueo vencido: se limpia
+    IF v_bloqueo_hasta IS NOT NULL THEN
+        UPDATE usuarios 
+        SET intentos_fallidos = 0, bloqueado_hasta = NULL, ultimo_intento = NULL
+        WHERE corusu = p_email;
+        v_intentos := 0;
+    END IF;
+    
+    -- Correo inexistente o usuario inactivo
+    IF v_idusu IS NULL OR v_estusu <> 'activo' THEN
+        CALL incrementar_intentos_fallidos(p_email, p_ip, p_user_agent);
+        RETURN QUERY SELECT NULL::INT, NULL::VARCHAR(100), NULL::rol_usuario, NULL::VARCHAR(255),
+            b.bloqueada, b.intentos, b.tiempo_restante, TRUE
+        FROM verificar_bloqueo_cuenta(p_email) b;
+        RETURN;
+    END IF;
+    
+    RETURN QUERY SELECT v_idusu, v_nomusu, v_rolusu, v_conusu, FALSE, COALESCE(v_intentos, 0), 0, FALSE;
+END;
+$$;
+
+-- Versión anterior sin p_nuevo_hash
+DROP FUNCTION IF EXISTS registrar_resultado_login(VARCHAR, VARCHAR, TEXT, BOOLEAN);
+
+-- Función: registrar_resultado_login (resultado de la verificación de la contraseña)
+-- Registra el intento y devuelve el estado de bloqueo resultante.
+-- p_nuevo_hash: hash recalculado con los parámetros actuales (rehash al iniciar sesión)
+CREATE OR REPLACE FUNCTION registrar_resultado_login(
+    p_email VARCHAR(100),
+    p_ip VARCHAR(45),
+    p_user_agent TEXT,
+    p_exito BOOLEAN,
+    p_nuevo_hash VARCHAR(255) DEFAULT NULL
+)
+RETURNS TABLE(bloqueada BOOLEAN, intentos INT, tiempo_restante INT)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF p_exito THEN
+        CALL login_exitoso(p_email, p_ip, p_user_agent);
+        IF p_nuevo_hash IS NOT NULL THEN
+            UPDATE usuarios SET conusu = p_nuevo_hash WHERE corusu = p_email;
+        END IF;
+        RETURN QUERY SELECT FALSE, 0, 0;
+    ELSE
+        CALL incrementar_intentos_fallidos(p_email, p_ip, p_user_agent);
+        RETURN QUERY SELECT b.bloqueada, b.intentos, b.tiempo_restante
+        FROM verificar_bloqueo_cuenta(p_email) b;
+    END IF;
+END;
+$$;
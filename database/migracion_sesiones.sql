@@ -0,0 +1,16 @@
+-- =====================================================
+-- 🍪 Sesiones en PostgreSQL (SESSION_BACKEND=postgres)
+-- Tabla UNLOGGED: las sesiones son efímeras; se evita escribir WAL en cada
+-- login o renovación (tras una caída del servidor los usuarios vuelven a iniciar sesión)
+-- Ejecutar una vez sobre la base existente:
+--   psql -d dbflash -f database/migracion_sesiones.sql
+-- =====================================================
+
+CREATE UNLOGGED TABLE IF NOT EXISTS sesiones (
+    sid VARCHAR(64) PRIMARY KEY,
+    datos TEXT NOT NULL,
+    expira TIMESTAMPTZ NOT NULL
+);
+
+-- La purga de sesiones vencidas usa este índice
+CREATE INDEX IF NOT EXISTS idx_sesiones_expira ON sesiones (expira);
@@ -1,5 +1,17 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, session, jsonify
 from utils.auth_helpers import login_required, role_required
+from utils.prepared_statements import prepared_statements
+from utils.query_stats import query_stats
+from utils.db_helpers import read_only_route
+from utils.records import record_row, Usuario
+from utils.menu_cache import menu_cache
+from utils.cache import cache
+from utils.category_cache import category_cache
+from utils.identity import identity
+from utils.single_flight import single_flight
+from utils.password_hashing import password_hasher
+from utils.rate_limiter import login_limiter
+from utils.access_log import access_log
 
 admin_bp = Blueprint("admin", __name__)
 
@@ -10,10 +22,11 @@ def test():
 
 @admin_bp.route("/users", methods=["GET"])
 @role_required("administrador")
+@read_only_route
 def list_users():
     db = current_app.get_db()
 
-    cursor = db.cursor()
+    cursor = db.cursor(row_factory=record_row(Usuario))
     cursor.execute("SELECT idusu, nomusu, corusu, dirusu, rolusu, estusu FROM usuarios")
     users = cursor.fetchall()
     return render_template("admin/dashboard.html", users=users)
@@ -36,6 +49,10 @@ def update_user(user_id):
             (nomusu, dirusu, rolusu, user_id),
         )
         db.commit()
+        # Un cambio de rol a restaurante crea su restaurante (trigger): aparece en el menú
+        menu_cache.invalidate_index()
+        # Con otro rol cambia su restaurante / repartidor asociado
+        identity.invalidate(user_id)
         flash("Usuario actualizado correctamente", "success")
     except Exception as e:
         db.rollback()
@@ -88,12 +105,9 @@ def toggle_user_status(user_id):
 
 @admin_bp.route("/categories", methods=["GET"])
 @role_required("administrador")
+@read_only_route
 def list_categories():
-    db = current_app.get_db()
-
-    cursor = db.cursor()
-    cursor.execute("SELECT idcat, tipcat FROM categorias")
-    categories = cursor.fetchall()
+    categories = category_cache.get_all()
     return render_template("admin/categories.html", categories=categories)
 
 @admin_bp.route("/categories", methods=["POST"])
@@ -108,6 +122,7 @@ def add_category():
     try:
         cursor.execute("INSERT INTO categorias (tipcat) VALUES (%s)", (tipcat,))
         db.commit()
+        category_cache.invalidate()
         flash("Categoría agregada correctamente", "success")
     except Exception as e:
         db.rollback()
@@ -146,6 +161,7 @@ def delete_category(id):
         # Eliminar la categoría
         cursor.execute("DELETE FROM categorias WHERE idcat = %s", (id,))
         db.commit()
+        category_cache.invalidate()
         flash(f'Categoría "{category_name}" eliminada correctamente', "success")
         
     except Exception as e:
@@ -159,3 +175,21 @@ def delete_category(id):
     
     return redirect(url_for("admin.list_categories"))
 
+
+@admin_bp.route("/db-stats", methods=["GET"])
+@role_required("administrador")
+def db_stats():
+    """Estadísticas de base de datos del worker actual (pool, sentencias preparadas y consultas)"""
+    top = request.args.get('top', 20, type=int)
+    return jsonify({
+        'pool': current_app.db_pool.stats(),
+        'sentencias_preparadas': prepared_statements.stats(),
+        'menu_cache': menu_cache.stats(),
+        'cache': cache.stats(),
+        'single_flight': single_flight.stats(),
+        'sesiones': current_app.session_store.stats(),
+        'hash_contrasenas': password_hasher.stats(),
+        'limite_login': login_limiter.stats(),
+        'log_accesos': access_log.stats(),
+        **query_stats.snapshot(top=top)
+    })
@@ -1,12 +1,15 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, make_response
 from utils.auth_helpers import login_required
-from werkzeug.security import check_password_hash, generate_password_hash
 from utils.auth_helpers import login_required
 from utils.password_recovery import recovery_manager
 from utils.validation_decorators import validate_form, require_fields
 from utils.input_validator import input_validator
-from utils.session_manager import session_manager, require_active_session
-from utils.db_helpers import execute_query_one, execute_procedure, safe_db_operation
+from utils.session_manager import session_manager, require_active_session, session_exempt
+from utils.db_helpers import safe_db_operation
+from utils.menu_cache import menu_cache
+from utils.password_hashing import password_hasher, PasswordHashingBusy
+from utils.rate_limiter import login_limiter
+from utils.access_log import access_log
 from datetime import datetime
 import re
 
@@ -27,12 +30,31 @@ def obtener_user_agent():
 
 
 @safe_db_operation
-def verificar_cuenta_bloqueada(db, email):
-    """Verificar si una cuenta está bloqueada"""
+def autenticar_usuario(db, email, ip, user_agent):
+    """
+    Estado de bloqueo y datos mínimos del usuario en un solo viaje a la BD.
+    Si no hay usuario activo con ese correo el intento fallido ya queda
+    registrado (intento_registrado = True) y no hace falta otra llamada.
+    """
+    cursor = db.cursor()
+    try:
+        # PostgreSQL: función que retorna tabla
+        cursor.execute("SELECT * FROM autenticar_usuario(%s, %s, %s)", (email, ip, user_agent))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+@safe_db_operation
+def registrar_resultado_login(db, email, ip, user_agent, exito, nuevo_hash=None):
+    """
+    Registrar el resultado del login y devolver el estado de bloqueo resultante.
+    nuevo_hash: hash recalculado con los parámetros actuales (se guarda en la misma llamada)
+    """
     try:
         cursor = db.cursor()
-        # PostgreSQL: usar función que retorna tabla
-        cursor.execute("SELECT * FROM verificar_bloqueo_cuenta(%s)", (email,))
+        cursor.execute("SELECT * FROM registrar_resultado_login(%s, %s, %s, %s, %s)",
+                       (email, ip, user_agent, exito, nuevo_hash))
         resultado = cursor.fetchone()
         cursor.close()
         
@@ -44,35 +66,33 @@ def verificar_cuenta_bloqueada(db, email):
             }
         return {'bloqueada': False, 'intentos': 0, 'tiempo_restante': 0}
     except Exception as e:
-        print(f"❌ Error verificando bloqueo: {e}")
+        print(f"❌ Error registrando resultado de login: {e}")
         return {'bloqueada': False, 'intentos': 0, 'tiempo_restante': 0}
 
 
 @safe_db_operation
-def registrar_intento_fallido(db, email, ip, user_agent):
-    """Registrar un intento de login fallido"""
-    try:
-        cursor = db.cursor()
-        # PostgreSQL: usar CALL para procedimientos
-        cursor.execute("CALL incrementar_intentos_fallidos(%s, %s, %s)", (email, ip, user_agent))
-        cursor.close()
-    except Exception as e:
-        print(f"❌ Error registrando intento fallido: {e}")
-
-
-@safe_db_operation
-def registrar_login_exitoso(db, email, ip, user_agent):
-    """Registrar un login exitoso y resetear intentos"""
+def crear_usuario(db, nombre, email, hashed_password, direccion, rol):
+    """
+    Insertar el usuario y devolver su idusu en un solo viaje a la BD.
+    Devuelve None si el correo ya está registrado: el conflicto en corusu lo
+    resuelve el propio INSERT (sin carrera entre la verificación y el alta).
+    """
+    cursor = db.cursor()
     try:
-        cursor = db.cursor()
-        # PostgreSQL: usar CALL para procedimientos
-        cursor.execute("CALL login_exitoso(%s, %s, %s)", (email, ip, user_agent))
+        cursor.execute("""
+            INSERT INTO usuarios (nomusu, corusu, conusu, dirusu, rolusu)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (corusu) DO NOTHING
+            RETURNING idusu
+        """, (nombre, email, hashed_password, direccion, rol))
+        nuevo_usuario = cursor.fetchone()
+        return nuevo_usuario["idusu"] if nuevo_usuario else None
+    finally:
         cursor.close()
-    except Exception as e:
-        print(f"❌ Error registrando login exitoso: {e}")
 
 
 @auth_bp.route("/register", methods=["GET", "POST"])
+@session_exempt
 def register():
     if request.method == "POST":
         # Obtener y validar datos manualmente para mayor control
@@ -109,38 +129,30 @@ def register():
                 flash(f"❌ {error}", "error")
             return render_template("auth/register.html")
 
-        # Verificar si el email ya existe
-        db = current_app.get_db()
-        cursor = db.cursor()
-        cursor.execute("SELECT idusu FROM usuarios WHERE corusu = %s", (email,))
-        existing_user = cursor.fetchone()
-        
-        if existing_user:
-            flash("❌ Este email ya está registrado", "error")
-            cursor.close()
-            return render_template("auth/register.html")
-
         try:
-            hashed_password = generate_password_hash(password)
+            hashed_password = password_hasher.hash(password)
+        except PasswordHashingBusy as e:
+            flash(f"⏳ {e}", "warning")
+            return render_template("auth/register.html"), 503
 
-            # 👉 Registrar usuario con CALL (PostgreSQL)
-            db = current_app.get_db()
-            cursor = db.cursor()
-            cursor.execute("CALL registrar_usuario(%s, %s, %s, %s, %s)", (nombre, email, hashed_password, direccion, rol))
-
-            # ✅ Obtener el id del usuario recién creado
-            cursor.execute("SELECT idusu FROM usuarios WHERE corusu = %s", (email,))
-            nuevo_usuario = cursor.fetchone()
-            idusu = nuevo_usuario["idusu"]
+        try:
+            # 👉 Alta del usuario: un solo INSERT que devuelve el id o detecta el email repetido
+            idusu = crear_usuario(nombre, email, hashed_password, direccion, rol)
+            if idusu is None:
+                flash("❌ Este email ya está registrado", "error")
+                return render_template("auth/register.html")
 
             # 👉 Si es restaurante, creamos su registro en la tabla restaurantes
             if rol == "restaurante":
+                db = current_app.get_db()
+                cursor = db.cursor()
                 cursor.execute(
                     "INSERT INTO restaurantes (idusu, nomres, desres, dirres, telres) VALUES (%s, %s, %s, %s, %s)",
                     (idusu, nombre, "Mi restaurante", direccion, "0000000000")
                 )
-
-            cursor.close()
+                cursor.close()
+                # Nuevo restaurante activo: aparece en el menú
+                menu_cache.invalidate_index()
 
             flash("✅ Usuario registrado exitosamente 🚀", "success")
             return redirect(url_for("auth.login"))
@@ -154,11 +166,21 @@ def register():
 
 
 @auth_bp.route("/login", methods=["GET", "POST"])
+@session_exempt
 def login():
     if request.method == "POST":
         # Obtener datos sin validación estricta para usuarios existentes
         email = request.form.get("email", "").strip()
         password = request.form.get("password", "")
+        ip_cliente = obtener_ip_cliente()
+        
+        # 0. Límite de intentos por IP y email (memoria compartida, antes de la BD y del hash)
+        espera = login_limiter.check(ip_cliente, email)
+        if espera:
+            flash(f"🚫 Demasiados intentos de inicio de sesión. Intenta de nuevo en {espera} segundos.", "danger")
+            response = make_response(render_template("auth/login.html"), 429)
+            response.headers['Retry-After'] = str(espera)
+            return response
         
         # Validación básica flexible para usuarios existentes
         email_valid, email_error = input_validator.validate_email_flexible(email)
@@ -171,26 +193,34 @@ def login():
         if not password_valid:
             flash(f"❌ {password_error}", "error")
             return render_template("auth/login.html")
-        ip_cliente = obtener_ip_cliente()
         user_agent = obtener_user_agent()
 
-        # 1. Verificar si la cuenta está bloqueada
-        estado_bloqueo = verificar_cuenta_bloqueada(email)
+        # 1. Estado de bloqueo y datos del usuario en una sola llamada
+        user = autenticar_usuario(email, ip_cliente, user_agent)
         
-        if estado_bloqueo['bloqueada']:
+        if user['bloqueada'] and not user['intento_registrado']:
             flash(f"🚫 Cuenta bloqueada por múltiples intentos fallidos. "
-                  f"Tiempo restante: {estado_bloqueo['tiempo_restante']} minutos", "danger")
+                  f"Tiempo restante: {user['tiempo_restante']} minutos", "danger")
             return render_template("auth/login.html", 
                                    cuenta_bloqueada=True, 
-                                   tiempo_restante=estado_bloqueo['tiempo_restante'])
-
-        # 2. Verificar credenciales usando función segura
-        user = execute_query_one("SELECT * FROM usuarios WHERE corusu=%s AND estusu='activo'", (email,))
-
-        if user and check_password_hash(user["conusu"], password):
+                                   tiempo_restante=user['tiempo_restante'])
+
+        # 2. Verificar la contraseña en la aplicación (pool de hash con admisión limitada)
+        valida, nuevo_hash = False, None
+        if user['idusu'] is not None:
+            try:
+                valida, nuevo_hash = password_hasher.verify_and_update(user["conusu"], password)
+            except PasswordHashingBusy as e:
+                # Sin capacidad: no cuenta como intento fallido
+                flash(f"⏳ {e}", "warning")
+                return render_template("auth/login.html"), 503
+
+        if valida:
             # ✅ LOGIN EXITOSO
-            # Registrar login exitoso y resetear intentos
-            registrar_login_exitoso(email, ip_cliente, user_agent)
+            # Resetear intentos y actualizar el hash si cambió el método (sin nada que cambiar no hay escritura)
+            if user['intentos'] or nuevo_hash:
+                registrar_resultado_login(email, ip_cliente, user_agent, True, nuevo_hash)
+            access_log.record(email, ip_cliente, True, user_agent, 'LOGIN_EXITOSO')
             
             # 🕐 Iniciar sesión con timeout usando el nuevo sistema
             remember_me = request.form.get('remember_me', False)
@@ -210,11 +240,13 @@ def login():
             return redirect(url_for("auth.role_dashboard"))
         else:
             # ❌ LOGIN FALLIDO
-            # Registrar intento fallido
-            registrar_intento_fallido(email, ip_cliente, user_agent)
-            
-            # Verificar nuevo estado después del intento fallido
-            nuevo_estado = verificar_cuenta_bloqueada(email)
+            # Registrar intento fallido y obtener el nuevo estado (si no se registró ya)
+            if user['intento_registrado']:
+                nuevo_estado = user
+            else:
+                nuevo_estado = registrar_resultado_login(email, ip_cliente, user_agent, False)
+            access_log.record(email, ip_cliente, False, user_agent,
+                              'CUENTA_BLOQUEADA' if nuevo_estado['bloqueada'] else 'CREDENCIALES_INCORRECTAS')
             
             if nuevo_estado['bloqueada']:
                 flash(f"🚫 Demasiados intentos fallidos. Cuenta bloqueada por 15 minutos.", "danger")
@@ -243,6 +275,7 @@ def role_dashboard():
 
 
 @auth_bp.route("/logout")
+@session_exempt
 def logout():
     # 🕐 Terminar sesión usando el nuevo sistema
     session_manager.end_session('manual')
@@ -251,6 +284,7 @@ def logout():
 
 
 @auth_bp.route("/forgot-password", methods=["GET", "POST"])
+@session_exempt
 @validate_form({
     'email': 'email'
 })
@@ -281,6 +315,7 @@ def forgot_password():
 
 
 @auth_bp.route("/reset-password/<token>", methods=["GET", "POST"])
+@session_exempt
 @validate_form({
     'password': 'password'
 })
@@ -308,7 +343,14 @@ def reset_password(token):
                                  time_remaining=validation['time_remaining'])
         
         # Encriptar nueva contraseña
-        password_hash = generate_password_hash(new_password)
+        try:
+            password_hash = password_hasher.hash(new_password)
+        except PasswordHashingBusy as e:
+            flash(f"⏳ {e}", "warning")
+            return render_template("auth/reset_password.html", 
+                                 token=token, 
+                                 email=validation['email'],
+                                 time_remaining=validation['time_remaining']), 503
         
         # Cambiar contraseña
         result = recovery_manager.change_password_with_token(token, password_hash)
@@ -3,7 +3,13 @@ from utils.auth_helpers import login_required, role_required
 from utils.delivery_calculator import DeliveryCalculator
 from utils.validation_decorators import validate_form, require_fields
 from utils.input_validator import input_validator
+from utils.db_helpers import execute_prepared, execute_prepared_one, read_only_route
+from utils.records import record_row, PedidoCliente
+from utils.menu_cache import menu_cache
+from utils.conditional_get import conditional_get, bump_stamp, set_validators
+from utils.cache import cache
 from datetime import datetime
+import time
 
 cliente_bp = Blueprint("cliente", __name__)
 
@@ -22,51 +28,18 @@ def test():
 #     cursor.execute("SELECT idpro, nompro, despro, prepro FROM productos")
 #     productos = cursor.fetchall()
 #     return render_template("cliente/menu.html", productos=productos)
+def _validador_menu():
+    """ETag del menú: sello de invalidaciones de menu_cache"""
+    return {'etag': menu_cache.version()}
+
 @cliente_bp.route("/menu", methods=["GET"])
 @login_required
 @role_required("cliente")
+@read_only_route
+@conditional_get(_validador_menu)
 def menu():
-    db = current_app.get_db()
-
-    cursor = db.cursor()
-    
-    # Obtener restaurantes con sus productos y categorías
-    cursor.execute("""
-        SELECT r.idres, r.nomres, p.idpro, p.nompro, p.despro, p.prepro, c.tipcat
-        FROM restaurantes r
-        LEFT JOIN productos p ON r.idres = p.idres
-        LEFT JOIN categorias c ON p.idcat = c.idcat
-        WHERE r.estres = 'activo'
-        ORDER BY r.nomres, p.nompro
-    """)
-    data = cursor.fetchall()
-    
-    # Agrupar productos por restaurante y determinar categorías
-    restaurantes = {}
-    for row in data:
-        idres = row['idres']
-        if idres not in restaurantes:
-            restaurantes[idres] = {
-                'nombre': row['nomres'],
-                'productos': [],
-                'categorias': set()
-            }
-        if row['idpro']:  # Si el restaurante tiene productos
-            restaurantes[idres]['productos'].append({
-                'idpro': row['idpro'],
-                'nompro': row['nompro'],
-                'despro': row['despro'],
-                'prepro': row['prepro']
-            })
-            # Agregar categoría al conjunto
-            if row['tipcat']:
-                restaurantes[idres]['categorias'].add(row['tipcat'])
-    
-    # Convertir sets a listas para el template
-    for idres in restaurantes:
-        restaurantes[idres]['categorias'] = list(restaurantes[idres]['categorias'])
-    
-    # Pasar la variable `restaurantes` a la plantilla
+    # Menú agrupado por restaurante desde la caché (solo consulta lo invalidado)
+    restaurantes = menu_cache.get_menu()
     return render_template("cliente/menu.html", restaurantes=restaurantes)
 
 # Carrito de Compras
@@ -76,16 +49,7 @@ def menu():
 def mostrar_carrito():
     """Muestra los productos en el carrito del cliente."""
     user_id = session.get("usuario_id")
-    db = current_app.get_db()
-
-    cursor = db.cursor()
-    cursor.execute("""
-        SELECT c.idpro, p.nompro, p.prepro, c.canprocar
-        FROM carritos c
-        JOIN productos p ON c.idpro = p.idpro
-        WHERE c.idusu = %s
-    """, (user_id,))
-    carrito = cursor.fetchall()
+    carrito = execute_prepared('cliente_carrito', (user_id,))
     return render_template("cliente/carrito.html", carrito=carrito)
 
 @cliente_bp.route("/carrito/agregar", methods=["POST"])
@@ -288,6 +252,36 @@ def perfil():
     usuario = cursor.fetchone()
     return render_template("cliente/perfil.html", usuario=usuario)
 
+def procesar_checkout(user_id, restaurante_id, metodo_pago):
+    """
+    Crear el pedido, registrar el pago y calcular el tiempo estimado de entrega
+    con una sola llamada a la función SQL procesar_checkout (una transacción).
+    Sin reintentos automáticos: es una escritura y no debe duplicarse.
+    
+    Returns:
+        dict: id_pedido, total, num_items, tiempo_estimado, hora_estimada,
+              distancia_km, restaurante (None si el carrito está vacío)
+    """
+    parametros = DeliveryCalculator.parametros_checkout()
+    
+    db = current_app.get_db()
+    cursor = db.cursor()
+    try:
+        cursor.execute("""
+            SELECT * FROM procesar_checkout(
+                %s::INT, %s::INT, %s::metodo_pago,
+                %s::NUMERIC, %s::NUMERIC, %s::NUMERIC, %s::NUMERIC,
+                %s::INT, %s::DECIMAL, %s::DECIMAL
+            )
+        """, (user_id, restaurante_id, metodo_pago,
+              parametros['velocidad_kmh'], parametros['preparacion_base'],
+              parametros['extra_por_producto'], parametros['factor_trafico'],
+              parametros['buffer_minutos'], parametros['lat_simulada'],
+              parametros['lng_simulada']))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+
 # Sistema de Checkout
 @cliente_bp.route("/checkout", methods=["GET", "POST"])
 @login_required
@@ -308,79 +302,45 @@ def checkout():
             flash("Debe seleccionar un restaurante", "danger")
             return redirect(url_for("cliente.checkout"))
         
-        # 🔥 VALIDAR QUE HAY PRODUCTOS EN EL CARRITO ANTES DE PROCEDER
-        cursor.execute("""
-            SELECT COUNT(*) as count_items
-            FROM carritos c
-            WHERE c.idusu = %s
-        """, (user_id,))
-        carrito_check = cursor.fetchone()
+        # 🔥 Pedido, pago y tiempo estimado en una sola llamada (una transacción)
+        try:
+            resultado = procesar_checkout(user_id, restaurante_id, metodo_pago)
+        except Exception as e:
+            flash(f"Error al procesar pedido: {str(e)}", "danger")
+            return redirect(url_for("cliente.checkout"))
         
-        if not carrito_check or carrito_check['count_items'] == 0:
+        if not resultado:
             flash("Tu carrito está vacío. Agrega productos antes de continuar.", "warning")
             return redirect(url_for("cliente.menu"))
         
-        try:
-            # 🔥 CALCULAR TOTAL ANTES DE CREAR EL PEDIDO
-            # (porque el carrito se vacía automáticamente al crear el pedido)
-            cursor.execute("""
-                SELECT COALESCE(SUM(c.canprocar * p.prepro), 0) as total,
-                       COUNT(*) as num_items
-                FROM carritos c
-                JOIN productos p ON c.idpro = p.idpro
-                WHERE c.idusu = %s
-            """, (user_id,))
-            total_result = cursor.fetchone()
-            total = float(total_result['total']) if total_result and total_result['total'] is not None else 0.0
-            num_items = total_result['num_items'] if total_result else 0
-            
-            print(f"🔍 DEBUG - Usuario: {user_id}, Items en carrito: {num_items}, Total calculado: {total}")
-            
-            # Validar que el total no sea 0 (debería haber productos)
-            if total <= 0 or num_items == 0:
-                flash(f"Error: No se pueden procesar pedidos sin productos o con monto 0. Items: {num_items}, Total: {total}", "danger")
-                return redirect(url_for("cliente.checkout"))
-            
-            # Usar la función confirmar_pedido (PostgreSQL retorna tabla)
-            cursor.execute("SELECT * FROM confirmar_pedido(%s, %s)", (user_id, restaurante_id))
-            result = cursor.fetchone()
+        pedido_id = resultado['id_pedido']
+        total = float(resultado['total'])
+        # El pedido descontó stock (trigger de detalle_pedidos): la lista de productos cambió
+        bump_stamp(f'productos:{restaurante_id}')
+        # Pedido nuevo en la lista del restaurante
+        cache.delete('pedidos_restaurante', int(restaurante_id))
+        
+        if resultado['tiempo_estimado'] is None or resultado['distancia_km'] is None:
+            # Restaurante sin ubicación: pedido creado, sin tiempo estimado
+            session.pop('ultimo_pedido', None)
+            flash(f"¡Pedido realizado con éxito! Total: ${total:.2f}", "success")
+        else:
+            tiempo_formateado = DeliveryCalculator.formatear_tiempo_estimado(resultado['tiempo_estimado'])
+            flash(f"¡Pedido realizado con éxito! Total: ${total:.2f} - Llegará en {tiempo_formateado}", "success")
             
-            if result:
-                pedido_id = result['id_pedido_creado']
-                
-                # Registrar pago con CALL (cast explícito para todos los tipos)
-                cursor.execute("CALL registrar_pago(%s::INT, %s::metodo_pago, %s::DECIMAL)", (pedido_id, metodo_pago, total))
-                
-                # 🕐 Calcular tiempo estimado de entrega
-                try:
-                    tiempo_info = DeliveryCalculator.calcular_tiempo_para_pedido(pedido_id)
-                    
-                    if tiempo_info:
-                        tiempo_formateado = DeliveryCalculator.formatear_tiempo_estimado(tiempo_info['tiempo_estimado'])
-                        flash(f"¡Pedido realizado con éxito! Total: ${total:.2f} - Llegará en {tiempo_formateado}", "success")
-                        
-                        # Guardar info de tiempo en sesión para mostrar en página de éxito
-                        session['ultimo_pedido'] = {
-                            'id': pedido_id,
-                            'total': float(total),
-                            'tiempo_estimado': tiempo_info['tiempo_estimado'],
-                            'hora_estimada': tiempo_info['hora_estimada'].strftime('%H:%M'),
-                            'distancia': tiempo_info['distancia_km'],
-                            'restaurante': tiempo_info['restaurante'],
-                            'metodo_pago': metodo_pago
-                        }
-                    else:
-                        flash(f"¡Pedido realizado con éxito! Total: ${total:.2f}", "success")
-                except Exception as e:
-                    print(f"Error calculando tiempo: {e}")
-                    flash(f"¡Pedido realizado con éxito! Total: ${total:.2f}", "success")
-                
-                # Redirigir a página de pago exitoso
-                return redirect(url_for("cliente.pago_exitoso", pedido_id=pedido_id, metodo=metodo_pago, total=f"{total:.2f}"))
-                
-        except Exception as e:
-            flash(f"Error al procesar pedido: {str(e)}", "danger")
-            return redirect(url_for("cliente.checkout"))
+            # Guardar info de tiempo en sesión para mostrar en página de éxito
+            session['ultimo_pedido'] = {
+                'id': pedido_id,
+                'total': total,
+                'tiempo_estimado': resultado['tiempo_estimado'],
+                'hora_estimada': resultado['hora_estimada'].strftime('%H:%M'),
+                'distancia': float(resultado['distancia_km']),
+                'restaurante': resultado['restaurante'],
+                'metodo_pago': metodo_pago
+            }
+        
+        # Redirigir a página de pago exitoso
+        return redirect(url_for("cliente.pago_exitoso", pedido_id=pedido_id, metodo=metodo_pago, total=f"{total:.2f}"))
     
     # GET: Mostrar formulario de checkout
     # Obtener productos del carrito
@@ -414,21 +374,49 @@ def checkout():
 
     return render_template("cliente/checkout.html", restaurantes=restaurantes, total_general=total_general)
 
+def _validadores_pedidos(pedidos, actualizado, en_curso, pagados):
+    """
+    Validador del historial: cantidad de pedidos, última actualización y pagos.
+    Mientras haya pedidos en curso el tiempo restante cambia cada minuto,
+    así que la ETag incluye el minuto actual y no se envía Last-Modified.
+    """
+    partes = (pedidos, actualizado, pagados)
+    if en_curso:
+        return {'etag': partes + (int(time.time() // 60),)}
+    return {'etag': partes, 'last_modified': actualizado}
+
+def _validador_mis_pedidos():
+    """Sello barato del historial; solo se consulta en requests condicionales"""
+    user_id = session.get("usuario_id")
+    sello = execute_prepared_one('cliente_pedidos_sello', (user_id, user_id))
+    if not sello:
+        return None
+    return _validadores_pedidos(sello['pedidos'], sello['actualizado'], sello['en_curso'], sello['pagados'])
+
 @cliente_bp.route("/mis-pedidos")
 @login_required
 @role_required("cliente")
+@read_only_route
+@conditional_get(_validador_mis_pedidos, only_if_conditional=True)
 def mis_pedidos():
     """Muestra el historial de pedidos del cliente con tiempo estimado."""
     user_id = session.get("usuario_id")
     db = current_app.get_db()
 
-    cursor = db.cursor()
+    cursor = db.cursor(row_factory=record_row(PedidoCliente))
     
     cursor.execute("""
         SELECT p.idped, r.nomres, p.estped, p.fecha_creacion,
                p.tiempo_estimado_minutos, p.hora_estimada_entrega,
                COALESCE(SUM(dp.cantidad * dp.precio_unitario), 0) as total,
-               pg.metodo, pg.estado as estado_pago
+               pg.metodo, pg.estado as estado_pago,
+               -- Validador del GET condicional sobre todo el historial (ver 'cliente_pedidos_sello')
+               COUNT(*) OVER () AS sello_pedidos,
+               MAX(p.fecha_actualizacion) OVER () AT TIME ZONE current_setting('TimeZone') AS sello_actualizado,
+               COUNT(*) FILTER (
+                   WHERE p.fecha_creacion + p.tiempo_estimado_minutos * INTERVAL '1 minute' > LOCALTIMESTAMP
+               ) OVER () AS sello_en_curso,
+               COUNT(*) FILTER (WHERE pg.estado = 'pagado') OVER () AS sello_pagados
         FROM pedidos p
         JOIN restaurantes r ON p.idres = r.idres
         LEFT JOIN detalle_pedidos dp ON p.idped = dp.idped
@@ -439,20 +427,21 @@ def mis_pedidos():
         ORDER BY p.fecha_creacion DESC
     """, (user_id,))
     
-    pedidos_raw = cursor.fetchall()
+    pedidos = cursor.fetchall()
+    if pedidos:
+        primero = pedidos[0]
+        set_validators(_validadores_pedidos(primero.sello_pedidos, primero.sello_actualizado,
+                                            primero.sello_en_curso, primero.sello_pagados))
+    else:
+        set_validators(_validadores_pedidos(0, None, 0, 0))
     
-    # Enriquecer datos de pedidos con información de entrega
-    pedidos = []
-    for pedido in pedidos_raw:
-        pedido_dict = dict(pedido)
-        
+    # Enriquecer los pedidos (registros PedidoCliente) con información de entrega
+    for pedido in pedidos:
         # Calcular estado de entrega si hay tiempo estimado
-        if pedido['tiempo_estimado_minutos']:
-            estado_entrega = DeliveryCalculator.obtener_estado_entrega_con_tiempo(pedido['idped'])
+        if pedido.tiempo_estimado_minutos:
+            estado_entrega = DeliveryCalculator.obtener_estado_entrega_con_tiempo(pedido.idped)
             if estado_entrega:
-                pedido_dict.update(estado_entrega)
-        
-        pedidos.append(pedido_dict)
+                pedido.update(estado_entrega)
     
     return render_template("cliente/mis_pedidos.html", pedidos=pedidos)
 
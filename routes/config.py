@@ -7,7 +7,8 @@ from utils.auth_helpers import login_required
 from utils.validation_decorators import validate_form
 from utils.input_validator import input_validator
 from utils.session_manager import require_active_session
-from werkzeug.security import generate_password_hash, check_password_hash
+from utils.menu_cache import menu_cache
+from utils.password_hashing import password_hasher, PasswordHashingBusy
 
 config_bp = Blueprint("config", __name__)
 
@@ -46,7 +47,12 @@ def update_profile():
                     UPDATE restaurantes 
                     SET nomres = %s, dirres = %s, telres = %s 
                     WHERE idusu = %s
+                    RETURNING idres
                 """, (nombre, direccion, telefono, usuario_id))
+                actualizado = cursor.fetchone()
+                if actualizado:
+                    menu_cache.invalidate_restaurant(actualizado["idres"])
+                    menu_cache.invalidate_index()
             
             db.commit()
             cursor.close()
@@ -99,7 +105,14 @@ def change_password():
         cursor.execute("SELECT conusu FROM usuarios WHERE idusu = %s", (usuario_id,))
         user = cursor.fetchone()
         
-        if not user or not check_password_hash(user["conusu"], current_password):
+        try:
+            valida = bool(user) and password_hasher.verify(user["conusu"], current_password)
+        except PasswordHashingBusy as e:
+            flash(f"⏳ {e}", "warning")
+            cursor.close()
+            return render_template("config/change_password.html"), 503
+        
+        if not valida:
             flash("❌ Contraseña actual incorrecta", "error")
             cursor.close()
             return render_template("config/change_password.html")
@@ -119,7 +132,7 @@ def change_password():
         
         try:
             # Actualizar contraseña
-            new_password_hash = generate_password_hash(new_password)
+            new_password_hash = password_hasher.hash(new_password)
             cursor.execute("""
                 UPDATE usuarios 
                 SET conusu = %s 
@@ -1,5 +1,9 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, session
 from utils.auth_helpers import login_required, role_required
+from utils.db_helpers import execute_prepared, execute_pipeline, primary_reads
+from utils.identity import identity
+from utils.cache import cache
+from utils.single_flight import single_flight
 
 repartidor_bp = Blueprint("repartidor", __name__)
 
@@ -8,58 +12,58 @@ repartidor_bp = Blueprint("repartidor", __name__)
 def test():
     return "Ruta de repartidor funcionando 🚀"
 
+def calcular_estadisticas(idrep):
+    """Estadísticas del dashboard del repartidor en un solo viaje a la BD (pipeline)"""
+    entregados, en_proceso, ganado, hoy = execute_pipeline([
+        # Total de pedidos entregados
+        ("""
+            SELECT COUNT(*) as total_entregados
+            FROM pedidos WHERE idrep = %s AND estped = 'entregado'
+        """, (idrep,)),
+        # Pedidos en proceso
+        ("""
+            SELECT COUNT(*) as en_proceso
+            FROM pedidos WHERE idrep = %s AND estped IN ('aceptado', 'preparando', 'en_camino')
+        """, (idrep,)),
+        # Total ganado (simulado - 10% del total de pedidos)
+        ("""
+            SELECT COALESCE(SUM(dp.cantidad * dp.precio_unitario * 0.1), 0) as total_ganado
+            FROM pedidos p
+            LEFT JOIN detalle_pedidos dp ON p.idped = dp.idped
+            WHERE p.idrep = %s AND p.estped = 'entregado'
+        """, (idrep,)),
+        # Pedidos de hoy
+        ("""
+            SELECT COUNT(*) as hoy
+            FROM pedidos WHERE idrep = %s AND DATE(fecha_creacion) = CURRENT_DATE
+        """, (idrep,)),
+    ])
+    
+    return {
+        'entregados': entregados[0]['total_entregados'],
+        'en_proceso': en_proceso[0]['en_proceso'],
+        'ganado': ganado[0]['total_ganado'] if ganado[0]['total_ganado'] else 0,
+        'hoy': hoy[0]['hoy']
+    }
+
 @repartidor_bp.route("/dashboard")
 @login_required
 @role_required("repartidor")
 def dashboard():
     """Dashboard con estadísticas del repartidor."""
-    usuario_id = session.get("usuario_id")
-    db = current_app.get_db()
-
-    cursor = db.cursor()
-    
-    # Obtener ID del repartidor
-    cursor.execute("SELECT idrep FROM repartidores WHERE idusu = %s", (usuario_id,))
-    repartidor = cursor.fetchone()
+    # ID del repartidor desde la caché de identidad
+    idrep = identity.repartidor_id()
     
-    if not repartidor:
+    if not idrep:
         return redirect(url_for("repartidor.perfil"))
     
-    idrep = repartidor['idrep']
-    
-    # Estadísticas del repartidor
-    stats = {}
-    
-    # Total de pedidos entregados
-    cursor.execute("""
-        SELECT COUNT(*) as total_entregados
-        FROM pedidos WHERE idrep = %s AND estped = 'entregado'
-    """, (idrep,))
-    stats['entregados'] = cursor.fetchone()['total_entregados']
-    
-    # Pedidos en proceso
-    cursor.execute("""
-        SELECT COUNT(*) as en_proceso
-        FROM pedidos WHERE idrep = %s AND estped IN ('aceptado', 'preparando', 'en_camino')
-    """, (idrep,))
-    stats['en_proceso'] = cursor.fetchone()['en_proceso']
-    
-    # Total ganado (simulado - 10% del total de pedidos)
-    cursor.execute("""
-        SELECT COALESCE(SUM(dp.cantidad * dp.precio_unitario * 0.1), 0) as total_ganado
-        FROM pedidos p
-        LEFT JOIN detalle_pedidos dp ON p.idped = dp.idped
-        WHERE p.idrep = %s AND p.estped = 'entregado'
-    """, (idrep,))
-    result = cursor.fetchone()
-    stats['ganado'] = result['total_ganado'] if result['total_ganado'] else 0
-    
-    # Pedidos de hoy
-    cursor.execute("""
-        SELECT COUNT(*) as hoy
-        FROM pedidos WHERE idrep = %s AND DATE(fecha_creacion) = CURRENT_DATE
-    """, (idrep,))
-    stats['hoy'] = cursor.fetchone()['hoy']
+    # Estadísticas del repartidor (caché corta con single-flight)
+    def cargar():
+        with primary_reads():
+            return calcular_estadisticas(idrep)
+
+    stats = single_flight.get_or_load('repartidor_dashboard', idrep, cargar,
+                                      ttl=current_app.config['ORDER_LISTS_CACHE_TTL'])
     
     return render_template("repartidor/dashboard.html", stats=stats)
 
@@ -69,58 +73,31 @@ def dashboard():
 def listar_pedidos():
     """Lista pedidos disponibles para asignar o ya asignados al repartidor."""
     usuario_id = session.get("usuario_id")
-    db = current_app.get_db()
-
-    cursor = db.cursor()
     
-    # Verificar si el usuario tiene registro de repartidor
-    cursor.execute("SELECT idrep FROM repartidores WHERE idusu = %s", (usuario_id,))
-    repartidor = cursor.fetchone()
+    # Verificar si el usuario tiene registro de repartidor (caché de identidad)
+    idrep = identity.repartidor_id(usuario_id)
     
-    if not repartidor:
+    if not idrep:
+        db = current_app.get_db()
+
+        cursor = db.cursor()
         # Crear registro de repartidor automáticamente
         cursor.execute("SELECT nomusu FROM usuarios WHERE idusu = %s", (usuario_id,))
         usuario = cursor.fetchone()
         cursor.execute("""
             INSERT INTO repartidores (idusu, nomrep, vehrep, estrep) 
             VALUES (%s, %s, 'Vehículo por definir', 'activo')
+            RETURNING idrep
         """, (usuario_id, usuario['nomusu']))
+        idrep = cursor.fetchone()['idrep']
         db.commit()
-        
-        cursor.execute("SELECT idrep FROM repartidores WHERE idusu = %s", (usuario_id,))
-        repartidor = cursor.fetchone()
-    
-    idrep = repartidor['idrep']
+        cursor.close()
     
     # Pedidos asignados al repartidor
-    cursor.execute("""
-        SELECT p.idped, u.nomusu as cliente, u.dirusu, r.nomres, 
-               p.estped, p.fecha_creacion,
-               COALESCE(SUM(dp.cantidad * dp.precio_unitario), 0) as total
-        FROM pedidos p
-        JOIN usuarios u ON p.idusu = u.idusu
-        JOIN restaurantes r ON p.idres = r.idres
-        LEFT JOIN detalle_pedidos dp ON p.idped = dp.idped
-        WHERE p.idrep = %s
-        GROUP BY p.idped, u.nomusu, u.dirusu, r.nomres, p.estped, p.fecha_creacion
-        ORDER BY p.fecha_creacion DESC
-    """, (idrep,))
-    pedidos_asignados = cursor.fetchall()
+    pedidos_asignados = execute_prepared('repartidor_pedidos_asignados', (idrep,))
     
     # Pedidos disponibles para asignar (estado pendiente, aceptado o preparando, sin repartidor)
-    cursor.execute("""
-        SELECT p.idped, u.nomusu as cliente, u.dirusu, r.nomres, 
-               p.estped, p.fecha_creacion,
-               COALESCE(SUM(dp.cantidad * dp.precio_unitario), 0) as total
-        FROM pedidos p
-        JOIN usuarios u ON p.idusu = u.idusu
-        JOIN restaurantes r ON p.idres = r.idres
-        LEFT JOIN detalle_pedidos dp ON p.idped = dp.idped
-        WHERE p.estped IN ('pendiente', 'aceptado', 'preparando') AND p.idrep IS NULL
-        GROUP BY p.idped, u.nomusu, u.dirusu, r.nomres, p.estped, p.fecha_creacion
-        ORDER BY p.fecha_creacion ASC
-    """)
-    pedidos_disponibles = cursor.fetchall()
+    pedidos_disponibles = execute_prepared('repartidor_pedidos_disponibles')
     
     return render_template("repartidor/pedidos.html", 
                          pedidos_asignados=pedidos_asignados,
@@ -131,18 +108,21 @@ def listar_pedidos():
 @role_required("repartidor")
 def tomar_pedido(pedido_id):
     """Asigna un pedido al repartidor actual."""
-    usuario_id = session.get("usuario_id")
-    db = current_app.get_db()
-
-    cursor = db.cursor()
-    
-    # Obtener ID del repartidor
-    cursor.execute("SELECT idrep FROM repartidores WHERE idusu = %s", (usuario_id,))
-    repartidor = cursor.fetchone()
+    # Obtener ID del repartidor (caché de identidad)
+    idrep = identity.repartidor_id()
     
-    if repartidor:
+    if idrep:
+        db = current_app.get_db()
+
+        cursor = db.cursor()
         try:
-            cursor.execute("CALL asignar_repartidor(%s, %s)", (pedido_id, repartidor['idrep']))
+            cursor.execute("CALL asignar_repartidor(%s, %s)", (pedido_id, idrep))
+            # El pedido cambia en el panel del repartidor y en la lista del restaurante
+            cursor.execute("SELECT idres FROM pedidos WHERE idped = %s", (pedido_id,))
+            pedido = cursor.fetchone()
+            cache.delete('repartidor_dashboard', idrep)
+            if pedido:
+                cache.delete('pedidos_restaurante', pedido['idres'])
             flash(f"Pedido #{pedido_id} asignado exitosamente", "success")
         except Exception as e:
             flash(f"Error al asignar pedido: {str(e)}", "danger")
@@ -161,7 +141,14 @@ def actualizar_estado(pedido_id):
 
         cursor = db.cursor()
         cursor.execute("CALL cambiar_estado_pedido(%s, %s)", (pedido_id, nuevo_estado))
+        # El estado cambia en el panel del repartidor y en la lista del restaurante
+        cursor.execute("SELECT idres, idrep FROM pedidos WHERE idped = %s", (pedido_id,))
+        pedido = cursor.fetchone()
         cursor.close()
+        if pedido:
+            cache.delete('pedidos_restaurante', pedido['idres'])
+            if pedido['idrep']:
+                cache.delete('repartidor_dashboard', pedido['idrep'])
         flash(f"Estado del pedido #{pedido_id} actualizado a {nuevo_estado}", "success")
     except Exception as e:
         flash(f"Error al actualizar estado: {str(e)}", "danger")
@@ -2,15 +2,31 @@ from flask import Blueprint, request, jsonify, render_template, redirect, url_fo
 from utils.auth_helpers import login_required, role_required
 from utils.validation_decorators import validate_form, require_fields
 from utils.input_validator import input_validator
+from utils.db_helpers import execute_prepared, execute_pipeline, primary_reads
+from utils.product_import import importar_productos, ProductImportError
+from utils.menu_cache import menu_cache
+from utils.category_cache import category_cache
+from utils.conditional_get import conditional_get
+from utils.identity import identity
+from utils.cache import cache
+from utils.single_flight import single_flight
 
 restaurante_bp = Blueprint("restaurante", __name__)
 
 # ----------------------------
 # PRODUCTOS
 # ----------------------------
+def _validador_productos():
+    """ETag de la lista de productos: sello del restaurante + versión de categorías"""
+    idres = identity.restaurante_id()
+    if not idres:
+        return None
+    return {'etag': (menu_cache.restaurant_version(idres), category_cache.version())}
+
 @restaurante_bp.route("/productos", methods=["GET"])
 @login_required
 @role_required("restaurante")
+@conditional_get(_validador_productos)
 def listar_productos():
     db = current_app.get_db()
 
@@ -25,14 +41,12 @@ def listar_productos():
         SELECT p.idpro, p.nompro, p.despro, p.prepro, p.stopro, c.tipcat
         FROM productos p
         JOIN categorias c ON p.idcat = c.idcat
-        JOIN restaurantes r ON p.idres = r.idres
-        WHERE r.idusu = %s
+        WHERE p.idres = %s
         """,
-        (usuario_id,)
+        (identity.restaurante_id(usuario_id),)
     )
     productos = cursor.fetchall()
-    cursor.execute("SELECT idcat, tipcat FROM categorias")
-    categorias = cursor.fetchall()
+    categorias = category_cache.get_all()
     return render_template("restaurante/productos.html", productos=productos, categorias=categorias)
 
 @restaurante_bp.route("/productos", methods=["POST"])
@@ -53,19 +67,16 @@ def crear_producto():
     stopro = request.validated_data["stopro"]
     idcat = request.validated_data["idcat"]
 
-    # Obtener el idres del restaurante logueado
-    usuario_id = session.get("usuario_id")
-    db = current_app.get_db()
-
-    cursor = db.cursor()
-    cursor.execute("SELECT idres FROM restaurantes WHERE idusu = %s", (usuario_id,))
-    restaurante = cursor.fetchone()
+    # Obtener el idres del restaurante logueado (caché de identidad)
+    idres = identity.restaurante_id()
 
-    if not restaurante:
+    if not idres:
         flash("No se encontró un restaurante asociado al usuario logueado.", "danger")
         return redirect(url_for("restaurante.listar_productos"))
 
-    idres = restaurante["idres"]  # Obtener el idres del resultado de la consulta
+    db = current_app.get_db()
+
+    cursor = db.cursor()
 
     # Insertar el producto con el idres correcto
     cursor.execute(
@@ -73,9 +84,44 @@ def crear_producto():
         (idres, idcat, nompro, despro, prepro, stopro)
     )
     db.commit()
+    menu_cache.invalidate_restaurant(idres)
     flash("Producto creado exitosamente.", "success")
     return redirect(url_for("restaurante.listar_productos"))
 
+@restaurante_bp.route("/productos/importar", methods=["POST"])
+@login_required
+@role_required("restaurante")
+def importar_productos_masivo():
+    """
+    Importación masiva de productos desde un archivo CSV o JSON.
+    Devuelve un reporte JSON con los totales y los errores por fila.
+    """
+    archivo = request.files.get("archivo")
+    if not archivo or not archivo.filename:
+        return jsonify({"msg": "Debes adjuntar un archivo CSV o JSON."}), 400
+
+    idres = identity.restaurante_id()
+
+    if not idres:
+        return jsonify({"msg": "No se encontró un restaurante asociado al usuario logueado."}), 403
+
+    db = current_app.get_db()
+    try:
+        reporte = importar_productos(db, idres, archivo,
+                                     current_app.config["PRODUCT_IMPORT_MAX_ROWS"])
+    except ProductImportError as e:
+        return jsonify({"msg": str(e)}), 400
+    except Exception as e:
+        print(f"❌ Error en importación masiva de productos: {e}")
+        return jsonify({"msg": "Error al importar los productos. No se guardó ningún cambio."}), 500
+
+    if reporte["insertados"] or reporte["actualizados"]:
+        menu_cache.invalidate_restaurant(idres)
+
+    reporte["msg"] = (f"Importación completada: {reporte['insertados']} nuevos, "
+                      f"{reporte['actualizados']} actualizados, {reporte['filas_con_error']} con errores.")
+    return jsonify(reporte)
+
 @restaurante_bp.route("/productos/<int:idpro>/editar", methods=["GET", "POST"])
 @login_required
 @role_required("restaurante")
@@ -92,16 +138,18 @@ def editar_producto(idpro):
         idcat = request.form["idcat"]
 
         cursor.execute(
-            "UPDATE productos SET nompro = %s, despro = %s, prepro = %s, stopro = %s, idcat = %s WHERE idpro = %s",
+            "UPDATE productos SET nompro = %s, despro = %s, prepro = %s, stopro = %s, idcat = %s WHERE idpro = %s RETURNING idres",
             (nompro, despro, prepro, stopro, idcat, idpro)
         )
+        actualizado = cursor.fetchone()
         db.commit()
+        if actualizado:
+            menu_cache.invalidate_restaurant(actualizado["idres"])
         return redirect(url_for("restaurante.listar_productos"))
 
     cursor.execute("SELECT * FROM productos WHERE idpro = %s", (idpro,))
     producto = cursor.fetchone()
-    cursor.execute("SELECT idcat, tipcat FROM categorias")
-    categorias = cursor.fetchall()
+    categorias = category_cache.get_all()
     return render_template("restaurante/editar_producto.html", producto=producto, categorias=categorias)
 
 @restaurante_bp.route("/productos/<int:idpro>/eliminar", methods=["POST"])
@@ -111,8 +159,11 @@ def eliminar_producto(idpro):
     db = current_app.get_db()
 
     cursor = db.cursor()
-    cursor.execute("DELETE FROM productos WHERE idpro = %s", (idpro,))
+    cursor.execute("DELETE FROM productos WHERE idpro = %s RETURNING idres", (idpro,))
+    eliminado = cursor.fetchone()
     db.commit()
+    if eliminado:
+        menu_cache.invalidate_restaurant(eliminado["idres"])
     return redirect(url_for("restaurante.listar_productos"))
 
 # ----------------------------
@@ -128,26 +179,17 @@ def listar_pedidos():
     if not usuario_id:
         return jsonify({"msg": "No se pudo identificar al usuario logueado."}), 403
 
-    db = current_app.get_db()
+    idres = identity.restaurante_id(usuario_id)
+    if not idres:
+        return render_template("restaurante/pedidos.html", pedidos=[])
 
+    # Caché corta con single-flight: se invalida con pedidos nuevos y cambios de estado
+    def cargar():
+        with primary_reads():
+            return execute_prepared('restaurante_pedidos', (idres,))
 
-    cursor = db.cursor()
-    cursor.execute(
-        """
-        SELECT p.idped, u.nomusu AS cliente, 
-               p.estped, p.fecha_creacion, p.fecha_actualizacion,
-               COALESCE(SUM(dp.cantidad * dp.precio_unitario), 0) AS total
-        FROM pedidos p
-        JOIN usuarios u ON p.idusu = u.idusu
-        LEFT JOIN detalle_pedidos dp ON p.idped = dp.idped
-        JOIN restaurantes r ON p.idres = r.idres
-        WHERE r.idusu = %s
-        GROUP BY p.idped, u.nomusu, p.estped, p.fecha_creacion, p.fecha_actualizacion
-        ORDER BY p.fecha_creacion DESC
-        """,
-        (usuario_id,)
-    )
-    pedidos = cursor.fetchall()
+    pedidos = single_flight.get_or_load('pedidos_restaurante', idres, cargar,
+                                        ttl=current_app.config['ORDER_LISTS_CACHE_TTL'])
     return render_template("restaurante/pedidos.html", pedidos=pedidos)
 
 @restaurante_bp.route("/pedidos/<int:idped>", methods=["GET"])
@@ -155,35 +197,30 @@ def listar_pedidos():
 @role_required("restaurante")
 def detalle_pedido(idped):
     """Detalle de un pedido con productos"""
-    db = current_app.get_db()
-
-    cursor = db.cursor()
-
-    # Info general del pedido
-    cursor.execute("""
-        SELECT p.idped, u.nomusu AS cliente, 
-               p.estped, p.fecha_creacion, p.fecha_actualizacion,
-               COALESCE(SUM(dp.cantidad * dp.precio_unitario), 0) AS total
-        FROM pedidos p
-        JOIN usuarios u ON p.idusu = u.idusu
-        LEFT JOIN detalle_pedidos dp ON p.idped = dp.idped
-        WHERE p.idped = %s
-        GROUP BY p.idped, u.nomusu, p.estped, p.fecha_creacion, p.fecha_actualizacion
-    """, (idped,))
-    pedido = cursor.fetchone()
+    # Info general del pedido y sus productos en un solo viaje a la BD (pipeline)
+    pedido, productos = execute_pipeline([
+        ("""
+            SELECT p.idped, u.nomusu AS cliente, 
+                   p.estped, p.fecha_creacion, p.fecha_actualizacion,
+                   COALESCE(SUM(dp.cantidad * dp.precio_unitario), 0) AS total
+            FROM pedidos p
+            JOIN usuarios u ON p.idusu = u.idusu
+            LEFT JOIN detalle_pedidos dp ON p.idped = dp.idped
+            WHERE p.idped = %s
+            GROUP BY p.idped, u.nomusu, p.estped, p.fecha_creacion, p.fecha_actualizacion
+        """, (idped,)),
+        ("""
+            SELECT pr.nompro AS nombre, dp.cantidad, dp.precio_unitario
+            FROM detalle_pedidos dp
+            JOIN productos pr ON dp.idpro = pr.idpro
+            WHERE dp.idped = %s
+        """, (idped,)),
+    ])
 
     if not pedido:
         flash("Pedido no encontrado", "error")
         return redirect(url_for("restaurante.listar_pedidos"))
-
-    # Productos del pedido
-    cursor.execute("""
-        SELECT pr.nompro AS nombre, dp.cantidad, dp.precio_unitario
-        FROM detalle_pedidos dp
-        JOIN productos pr ON dp.idpro = pr.idpro
-        WHERE dp.idped = %s
-    """, (idped,))
-    productos = cursor.fetchall()
+    pedido = pedido[0]
 
     return render_template("restaurante/detalle_pedido.html", pedido=pedido, productos=productos)
 
@@ -200,7 +237,14 @@ def cambiar_estado_pedido(idped):
     cursor = db.cursor()
     # PostgreSQL: usar CALL para procedimientos
     cursor.execute("CALL cambiar_estado_pedido(%s, %s)", (idped, nuevo_estado))
+    # El estado cambia en la lista del restaurante y en el panel del repartidor asignado
+    cursor.execute("SELECT idres, idrep FROM pedidos WHERE idped = %s", (idped,))
+    pedido = cursor.fetchone()
     cursor.close()
+    if pedido:
+        cache.delete('pedidos_restaurante', pedido['idres'])
+        if pedido['idrep']:
+            cache.delete('repartidor_dashboard', pedido['idrep'])
 
     return redirect(url_for("restaurante.detalle_pedido", idped=idped))
 
@@ -231,10 +275,16 @@ def perfil():
             UPDATE restaurantes
             SET nomres = %s, desres = %s, dirres = %s, telres = %s
             WHERE idusu = %s
+            RETURNING idres
             """,
             (nomres, desres, dirres, telres, usuario_id)
         )
+        actualizado = cursor.fetchone()
         db.commit()
+        if actualizado:
+            # El nombre cambia la entrada del menú y el orden del índice
+            menu_cache.invalidate_restaurant(actualizado["idres"])
+            menu_cache.invalidate_index()
         flash("Perfil actualizado exitosamente.", "success")
         return redirect(url_for("restaurante.perfil"))
 
@@ -2,16 +2,20 @@
 🔗 Blueprint para gestión de sesiones y endpoints de timeout
 Proporciona rutas para:
 - Verificar estado de sesión
+- Sondeo liviano del vencimiento (/session/ping, sin cargar la sesión)
 - Renovar sesión activa
 - Obtener tiempo restante
 - Logout por timeout
 """
 
-from flask import Blueprint, jsonify, session, request, redirect, url_for, flash
-from utils.session_manager import session_manager, require_active_session
+from flask import Blueprint, jsonify, session, request, redirect, url_for, flash, current_app
+from utils.session_manager import session_manager, require_active_session, sessionless
 from datetime import datetime
+import time
 
 session_bp = Blueprint('session', __name__, url_prefix='/session')
+# Estos endpoints manejan el timeout por su cuenta
+session_bp.session_exempt = True
 
 
 @session_bp.route('/status')
@@ -41,6 +45,31 @@ def session_status():
     })
 
 
+@session_bp.route('/ping')
+@sessionless
+def session_ping():
+    """
+    Estado mínimo para el sondeo periódico del cliente.
+    Lee el vencimiento del token de estado firmado: no carga ni reescribe la sesión.
+    Sin token responde authenticated=False y el cliente consulta /session/status.
+    """
+    deadline = session_manager.read_status()
+    
+    if deadline is None:
+        response = jsonify({'authenticated': False})
+    else:
+        time_until_timeout = (deadline - time.time()) / 60
+        response = jsonify({
+            'authenticated': True,
+            'time_until_timeout': round(time_until_timeout, 1),
+            'is_expired': time_until_timeout <= 0,
+            'needs_warning': time_until_timeout <= current_app.config.get('SESSION_WARNING_MINUTES', 5)
+        })
+    
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
 @session_bp.route('/refresh', methods=['POST'])
 @require_active_session
 def refresh_session():
@@ -66,8 +95,7 @@ def extend_session():
     Extender la sesión por el tiempo completo (reset completo)
     """
     # Reiniciar completamente la actividad
-    session['last_activity'] = datetime.now().isoformat()
-    session.modified = True
+    session_manager.refresh_session(force=True)
     
     info = session_manager.get_session_info()
     
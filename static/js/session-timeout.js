@@ -5,6 +5,10 @@
  * - Alertas de sesión próxima a expirar
  * - Renovación automática de sesión
  * - Logout automático por timeout
+ *
+ * El sondeo usa /session/ping (no carga la sesión en el servidor) y, con
+ * varias pestañas abiertas, solo una pestaña líder consulta al servidor:
+ * se elige con Web Locks y reparte el estado por BroadcastChannel.
  */
 
 class SessionTimeoutManager {
@@ -15,6 +19,7 @@ class SessionTimeoutManager {
             heartbeatInterval: options.heartbeatInterval || 300000, // Heartbeat cada 5 minutos
             autoExtend: options.autoExtend || false, // Auto-extender en actividad
             showModal: options.showModal !== false, // Mostrar modal de advertencia
+            channelName: options.channelName || 'domiweb-sesion', // Canal compartido entre pestañas
             ...options
         };
         
@@ -27,9 +32,14 @@ class SessionTimeoutManager {
         this.state = {
             isActive: false,
             lastWarning: null,
-            modalShown: false
+            modalShown: false,
+            isLeader: false
         };
         
+        // Coordinación entre pestañas (si el navegador la soporta)
+        this.channel = null;
+        this.releaseLeadership = null;
+        
         this.init();
     }
     
@@ -54,6 +64,7 @@ class SessionTimeoutManager {
             
             if (data.authenticated) {
                 this.handleSessionData(data);
+                this.broadcast({ type: 'status', data });
                 return true;
             } else {
                 this.stopMonitoring();
@@ -65,6 +76,44 @@ class SessionTimeoutManager {
         }
     }
     
+    async pingSession() {
+        // Sondeo liviano: el servidor solo lee el token de estado firmado
+        try {
+            const response = await fetch('/session/ping', { cache: 'no-store' });
+            const data = await response.json();
+            
+            if (!data.authenticated) {
+                // Sin token: confirmar con el estado completo (también lo reemite)
+                return this.checkSession();
+            }
+            
+            this.handleSessionData(data);
+            this.broadcast({ type: 'status', data });
+            return true;
+        } catch (error) {
+            console.error('❌ Error verificando sesión:', error);
+            return false;
+        }
+    }
+    
+    broadcast(message) {
+        if (this.channel && this.state.isLeader) {
+            this.channel.postMessage(message);
+        }
+    }
+    
+    handleChannelMessage(message) {
+        // Mensajes de la pestaña líder o de otra pestaña que extendió la sesión
+        if (message.type === 'status') {
+            this.handleSessionData(message.data);
+        } else if (message.type === 'extended') {
+            this.hideWarningModal();
+            this.state.modalShown = false;
+        } else if (message.type === 'expired') {
+            this.handleSessionExpired(false);
+        }
+    }
+    
     handleSessionData(data) {
         const timeRemaining = data.time_until_timeout;
         
@@ -83,8 +132,9 @@ class SessionTimeoutManager {
         this.updateSessionIndicator(timeRemaining, data.needs_warning);
     }
     
-    handleSessionExpired() {
+    handleSessionExpired(notify = true) {
         console.log('⏰ Sesión expirada - redirigiendo...');
+        if (notify) this.broadcast({ type: 'expired' });
         this.stopMonitoring();
         
         // Mostrar notificación
@@ -178,6 +228,8 @@ class SessionTimeoutManager {
                 this.hideWarningModal();
                 this.showNotification('Sesión extendida exitosamente', 'success');
                 this.state.modalShown = false;
+                // Cualquier pestaña puede extender: avisar a las demás
+                if (this.channel) this.channel.postMessage({ type: 'extended' });
             }
         } catch (error) {
             console.error('❌ Error extendiendo sesión:', error);
@@ -292,9 +344,29 @@ class SessionTimeoutManager {
     startMonitoring() {
         console.log('🟢 Iniciando monitoreo de sesión...');
         
+        if (!('BroadcastChannel' in window) || !(navigator.locks && navigator.locks.request)) {
+            // Sin coordinación entre pestañas: cada pestaña sondea por su cuenta
+            this.startTimers();
+            return;
+        }
+        
+        this.channel = new BroadcastChannel(this.config.channelName);
+        this.channel.onmessage = (event) => this.handleChannelMessage(event.data);
+        
+        // La pestaña que obtiene el lock es la líder hasta que se cierra o se detiene
+        navigator.locks.request(this.config.channelName + '-lider', () => {
+            if (!this.state.isActive) return;
+            console.log('👑 Esta pestaña sondea la sesión por todas');
+            this.state.isLeader = true;
+            this.startTimers();
+            return new Promise(resolve => { this.releaseLeadership = resolve; });
+        });
+    }
+    
+    startTimers() {
         // Timer principal de verificación
         this.timers.check = setInterval(() => {
-            this.checkSession();
+            this.pingSession();
         }, this.config.checkInterval);
         
         // Timer de heartbeat
@@ -310,7 +382,17 @@ class SessionTimeoutManager {
             if (timer) clearInterval(timer);
         });
         
+        if (this.releaseLeadership) {
+            this.releaseLeadership();
+            this.releaseLeadership = null;
+        }
+        if (this.channel) {
+            this.channel.close();
+            this.channel = null;
+        }
+        
         this.state.isActive = false;
+        this.state.isLeader = false;
         this.hideWarningModal();
     }
     
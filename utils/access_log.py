@@ -0,0 +1,181 @@
+"""
+📝 Registro de intentos de acceso en lotes (log_intentos_acceso)
+Cada login escribía una fila en log_intentos_acceso dentro de la misma
+transacción que actualiza al usuario: una escritura más en el camino crítico
+y un índice que crece sin límite. Aquí:
+- record() solo agrega la fila a un buffer en memoria (sin E/S)
+- Un hilo por worker vacía el buffer con un único INSERT multi-fila cuando
+  se juntan ACCESS_LOG_BATCH_SIZE filas o pasan ACCESS_LOG_FLUSH_INTERVAL
+  segundos, con una conexión propia y breve del pool (no la del request)
+- Si la BD falla las filas vuelven al buffer; sobre ACCESS_LOG_MAX_BUFFER
+  se descartan las más viejas (es un log de auditoría, no el estado de la cuenta)
+- La tabla está particionada por mes; el hilo llama periódicamente a
+  mantener_particiones_log() para crear las particiones siguientes y borrar
+  las que superan ACCESS_LOG_RETENTION_MONTHS
+- Al terminar el proceso se vacía lo pendiente (atexit)
+
+Uso:
+    access_log.record(email, ip, False, user_agent, 'CREDENCIALES_INCORRECTAS')
+"""
+
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import psycopg
+
+# Las columnas se envían como arreglos: una sola sentencia por lote
+INSERT_BATCH = """
+    INSERT INTO log_intentos_acceso (email, ip_address, exito, fecha_intento, user_agent, motivo_fallo)
+    SELECT email, ip, exito, fecha AT TIME ZONE current_setting('TimeZone'), agente, motivo
+    FROM unnest(%s::varchar[], %s::varchar[], %s::boolean[], %s::timestamptz[], %s::text[], %s::varchar[])
+        AS t(email, ip, exito, fecha, agente, motivo)
+"""
+
+MAINTENANCE_INTERVAL = 6 * 3600
+
+
+class AccessLogBuffer:
+    """Buffer de intentos de acceso con escritura en lotes desde un hilo de fondo"""
+
+    def __init__(self, app=None):
+        self.app = app
+        self.db_pool = None
+        self.enabled = True
+        self.batch_size = 200
+        self.flush_interval = 5.0
+        self.max_buffer = 10000
+        self.retention_months = 6
+        self._rows = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._last_maintenance = None
+        self._stats = {'registrados': 0, 'escritos': 0, 'lotes': 0, 'errores': 0, 'descartados': 0}
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configurar tamaño de lote, intervalo y retención desde la aplicación Flask"""
+        self.app = app
+        app.access_log = self
+
+        app.config.setdefault('ACCESS_LOG_BUFFERED', True)
+        app.config.setdefault('ACCESS_LOG_BATCH_SIZE', 200)
+        app.config.setdefault('ACCESS_LOG_FLUSH_INTERVAL', 5.0)
+        app.config.setdefault('ACCESS_LOG_MAX_BUFFER', 10000)
+        app.config.setdefault('ACCESS_LOG_RETENTION_MONTHS', 6)
+
+        self.db_pool = app.db_pool
+        self.enabled = app.config['ACCESS_LOG_BUFFERED']
+        self.batch_size = app.config['ACCESS_LOG_BATCH_SIZE']
+        self.flush_interval = app.config['ACCESS_LOG_FLUSH_INTERVAL']
+        self.max_buffer = app.config['ACCESS_LOG_MAX_BUFFER']
+        self.retention_months = app.config['ACCESS_LOG_RETENTION_MONTHS']
+        atexit.register(self.flush)
+
+    def _ensure_worker(self):
+        """Hilo propio de cada worker (se crea después del fork de gunicorn); con _lock tomado"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._wakeup = threading.Event()
+        threading.Thread(target=self._run, name='access-log-flusher', daemon=True).start()
+
+    def record(self, email, ip, exito, user_agent=None, motivo=None):
+        """Agregar un intento al buffer (no toca la BD)"""
+        row = (email, ip, bool(exito), datetime.now(timezone.utc), user_agent, motivo)
+        with self._lock:
+            self._stats['registrados'] += 1
+            self._rows.append(row)
+            if len(self._rows) > self.max_buffer:
+                self._rows.popleft()
+                self._stats['descartados'] += 1
+            pending = len(self._rows) >= self.batch_size
+            if self.enabled:
+                self._ensure_worker()
+        if not self.enabled:
+            # Sin buffer: escritura inmediata (comportamiento anterior)
+            self.flush()
+        elif pending:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            # Al arrancar el worker y luego cada MAINTENANCE_INTERVAL
+            if self._last_maintenance is None or time.monotonic() - self._last_maintenance >= MAINTENANCE_INTERVAL:
+                self.maintain()
+            self.flush()
+
+    def _take_batch(self):
+        with self._lock:
+            return [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+
+    def _requeue(self, batch):
+        """Devolver un lote fallido al frente del buffer respetando el máximo"""
+        with self._lock:
+            self._rows.extendleft(reversed(batch))
+            sobrantes = len(self._rows) - self.max_buffer
+            if sobrantes > 0:
+                for _ in range(sobrantes):
+                    self._rows.popleft()
+                self._stats['descartados'] += sobrantes
+                print(f"⚠️ Log de accesos: {sobrantes} intento(s) descartado(s) (buffer lleno)", file=sys.stderr)
+
+    def _write(self, batch):
+        columns = [list(col) for col in zip(*batch)]
+        with self.db_pool.get_pool().connection() as conn:
+            conn.execute(INSERT_BATCH, columns)
+
+    def flush(self):
+        """Escribir todo lo pendiente en lotes; devuelve las filas escritas"""
+        escritas = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    break
+                try:
+                    try:
+                        self._write(batch)
+                    except psycopg.errors.CheckViolation:
+                        # Sin partición para la fecha (p. ej. cambio de mes): crear y reintentar
+                        self.maintain()
+                        self._write(batch)
+                except Exception as e:
+                    self._stats['errores'] += 1
+                    print(f"❌ Error escribiendo log de accesos: {e}", file=sys.stderr)
+                    self._requeue(batch)
+                    break
+                escritas += len(batch)
+                self._stats['escritos'] += len(batch)
+                self._stats['lotes'] += 1
+        return escritas
+
+    def maintain(self):
+        """Crear las particiones próximas y eliminar las que superan la retención"""
+        self._last_maintenance = time.monotonic()
+        try:
+            with self.db_pool.get_pool().connection() as conn:
+                row = conn.execute("SELECT mantener_particiones_log(%s, %s) AS eliminadas",
+                                   (2, self.retention_months)).fetchone()
+            if row and row['eliminadas']:
+                print(f"🧹 Log de accesos: {row['eliminadas']} partición(es) eliminada(s) por retención")
+        except Exception as e:
+            print(f"⚠️ No se pudieron mantener las particiones del log de accesos: {e}", file=sys.stderr)
+
+    def stats(self):
+        """Estadísticas del worker actual"""
+        return {**self._stats, 'pendientes': len(self._rows), 'lote': self.batch_size,
+                'intervalo': self.flush_interval}
+
+
+# Instancia global
+access_log = AccessLogBuffer()
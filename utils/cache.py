@@ -0,0 +1,399 @@
+"""
+🧊 Caché de dos niveles compartida entre workers (sin servicios externos)
+- Nivel 1: LRU en memoria del proceso (lo más rápido, por worker)
+- Nivel 2: archivo SQLite en modo WAL compartido por todos los workers
+  de gunicorn del mismo servidor
+
+Características:
+- TTL por entrada
+- Claves versionadas por namespace: bump(namespace) invalida todas las claves
+  del namespace en todos los workers sin borrarlas una por una
+- Invalidación difundida: cada escritura/borrado queda en un log en SQLite;
+  los demás workers lo leen (como máximo cada CACHE_SYNC_INTERVAL segundos)
+  y descartan sus copias en memoria. Si el log ya se purgó más allá de lo
+  que un worker leyó, ese worker descarta todo lo local y relee las versiones
+- Locks entre workers con vencimiento (acquire_lock / release_lock), usados
+  por utils/single_flight.py
+
+Si el archivo SQLite no está disponible la caché sigue funcionando solo con
+el nivel en memoria (CACHE_BACKEND=local fuerza este modo).
+
+Uso:
+    valor = cache.get('menu', 'indice')
+    cache.set('menu', 'indice', valor, ttl=300)
+    cache.delete('menu', 'restaurante:5')
+    cache.bump('categorias')
+"""
+
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from utils.private_files import default_path, ensure_private_file
+
+_MISSING = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    k TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cache_versions (
+    namespace TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cache_invalidations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    k TEXT,
+    version INTEGER,
+    origin INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cache_locks (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class LocalLRU:
+    """LRU en memoria con TTL (nivel 1)"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            value, expires_at = item
+            if expires_at <= time.time():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_namespace(self, namespace):
+        with self._lock:
+            for key in [k for k in self._data if k[0] == namespace]:
+                del self._data[key]
+
+    def namespaces(self):
+        with self._lock:
+            return {k[0] for k in self._data}
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SharedCache:
+    """Caché LRU local + SQLite compartido entre workers"""
+
+    def __init__(self, app=None):
+        self.app = app
+        self.default_ttl = 300
+        self.sync_interval = 1.0
+        self.path = None
+        self.local = LocalLRU()
+        self._versions = {}
+        self._last_seq = 0
+        self._last_sync = 0.0
+        self._last_purge = 0.0
+        self._pid = None
+        self._thread_local = threading.local()
+        self._shared_enabled = False
+        self._stats = {'aciertos_local': 0, 'aciertos_compartido': 0, 'fallos': 0, 'escrituras': 0,
+                       'resincronizaciones': 0}
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configurar la caché desde la aplicación Flask"""
+        self.app = app
+        app.cache = self
+
+        app.config.setdefault('CACHE_BACKEND', 'sqlite')
+        app.config.setdefault('CACHE_SQLITE_PATH', None)
+        app.config.setdefault('CACHE_DEFAULT_TTL', 300)
+        app.config.setdefault('CACHE_LOCAL_MAX_ENTRIES', 1024)
+        app.config.setdefault('CACHE_SYNC_INTERVAL', 1.0)
+
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+        self.sync_interval = app.config['CACHE_SYNC_INTERVAL']
+        self.local = LocalLRU(app.config['CACHE_LOCAL_MAX_ENTRIES'])
+        self._shared_enabled = app.config['CACHE_BACKEND'] == 'sqlite'
+
+        if self._shared_enabled:
+            try:
+                # Los valores se leen con pickle: el archivo debe ser privado del proceso
+                self.path = app.config['CACHE_SQLITE_PATH'] or default_path(app, 'domiweb-cache.sqlite3')
+                self._conn()
+                print(f"✅ Caché compartida lista: {self.path}")
+            except (sqlite3.Error, OSError) as e:
+                print(f"⚠️ Caché compartida no disponible ({e}); solo caché en memoria", file=sys.stderr)
+                self._shared_enabled = False
+
+    # =====================================================
+    # Conexión SQLite (una por hilo y por proceso)
+    # =====================================================
+
+    def _conn(self):
+        if self._pid != os.getpid():
+            # Después del fork: conexiones y estado local nuevos
+            self._pid = os.getpid()
+            self._thread_local = threading.local()
+            self.local.clear()
+            self._versions = {}
+            self._last_seq = 0
+            self._last_sync = 0.0
+        conn = getattr(self._thread_local, 'conn', None)
+        if conn is None:
+            ensure_private_file(self.path)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            self._thread_local.conn = conn
+            if not self._last_seq:
+                row = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM cache_invalidations').fetchone()
+                self._last_seq = row[0]
+        return conn
+
+    def _shared(self, operation, default=None):
+        """Ejecutar una operación sobre SQLite; si falla se degrada a solo memoria"""
+        if not self._shared_enabled:
+            return default
+        try:
+            return operation(self._conn())
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️ Error en caché compartida: {e}", file=sys.stderr)
+            return default
+
+    # =====================================================
+    # Versiones e invalidación difundida
+    # =====================================================
+
+    def _version(self, namespace):
+        version = self._versions.get(namespace)
+        if version is None:
+            row = self._shared(lambda conn: conn.execute(
+                'SELECT version FROM cache_versions WHERE namespace = ?', (namespace,)).fetchone())
+            version = row[0] if row else 0
+            self._versions[namespace] = version
+        return version
+
+    def _shared_key(self, namespace, key):
+        return f'{namespace}@{self._version(namespace)}:{key}'
+
+    def _log(self, conn, namespace, key=None, version=None):
+        conn.execute(
+            'INSERT INTO cache_invalidations (namespace, k, version, origin, created_at) VALUES (?, ?, ?, ?, ?)',
+            (namespace, key, version, os.getpid(), time.time())
+        )
+
+    def sync(self, force=False):
+        """Aplicar las invalidaciones hechas por otros workers"""
+        if not self._shared_enabled:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_sync < self.sync_interval:
+            return
+        self._last_sync = now
+
+        # Si el log se purgó más allá de lo último leído (worker inactivo más de
+        # una hora) se perdieron invalidaciones: se descarta todo lo local y las
+        # versiones se vuelven a leer de cache_versions
+        bounds = self._shared(lambda conn: conn.execute("""
+            SELECT (SELECT MIN(seq) FROM cache_invalidations),
+                   (SELECT seq FROM sqlite_sequence WHERE name = 'cache_invalidations')
+        """).fetchone())
+        if bounds:
+            first_seq, last_seq = bounds
+            if last_seq and last_seq > self._last_seq and (first_seq is None or first_seq > self._last_seq + 1):
+                self._stats['resincronizaciones'] += 1
+                self._versions = {}
+                self.local.clear()
+                self._last_seq = last_seq
+                return
+
+        rows = self._shared(lambda conn: conn.execute(
+            'SELECT seq, namespace, k, version, origin FROM cache_invalidations WHERE seq > ? ORDER BY seq',
+            (self._last_seq,)).fetchall(), default=[])
+        for seq, namespace, key, version, origin in rows:
+            self._last_seq = seq
+            if origin == os.getpid():
+                continue
+            if key is None:
+                self._versions[namespace] = version
+                self.local.delete_namespace(namespace)
+            else:
+                self.local.delete((namespace, key))
+
+        if now - self._last_purge > 60:
+            self._last_purge = now
+            self._purge()
+
+    def _purge(self):
+        """Borrar entradas vencidas y log de invalidaciones antiguo"""
+        def purge(conn):
+            conn.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (time.time(),))
+            conn.execute('DELETE FROM cache_invalidations WHERE created_at <= ?', (time.time() - 3600,))
+        self._shared(purge)
+
+    # =====================================================
+    # API pública
+    # =====================================================
+
+    def get(self, namespace, key, default=None):
+        """Obtener un valor (memoria → SQLite)"""
+        self.sync()
+        value = self.local.get((namespace, key))
+        if value is not _MISSING:
+            self._stats['aciertos_local'] += 1
+            return value
+
+        row = self._shared(lambda conn: conn.execute(
+            'SELECT value, expires_at FROM cache_entries WHERE k = ? AND expires_at > ?',
+            (self._shared_key(namespace, key), time.time())).fetchone())
+        if row:
+            try:
+                value = pickle.loads(row[0])
+            except Exception:
+                value = _MISSING
+            if value is not _MISSING:
+                self.local.set((namespace, key), value, row[1])
+                self._stats['aciertos_compartido'] += 1
+                return value
+
+        self._stats['fallos'] += 1
+        return default
+
+    def set(self, namespace, key, value, ttl=None):
+        """Guardar un valor en ambos niveles y avisar a los demás workers"""
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        self.local.set((namespace, key), value, expires_at)
+        self._stats['escrituras'] += 1
+
+        def store(conn):
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            conn.execute('INSERT OR REPLACE INTO cache_entries (k, value, expires_at) VALUES (?, ?, ?)',
+                         (self._shared_key(namespace, key), payload, expires_at))
+            self._log(conn, namespace, key)
+        self._shared(store)
+
+    def delete(self, namespace, key):
+        """Borrar una clave en todos los workers"""
+        self.local.delete((namespace, key))
+
+        def remove(conn):
+            conn.execute('DELETE FROM cache_entries WHERE k = ?', (self._shared_key(namespace, key),))
+            self._log(conn, namespace, key)
+        self._shared(remove)
+
+    def bump(self, namespace):
+        """Invalidar todo un namespace incrementando su versión"""
+        self.local.delete_namespace(namespace)
+
+        def increment(conn):
+            row = conn.execute("""
+                INSERT INTO cache_versions (namespace, version) VALUES (?, 1)
+                ON CONFLICT (namespace) DO UPDATE SET version = version + 1
+                RETURNING version
+            """, (namespace,)).fetchone()
+            self._log(conn, namespace, None, row[0])
+            return row[0]
+        version = self._shared(increment)
+        self._versions[namespace] = version if version is not None else self._versions.get(namespace, 0) + 1
+        return self._versions[namespace]
+
+    def version(self, namespace):
+        """Versión actual de un namespace (útil como validador o sello)"""
+        self.sync()
+        return self._version(namespace)
+
+    def get_or_set(self, namespace, key, loader, ttl=None):
+        """Obtener un valor o calcularlo con loader() y guardarlo"""
+        value = self.get(namespace, key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(namespace, key, value, ttl)
+        return value
+
+    # =====================================================
+    # Locks entre workers
+    # =====================================================
+
+    @staticmethod
+    def _lock_owner():
+        return f'{os.getpid()}:{threading.get_ident()}'
+
+    def acquire_lock(self, name, ttl):
+        """
+        Intentar tomar un lock compartido por todos los workers (no bloquea).
+        Vence solo a los ttl segundos por si el worker que lo tiene muere.
+        Sin SQLite siempre se obtiene (solo hay un proceso que coordinar).
+        """
+        def acquire(conn):
+            now = time.time()
+            conn.execute('DELETE FROM cache_locks WHERE name = ? AND expires_at <= ?', (name, now))
+            cursor = conn.execute('INSERT OR IGNORE INTO cache_locks (name, owner, expires_at) VALUES (?, ?, ?)',
+                                  (name, self._lock_owner(), now + ttl))
+            return cursor.rowcount == 1
+        return self._shared(acquire, default=True)
+
+    def lock_owner(self):
+        """Dueño de los locks tomados por este hilo (para liberarlos desde otro)"""
+        return self._lock_owner()
+
+    def release_lock(self, name, owner=None):
+        """Liberar un lock tomado por este hilo (o por owner)"""
+        self._shared(lambda conn: conn.execute('DELETE FROM cache_locks WHERE name = ? AND owner = ?',
+                                               (name, owner or self._lock_owner())))
+
+    def clear(self):
+        """Vaciar la caché completa (todos los workers)"""
+        namespaces = set(self._shared(lambda conn: [row[0] for row in conn.execute(
+            'SELECT namespace FROM cache_versions UNION SELECT namespace FROM cache_invalidations')], default=[]))
+        namespaces.update(self.local.namespaces())
+        self._shared(lambda conn: conn.execute('DELETE FROM cache_entries'))
+        for namespace in namespaces:
+            self.bump(namespace)
+
+    def stats(self):
+        """Estadísticas del worker actual"""
+        shared = self._shared(lambda conn: conn.execute(
+            'SELECT COUNT(*) FROM cache_entries WHERE expires_at > ?', (time.time(),)).fetchone()[0])
+        return {
+            **self._stats,
+            'backend': 'sqlite' if self._shared_enabled else 'local',
+            'entradas_local': len(self.local),
+            'entradas_compartidas': shared,
+        }
+
+
+# Instancia global de la caché
+cache = SharedCache()
@@ -0,0 +1,49 @@
+"""
+🏷️ Caché de la lista de categorías
+La tabla categorias solo cambia desde admin.add_category / admin.delete_category.
+La lista se guarda en la caché compartida (namespace 'categorias') y esas
+rutas incrementan la versión del namespace, lo que la refresca en todos
+los workers. El resto del tiempo las páginas de productos no consultan la BD.
+"""
+
+from utils.cache import cache
+from utils.db_helpers import execute_query, primary_reads
+
+NAMESPACE = 'categorias'
+
+
+class CategoryCache:
+    """Lista de categorías versionada"""
+
+    def __init__(self, app=None):
+        self.app = app
+        self.ttl = 3600
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Registrar la caché en la aplicación Flask"""
+        self.app = app
+        app.category_cache = self
+        app.config.setdefault('CATEGORY_CACHE_TTL', 3600)
+        self.ttl = app.config['CATEGORY_CACHE_TTL']
+
+    def get_all(self):
+        """Obtener [{'idcat', 'tipcat'}, ...] (consulta la BD solo si cambió la versión)"""
+        return cache.get_or_set(NAMESPACE, 'lista', self._load, ttl=self.ttl)
+
+    def _load(self):
+        with primary_reads():
+            return list(execute_query("SELECT idcat, tipcat FROM categorias ORDER BY idcat"))
+
+    def invalidate(self):
+        """Nueva versión de categorías (llamar después de crear o eliminar una)"""
+        return cache.bump(NAMESPACE)
+
+    def version(self):
+        """Versión actual de la lista (sirve como validador de caché HTTP)"""
+        return cache.version(NAMESPACE)
+
+
+# Instancia global de la caché de categorías
+category_cache = CategoryCache()
@@ -0,0 +1,132 @@
+"""
+📡 GET condicional (ETag / Last-Modified) para páginas que se refrescan seguido
+Cada vista declara un validador barato (versión de catálogo, sello en la caché
+compartida, un COUNT/MAX sobre pedidos...). Si el navegador ya tiene esa
+versión (If-None-Match / If-Modified-Since) se responde 304 antes de ejecutar
+las consultas pesadas y de renderizar la plantilla.
+
+Uso:
+    @cliente_bp.route("/menu")
+    @login_required
+    @conditional_get(lambda: {'etag': ('menu', menu_cache.version())})
+    def menu(): ...
+
+El validador recibe los mismos argumentos que la vista y devuelve un dict con
+'etag' (cualquier valor serializable con repr) y opcionalmente
+'last_modified' (datetime con zona horaria), o None para no usar caché HTTP.
+
+Con only_if_conditional=True el validador solo se consulta si el navegador
+envía If-None-Match / If-Modified-Since; en los demás requests la vista
+calcula los mismos validadores con la consulta que ya ejecuta y los entrega
+con set_validators() (sin un viaje extra a la BD).
+
+La ETag incluye el usuario de la sesión (la barra de navegación es personal)
+y un sello de las plantillas, así un despliegue nuevo no sirve HTML viejo.
+Sellos: stamp(nombre) / bump_stamp(nombre) guardan contadores en la caché
+compartida para datos que no tienen una fecha de modificación en la BD.
+"""
+
+import hashlib
+import os
+from functools import wraps
+from flask import current_app, g, request, session
+from utils.cache import cache
+
+STAMP_PREFIX = 'sello:'
+
+
+def stamp(name):
+    """Versión actual de un sello (0 si nunca se renovó)"""
+    return cache.version(STAMP_PREFIX + name)
+
+
+def bump_stamp(name):
+    """Renovar un sello: las ETag que lo incluyen dejan de coincidir"""
+    return cache.bump(STAMP_PREFIX + name)
+
+
+def _templates_stamp(app):
+    """Fecha de modificación más reciente de las plantillas (se calcula una vez)"""
+    cached = app.extensions.get('conditional_get_templates')
+    if cached is None:
+        latest = 0
+        for root, _dirs, files in os.walk(os.path.join(app.root_path, app.template_folder or 'templates')):
+            for name in files:
+                latest = max(latest, os.stat(os.path.join(root, name)).st_mtime_ns)
+        cached = app.extensions['conditional_get_templates'] = latest
+    return cached
+
+
+def _make_etag(parts):
+    """ETag de la respuesta: validador de la vista + usuario + plantillas"""
+    key = repr((
+        request.endpoint,
+        session.get('usuario_id'),
+        session.get('role'),
+        session.get('user_name'),
+        _templates_stamp(current_app),
+        parts,
+    ))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def set_validators(validators):
+    """Validadores calculados por la vista (conditional_get con only_if_conditional)"""
+    g.conditional_validators = validators
+
+
+def _with_validators(response, etag, last_modified):
+    """Agregar ETag, Last-Modified y Cache-Control a la respuesta"""
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Página personal: el navegador la guarda pero siempre revalida
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def conditional_get(validator, only_if_conditional=False):
+    """
+    Decorador: responder 304 si el cliente ya tiene la versión actual de la página.
+    Solo aplica a GET/HEAD y no cuando hay mensajes flash pendientes
+    (se mostrarían en la página que el navegador no va a volver a pedir).
+    only_if_conditional: el validador solo corre si el request es condicional;
+    si no, se usan los que la vista entregó con set_validators().
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or not current_app.config.get('CONDITIONAL_GET', True)
+                    or session.get('_flashes')):
+                return f(*args, **kwargs)
+
+            if only_if_conditional and not (request.if_none_match or request.if_modified_since):
+                response = current_app.make_response(f(*args, **kwargs))
+                validators = g.pop('conditional_validators', None)
+                if validators and response.status_code == 200:
+                    _with_validators(response, _make_etag(validators.get('etag')),
+                                     validators.get('last_modified'))
+                return response
+
+            validators = validator(*args, **kwargs)
+            if not validators:
+                return f(*args, **kwargs)
+
+            etag = _make_etag(validators.get('etag'))
+            last_modified = validators.get('last_modified')
+
+            # 304 sin ejecutar la vista
+            response = _with_validators(current_app.response_class(), etag, last_modified)
+            response.make_conditional(request)
+            if response.status_code == 304:
+                return response
+
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                _with_validators(response, etag, last_modified)
+            return response
+
+        return decorated_function
+    return decorator
@@ -1,26 +1,38 @@
 """
 🗄️ Utilidades para manejo seguro de base de datos PostgreSQL
-Proporciona funciones para reconexión automática y manejo de errores
+Proporciona funciones para reconexión automática y manejo de errores.
+Todas las operaciones usan la conexión del request tomada del pool (utils/db_pool.py):
+las consultas de solo lectura pueden ir a la réplica y las escrituras van al primario
 """
 
-from flask import current_app
+from flask import current_app, g
 import psycopg
 from psycopg.rows import dict_row
+from utils.prepared_statements import prepared_statements
 import functools
 import time
+from contextlib import contextmanager
 
 
-def safe_db_operation(f):
+def _db_operation(f, read_only):
     """
-    Decorador para operaciones de base de datos con reconexión automática
+    Envoltura común con reconexión automática.
+    La conexión no se valida antes de usarse; si falla con un error de
+    conexión se descarta, se toma otra del pool y se reintenta.
     """
     @functools.wraps(f)
     def decorated_function(*args, **kwargs):
         max_retries = 3
+        db_pool = current_app.db_pool
         for attempt in range(max_retries):
+            db = None
             try:
-                # Obtener conexión segura
-                db = current_app.get_db()
+                # Lecturas: réplica si está disponible; escrituras: primario
+                if read_only:
+                    db = db_pool.get_read_connection()
+                else:
+                    db = db_pool.get_write_connection()
+                    db_pool.mark_write()
                 if db is None:
                     raise Exception("No se pudo conectar a la base de datos")
                 
@@ -31,9 +43,10 @@ def safe_db_operation(f):
                 print(f"🔄 Intento {attempt + 1}/{max_retries} - Error de BD: {e}")
                 
                 if attempt < max_retries - 1:
-                    # Forzar reconexión
-                    current_app.db = None
-                    time.sleep(0.5)  # Esperar medio segundo
+                    # Descartar la conexión rota; el pool entrega una nueva
+                    db_pool.discard_connection(db)
+                    if attempt > 0:
+                        time.sleep(0.5)  # Esperar solo si la reconexión ya falló una vez
                     continue
                 else:
                     # Si fallaron todos los intentos
@@ -47,12 +60,58 @@ def safe_db_operation(f):
     return decorated_function
 
 
-@safe_db_operation
-def execute_query(db, query, params=None):
+def safe_db_operation(f):
     """
-    Ejecutar una consulta SELECT de forma segura
+    Decorador para operaciones de base de datos con reconexión automática.
+    Usa siempre el primario y fija el request al primario (read-your-writes).
     """
-    cursor = db.cursor()
+    return _db_operation(f, read_only=False)
+
+
+def safe_read_operation(f):
+    """
+    Decorador para consultas de solo lectura con reconexión automática.
+    Usa la réplica si está configurada (DB_REPLICA_URL) y el request no
+    está fijado al primario por una escritura reciente.
+    """
+    return _db_operation(f, read_only=True)
+
+
+def read_only_route(f):
+    """
+    Marcar una ruta como de solo lectura: todas sus consultas
+    (incluidas las de current_app.get_db()) pueden ir a la réplica
+    """
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.db_read_route = True
+        return f(*args, **kwargs)
+    
+    return decorated_function
+
+
+@contextmanager
+def primary_reads():
+    """
+    Leer del primario dentro del bloque aunque haya réplica.
+    Se usa al llenar cachés: una réplica atrasada dejaría datos viejos
+    guardados durante todo el TTL.
+    """
+    previous = g.get('db_force_primary', False)
+    g.db_force_primary = True
+    try:
+        yield
+    finally:
+        g.db_force_primary = previous
+
+
+@safe_read_operation
+def execute_query(db, query, params=None, row_factory=None):
+    """
+    Ejecutar una consulta SELECT de forma segura.
+    row_factory: opcional (ej. record_row(...) de utils/records.py) para filas compactas
+    """
+    cursor = db.cursor(row_factory=row_factory) if row_factory else db.cursor()
     try:
         cursor.execute(query, params or ())
         result = cursor.fetchall()
@@ -61,12 +120,12 @@ def execute_query(db, query, params=None):
         cursor.close()
 
 
-@safe_db_operation
-def execute_query_one(db, query, params=None):
+@safe_read_operation
+def execute_query_one(db, query, params=None, row_factory=None):
     """
     Ejecutar una consulta SELECT que devuelve un solo resultado
     """
-    cursor = db.cursor()
+    cursor = db.cursor(row_factory=row_factory) if row_factory else db.cursor()
     try:
         cursor.execute(query, params or ())
         result = cursor.fetchone()
@@ -75,6 +134,59 @@ def execute_query_one(db, query, params=None):
         cursor.close()
 
 
+@safe_read_operation
+def execute_prepared(db, name, params=None):
+    """
+    Ejecutar por nombre una sentencia registrada en utils/prepared_statements.py
+    (preparada en el servidor una vez por conexión) y devolver todas las filas
+    """
+    cursor = prepared_statements.execute(db, name, params)
+    try:
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+@safe_read_operation
+def execute_prepared_one(db, name, params=None):
+    """
+    Ejecutar por nombre una sentencia registrada y devolver una sola fila
+    """
+    cursor = prepared_statements.execute(db, name, params)
+    try:
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+@safe_read_operation
+def execute_pipeline(db, statements):
+    """
+    Ejecutar varias consultas en modo pipeline de psycopg:
+    todas se envían juntas y se sincronizan en un solo viaje de red.
+    
+    Args:
+        statements: Lista de tuplas (query, params)
+    
+    Returns:
+        list: Filas de cada consulta en el mismo orden
+              (None para sentencias que no devuelven filas)
+    """
+    cursors = []
+    try:
+        with db.pipeline():
+            for query, params in statements:
+                cursor = db.cursor()
+                cursors.append(cursor)
+                cursor.execute(query, params or ())
+        
+        # Al salir del bloque pipeline todos los resultados ya llegaron
+        return [cursor.fetchall() if cursor.description else None for cursor in cursors]
+    finally:
+        for cursor in cursors:
+            cursor.close()
+
+
 @safe_db_operation
 def execute_insert(db, query, params=None):
     """
@@ -0,0 +1,246 @@
+"""
+🗄️ Pool de conexiones PostgreSQL por worker
+Cada proceso de gunicorn mantiene su propio pool con tamaño mínimo/máximo
+configurable. Cada request toma una conexión del pool, la guarda en flask.g
+y la devuelve al pool al finalizar (teardown).
+
+Las conexiones no se validan con una consulta en cada checkout: solo se
+verifican si estuvieron inactivas más de DB_POOL_CHECK_IDLE_SECONDS o si
+hubo un error de conexión (OperationalError) después de que se devolvieron.
+
+Enrutamiento lectura/escritura:
+- Si DB_REPLICA_URL está configurada, las lecturas (helpers de solo lectura
+  y rutas marcadas con @read_only_route) van a un segundo pool de réplica.
+- Las escrituras siempre van al primario.
+- Después de una escritura el request queda fijado al primario, y durante
+  DB_READ_YOUR_WRITES_SECONDS también los siguientes requests del cliente
+  (cookie), para que siempre lea lo que acaba de escribir.
+"""
+
+import os
+import sys
+import time
+import weakref
+from flask import g, has_request_context, request
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool, PoolTimeout
+from utils.query_stats import InstrumentedCursor
+
+PRIMARY = 'primary'
+REPLICA = 'replica'
+
+# Atributo de flask.g donde vive la conexión de cada pool durante el request
+_G_ATTR = {PRIMARY: 'db', REPLICA: 'db_replica'}
+
+PRIMARY_PIN_COOKIE = 'db_primary_until'
+
+
+class DatabasePool:
+    """Gestor del pool de conexiones PostgreSQL de la aplicación"""
+
+    def __init__(self, app=None):
+        self.app = app
+        self.pools = {}
+        self._pid = None
+        # Momento (monotonic) en que cada conexión quedó libre en el pool
+        self._idle_since = weakref.WeakKeyDictionary()
+        # Conexiones liberadas antes de este instante se validan al reutilizarlas
+        self._suspect_before = 0.0
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Registrar el pool en la aplicación Flask"""
+        self.app = app
+        app.db_pool = self
+
+        # Configuraciones por defecto
+        app.config.setdefault('DB_POOL_MIN_SIZE', 2)
+        app.config.setdefault('DB_POOL_MAX_SIZE', 10)
+        app.config.setdefault('DB_POOL_TIMEOUT', 10)
+        app.config.setdefault('DB_POOL_CHECK_IDLE_SECONDS', 30)
+        app.config.setdefault('DB_REPLICA_URL', None)
+        app.config.setdefault('DB_READ_YOUR_WRITES_SECONDS', 5)
+
+        app.get_db = self.get_connection
+        app.get_read_db = self.get_read_connection
+        app.after_request(self._pin_after_write)
+        app.teardown_appcontext(self.release_connection)
+
+    @property
+    def has_replica(self):
+        return bool(self.app.config.get('DB_REPLICA_URL'))
+
+    def _create_pool(self, role):
+        """Crear el pool (primario o réplica) con los parámetros de la app"""
+        config = self.app.config
+        kwargs = {
+            'row_factory': dict_row,
+            'cursor_factory': InstrumentedCursor,  # 📊 métricas por consulta (utils/query_stats.py)
+            'connect_timeout': 10,
+            'autocommit': True,
+        }
+        if role == PRIMARY:
+            conninfo = ''
+            kwargs.update({
+                'host': config['DB_HOST'],
+                'user': config['DB_USER'],
+                'password': config['DB_PASSWORD'],
+                'dbname': config['DB_NAME'],
+            })
+            destino = f"{config['DB_HOST']}/{config['DB_NAME']}"
+        else:
+            conninfo = config['DB_REPLICA_URL']
+            destino = 'réplica'
+
+        pool = ConnectionPool(
+            conninfo,
+            kwargs=kwargs,
+            min_size=config['DB_POOL_MIN_SIZE'],
+            max_size=config['DB_POOL_MAX_SIZE'],
+            timeout=config['DB_POOL_TIMEOUT'],
+            configure=self._mark_idle,
+            check=self._check_connection,
+            name=f"domiweb-{role}-{os.getpid()}",
+            open=True,
+        )
+        print(f"✅ Pool PostgreSQL listo ({role}): {destino} "
+              f"(min={config['DB_POOL_MIN_SIZE']}, max={config['DB_POOL_MAX_SIZE']}, pid={os.getpid()})")
+        return pool
+
+    def _mark_idle(self, conn):
+        """Registrar el momento en que la conexión queda disponible"""
+        self._idle_since[conn] = time.monotonic()
+
+    def _check_connection(self, conn):
+        """
+        Validar la conexión solo si es necesario (sin round trip en estado estable):
+        - estuvo inactiva más de DB_POOL_CHECK_IDLE_SECONDS
+        - hubo un error de conexión después de que se liberó
+        """
+        idle_since = self._idle_since.get(conn, 0.0)
+        max_idle = self.app.config['DB_POOL_CHECK_IDLE_SECONDS']
+        if idle_since >= self._suspect_before and time.monotonic() - idle_since < max_idle:
+            return
+        ConnectionPool.check_connection(conn)
+
+    def get_pool(self, role=PRIMARY):
+        """
+        Obtener el pool del proceso actual.
+        Se abre de forma perezosa para que cada worker de gunicorn
+        (incluso con preload) tenga su propio pool después del fork.
+        """
+        if self._pid != os.getpid():
+            self.pools = {}
+            self._pid = os.getpid()
+        if role not in self.pools:
+            self.pools[role] = self._create_pool(role)
+        return self.pools[role]
+
+    def _checkout(self, role):
+        """Tomar (una sola vez por request) una conexión del pool indicado"""
+        attr = _G_ATTR[role]
+        if attr not in g:
+            conn = self.get_pool(role).getconn()
+            setattr(g, attr, conn)
+        return getattr(g, attr)
+
+    def get_connection(self):
+        """
+        Obtener la conexión del request actual.
+        En rutas marcadas como de solo lectura se delega a get_read_connection.
+        En POST/PUT/DELETE la conexión del primario (app.get_db()) se usa para
+        escribir sin pasar por safe_db_operation: el resto del request también
+        lee del primario (read-your-writes dentro del mismo request).
+        """
+        if g.get('db_read_route'):
+            return self.get_read_connection()
+        if has_request_context() and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            self.mark_write()
+        return self.get_write_connection()
+
+    def get_write_connection(self):
+        """Conexión al primario (escrituras y lecturas que deben ver lo último)"""
+        try:
+            return self._checkout(PRIMARY)
+        except PoolTimeout as e:
+            print(f"❌ Error obteniendo conexión del pool: {e}", file=sys.stderr)
+            print(f"Host: {self.app.config['DB_HOST']}, DB: {self.app.config['DB_NAME']}", file=sys.stderr)
+            return None
+
+    def get_read_connection(self):
+        """
+        Conexión para lecturas: réplica si está configurada y el request no
+        está fijado al primario; si la réplica no responde se usa el primario.
+        """
+        if not self.has_replica or self.is_pinned_to_primary():
+            return self.get_write_connection()
+        try:
+            return self._checkout(REPLICA)
+        except PoolTimeout as e:
+            print(f"⚠️ Réplica no disponible, leyendo del primario: {e}", file=sys.stderr)
+            return self.get_write_connection()
+
+    def mark_write(self):
+        """Registrar que el request escribió: se fija al primario (read-your-writes)"""
+        g.db_wrote = True
+
+    def is_pinned_to_primary(self):
+        """El request (o una escritura reciente del mismo cliente) exige el primario"""
+        if g.get('db_wrote') or g.get('db_force_primary'):
+            return True
+        try:
+            return float(request.cookies.get(PRIMARY_PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _pin_after_write(self, response):
+        """Fijar al primario los próximos requests del cliente tras una escritura"""
+        if not self.has_replica:
+            return response
+        if g.get('db_wrote') or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            seconds = self.app.config['DB_READ_YOUR_WRITES_SECONDS']
+            response.set_cookie(PRIMARY_PIN_COOKIE, str(int(time.time() + seconds)),
+                                max_age=seconds, httponly=True, samesite='Lax')
+        return response
+
+    def release_connection(self, error=None):
+        """Devolver las conexiones del request a sus pools (teardown)"""
+        for role, attr in _G_ATTR.items():
+            conn = g.pop(attr, None)
+            if conn is None or role not in self.pools:
+                continue
+            if conn.broken:
+                # La conexión se rompió durante el request: validar las demás
+                self._suspect_before = time.monotonic()
+            self._mark_idle(conn)
+            self.pools[role].putconn(conn)
+
+    def discard_connection(self, conn=None):
+        """
+        Cerrar una conexión rota del request (por defecto todas) para que el
+        pool la reemplace. Las demás conexiones libres se validarán antes de
+        reutilizarse, ya que probablemente el servidor se reinició o la red falló.
+        """
+        self._suspect_before = time.monotonic()
+        for role, attr in _G_ATTR.items():
+            current = g.get(attr)
+            if current is None or (conn is not None and current is not conn):
+                continue
+            g.pop(attr)
+            current.close()
+            if role in self.pools:
+                self.pools[role].putconn(current)
+
+    def stats(self):
+        """Estadísticas de los pools del proceso actual"""
+        if self._pid != os.getpid() or not self.pools:
+            return {'status': 'closed'}
+        stats = {'status': 'open'}
+        for role, pool in self.pools.items():
+            stats[role] = pool.get_stats()
+        return stats
+
+
+# Instancia global del pool
+db_pool = DatabasePool()
@@ -106,6 +106,25 @@ class DeliveryCalculator:
         
         return tiempo_total
     
+    @staticmethod
+    def parametros_checkout():
+        """
+        Parámetros para la función SQL procesar_checkout, que calcula el
+        tiempo estimado dentro de la misma transacción del pedido.
+        Los factores aleatorios (tráfico, buffer, ubicación simulada) se
+        generan aquí para mantener la misma simulación que calcular_tiempo_estimado.
+        """
+        lat, lng = DeliveryCalculator.generar_ubicacion_usuario_simulada()
+        return {
+            'velocidad_kmh': DeliveryCalculator.VELOCIDAD_PROMEDIO_KMH,
+            'preparacion_base': DeliveryCalculator.TIEMPO_PREPARACION_BASE,
+            'extra_por_producto': DeliveryCalculator.TIEMPO_EXTRA_POR_PRODUCTO,
+            'factor_trafico': random.uniform(1.1, 1.4),
+            'buffer_minutos': random.randint(3, 8),
+            'lat_simulada': lat,
+            'lng_simulada': lng
+        }
+    
     @staticmethod
     def obtener_ubicacion_restaurante(idres):
         """Obtiene las coordenadas del restaurante desde la BD"""
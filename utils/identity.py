@@ -0,0 +1,74 @@
+"""
+🪪 Identidad del usuario logueado: idres (restaurante) e idrep (repartidor)
+Casi todas las rutas de restaurante y repartidor necesitan esos ids y antes
+los buscaban con una consulta extra en cada request. Se resuelven así:
+1. g (una sola vez por request)
+2. Caché compartida (namespace 'identidad'), válida en todos los workers
+3. La BD, solo si no estaba en caché
+
+Un usuario sin restaurante/repartidor devuelve None y no se guarda en caché
+(el registro puede crearse después, p. ej. el repartidor automático).
+invalidate(usuario_id) se llama cuando cambia el rol del usuario.
+
+Uso:
+    idres = identity.restaurante_id()
+    idrep = identity.repartidor_id()
+"""
+
+from flask import g, session
+from utils.cache import cache
+from utils.db_helpers import execute_query_one
+
+NAMESPACE = 'identidad'
+
+# Tipo de entidad -> consulta que la resuelve a partir de idusu
+_CONSULTAS = {
+    'restaurante': ("SELECT idres FROM restaurantes WHERE idusu = %s", 'idres'),
+    'repartidor': ("SELECT idrep FROM repartidores WHERE idusu = %s", 'idrep'),
+}
+
+
+class Identity:
+    """Resolución cacheada de usuario -> restaurante / repartidor"""
+
+    def _resolve(self, tipo, usuario_id):
+        if usuario_id is None:
+            usuario_id = session.get("usuario_id")
+        if usuario_id is None:
+            return None
+
+        por_request = g.setdefault('identidad', {})
+        clave = f'{tipo}:{usuario_id}'
+        if clave in por_request:
+            return por_request[clave]
+
+        valor = cache.get(NAMESPACE, clave)
+        if valor is None:
+            consulta, columna = _CONSULTAS[tipo]
+            fila = execute_query_one(consulta, (usuario_id,))
+            valor = fila[columna] if fila else None
+            if valor is not None:
+                cache.set(NAMESPACE, clave, valor)
+
+        por_request[clave] = valor
+        return valor
+
+    def restaurante_id(self, usuario_id=None):
+        """idres del usuario (por defecto el de la sesión) o None"""
+        return self._resolve('restaurante', usuario_id)
+
+    def repartidor_id(self, usuario_id=None):
+        """idrep del usuario (por defecto el de la sesión) o None"""
+        return self._resolve('repartidor', usuario_id)
+
+    def invalidate(self, usuario_id):
+        """Olvidar los ids de un usuario (cambio de rol o de registro asociado)"""
+        por_request = g.get('identidad', {})
+        for tipo in _CONSULTAS:
+            clave = f'{tipo}:{usuario_id}'
+            por_request.pop(clave, None)
+            cache.delete(NAMESPACE, clave)
+
+
+# Instancia global
+identity = Identity()
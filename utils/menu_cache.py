@@ -0,0 +1,212 @@
+"""
+🍽️ Caché del menú de clientes (cliente.menu)
+Guarda la estructura ya agrupada que recibe la plantilla en la caché
+compartida (utils/cache.py, namespace 'menu'), así todos los workers
+usan la misma copia:
+- Una entrada por restaurante activo: nombre, productos y categorías
+- Un índice con el orden de los restaurantes activos (por nombre)
+
+Invalidación selectiva (se difunde a todos los workers):
+- invalidate_restaurant(idres): crear/editar/eliminar/importar productos
+  o cambiar datos del restaurante; solo se recarga esa entrada
+- invalidate_index(): restaurantes nuevos, cambios de nombre o de estado
+
+MENU_CACHE_TTL es una red de seguridad para cambios hechos fuera de la app.
+Las recargas pasan por single-flight (utils/single_flight.py): si el menú
+vence en hora pico, un solo request por worker consulta la BD.
+
+Cada invalidación renueva además sellos (utils/conditional_get.py) que
+sirven de validador HTTP: 'menu' para cliente.menu y 'productos:{idres}'
+para restaurante.listar_productos.
+
+Las claves llevan el sello vigente al iniciar la carga ('indice@3',
+'restaurante:5@7'): una carga que empezó antes de una invalidación hecha en
+otro worker guarda bajo el sello viejo y nadie la vuelve a leer.
+"""
+
+import time
+from utils.cache import cache
+from utils.conditional_get import stamp, bump_stamp
+from utils.single_flight import single_flight
+from utils.db_helpers import execute_prepared, primary_reads
+
+NAMESPACE = 'menu'
+INDEX_KEY = 'indice'
+INDEX_STAMP = 'menu:indice'
+
+
+def _restaurant_stamp(idres):
+    return stamp(f'productos:{idres}')
+
+
+def _entry_key(idres, version):
+    return f'restaurante:{idres}@{version}'
+
+
+def _index_key(version):
+    return f'{INDEX_KEY}@{version}'
+
+
+class MenuCache:
+    """Menú agrupado por restaurante con invalidación por entrada"""
+
+    def __init__(self, app=None):
+        self.app = app
+        self.ttl = 300
+        self._stats = {'aciertos': 0, 'recargas_completas': 0, 'recargas_parciales': 0}
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Registrar la caché en la aplicación Flask"""
+        self.app = app
+        app.menu_cache = self
+        app.config.setdefault('MENU_CACHE_TTL', 300)
+        self.ttl = app.config['MENU_CACHE_TTL']
+
+    def get_menu(self):
+        """
+        Obtener el menú {idres: {'nombre', 'productos', 'categorias'}}.
+        Solo consulta la BD para las entradas que faltan o vencieron.
+        """
+        index = cache.get(NAMESPACE, _index_key(stamp(INDEX_STAMP)))
+        if index is None:
+            # Carga en frío coalescida: los demás requests esperan el resultado
+            return single_flight.run(f'{NAMESPACE}:{INDEX_KEY}', self._load_full, ready=self._cached_menu)
+
+        menus, faltantes = self._cached_entries(index)
+        if faltantes:
+            clave = f"{NAMESPACE}:restaurantes:{','.join(map(str, faltantes))}"
+            menus.update(single_flight.run(
+                clave,
+                lambda: self._load_restaurants(faltantes),
+                ready=lambda: self._cached_complete(faltantes)
+            ))
+        else:
+            self._stats['aciertos'] += 1
+
+        return {idres: menus[idres] for idres in index if idres in menus}
+
+    @staticmethod
+    def _cached_entries(ids):
+        """Entradas en caché de esos restaurantes y lista de las que faltan"""
+        menus = {}
+        faltantes = []
+        for idres in ids:
+            menu = cache.get(NAMESPACE, _entry_key(idres, _restaurant_stamp(idres)))
+            if menu is None:
+                faltantes.append(idres)
+            else:
+                menus[idres] = menu
+        return menus, faltantes
+
+    def _cached_complete(self, ids):
+        """Entradas de esos restaurantes si están todas en caché, si no None"""
+        menus, faltantes = self._cached_entries(ids)
+        return None if faltantes else menus
+
+    def _cached_menu(self):
+        """Menú completo si ya está todo en caché (otro request lo cargó), si no None"""
+        index = cache.get(NAMESPACE, _index_key(stamp(INDEX_STAMP)))
+        if index is None:
+            return None
+        menus = self._cached_complete(index)
+        if menus is None:
+            return None
+        return {idres: menus[idres] for idres in index}
+
+    def invalidate_restaurant(self, idres):
+        """Descartar la entrada de un restaurante (se recarga en la próxima visita)"""
+        # 'menu' antes que el sello del restaurante: ver _load_full
+        bump_stamp('menu')
+        bump_stamp(f'productos:{idres}')
+
+    def invalidate_index(self):
+        """Descartar el índice de restaurantes activos"""
+        bump_stamp('menu')
+        bump_stamp(INDEX_STAMP)
+
+    def invalidate_all(self):
+        """Descartar todo el menú"""
+        cache.bump(NAMESPACE)
+        bump_stamp('menu')
+
+    def version(self):
+        """
+        Validador del menú completo: sello de invalidaciones + ventana del TTL
+        (los cambios hechos fuera de la app aparecen al vencer la ventana)
+        """
+        return (stamp('menu'), int(time.time() // self.ttl) if self.ttl else 0)
+
+    def restaurant_version(self, idres):
+        """Validador de los productos de un restaurante (mismo criterio que version)"""
+        return (stamp(f'productos:{idres}'), int(time.time() // self.ttl) if self.ttl else 0)
+
+    @staticmethod
+    def _group(rows):
+        """Agrupar filas FilaMenu por restaurante (en el orden de la consulta)"""
+        restaurantes = {}
+        for row in rows:
+            menu = restaurantes.get(row.idres)
+            if menu is None:
+                menu = restaurantes[row.idres] = {
+                    'nombre': row.nomres,
+                    'productos': [],
+                    'categorias': set()
+                }
+            if row.idpro:  # Si el restaurante tiene productos
+                # La fila (registro FilaMenu) se usa directamente como producto
+                menu['productos'].append(row)
+                if row.tipcat:
+                    menu['categorias'].add(row.tipcat)
+        for menu in restaurantes.values():
+            menu['categorias'] = list(menu['categorias'])
+        return restaurantes
+
+    def _store(self, restaurantes, versions):
+        """Guardar cada entrada bajo el sello leído antes de la consulta"""
+        for idres, menu in restaurantes.items():
+            cache.set(NAMESPACE, _entry_key(idres, versions[idres]), menu, ttl=self.ttl)
+
+    def _load_full(self):
+        """Carga en frío: una sola consulta para todo el menú y el índice"""
+        # Sellos compartidos actualizados (invalidaciones de otros workers)
+        cache.sync(force=True)
+        menu_version = stamp('menu')
+        index_version = stamp(INDEX_STAMP)
+
+        with primary_reads():
+            restaurantes = self._group(execute_prepared('cliente_menu'))
+        self._stats['recargas_completas'] += 1
+
+        # Los ids se conocen después de la consulta: se leen sus sellos y luego
+        # se comprueba 'menu'. invalidate_restaurant renueva 'menu' primero, así
+        # que si algún sello leído ya es posterior a la consulta 'menu' cambió
+        cache.sync(force=True)
+        versions = {idres: _restaurant_stamp(idres) for idres in restaurantes}
+        cache.sync(force=True)
+        if stamp('menu') == menu_version:
+            self._store(restaurantes, versions)
+        cache.set(NAMESPACE, _index_key(index_version), list(restaurantes), ttl=self.ttl)
+        return restaurantes
+
+    def _load_restaurants(self, ids):
+        """Recargar las entradas de algunos restaurantes"""
+        cache.sync(force=True)
+        versions = {idres: _restaurant_stamp(idres) for idres in ids}
+        with primary_reads():
+            restaurantes = self._group(execute_prepared('cliente_menu_restaurantes', (ids,)))
+        self._stats['recargas_parciales'] += 1
+        self._store(restaurantes, versions)
+        if len(restaurantes) < len(ids):
+            # Algún restaurante dejó de estar activo: el índice está desactualizado
+            self.invalidate_index()
+        return restaurantes
+
+    def stats(self):
+        """Estadísticas de la caché del worker actual"""
+        return {**self._stats, 'ttl': self.ttl}
+
+
+# Instancia global de la caché del menú
+menu_cache = MenuCache()
@@ -0,0 +1,219 @@
+"""
+🔑 Hash de contraseñas fuera del worker web
+scrypt/pbkdf2 son caros a propósito. Ejecutados en línea, cada login ocupa
+un worker de gunicorn durante todo el cálculo y una ráfaga de logins deja
+sin CPU al resto de las rutas. Aquí:
+- Los hashes se calculan en un pool de procesos acotado
+  (PASSWORD_HASH_PROCESSES por worker) con menor prioridad (PASSWORD_HASH_NICE).
+  Los procesos salen de un forkserver, nunca de un fork del worker (que ya
+  tiene hilos: pool de BD, log de accesos); sin forkserver se calculan en línea
+- Control de admisión: como máximo PASSWORD_HASH_CONCURRENCY hashes a la vez
+  en todo el nodo (slots en la caché compartida, utils/cache.py). Si no hay
+  slot libre en PASSWORD_HASH_WAIT segundos se lanza PasswordHashingBusy y
+  la ruta responde "intenta de nuevo" en lugar de encolar más trabajo
+- El worker espera el resultado como máximo PASSWORD_HASH_TIMEOUT segundos
+  (luego PasswordHashingBusy); el slot queda tomado hasta que el cálculo
+  termine de verdad, así la admisión sigue acotando el trabajo en curso
+- PASSWORD_HASH_METHOD define el algoritmo y su costo (formato de werkzeug).
+  verify_and_update() entrega un hash nuevo cuando el guardado usa otros
+  parámetros, para actualizarlo tras un login exitoso
+
+Para elegir el costo: python benchmarks/password_hashing.py
+
+Uso:
+    ok, nuevo_hash = password_hasher.verify_and_update(user['conusu'], password)
+    hashed = password_hasher.hash(password)
+"""
+
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+from utils.cache import cache
+
+SLOT_PREFIX = 'password_hash:slot:'
+
+
+class PasswordHashingBusy(Exception):
+    """No hay capacidad para calcular el hash ahora (control de admisión)"""
+    pass
+
+
+def _lower_priority(nice):
+    """Inicializador de los procesos del pool"""
+    try:
+        os.nice(nice)
+    except (AttributeError, OSError):
+        pass
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method)
+
+
+def _verify(stored, password, method, target_prefix):
+    """Verificar y, si corresponde, calcular el hash con los parámetros actuales"""
+    if not check_password_hash(stored, password):
+        return False, None
+    if method_prefix(stored) != target_prefix:
+        return True, generate_password_hash(password, method)
+    return True, None
+
+
+def method_prefix(hashed):
+    """Algoritmo y parámetros de un hash de werkzeug ('scrypt:32768:8:1')"""
+    return hashed.split('$', 1)[0] if hashed else ''
+
+
+class PasswordHasher:
+    """Hash y verificación de contraseñas en un pool de procesos con admisión limitada"""
+
+    def __init__(self, app=None):
+        self.app = app
+        self.method = 'scrypt'
+        self.target_prefix = None
+        self.processes = 1
+        self.concurrency = 1
+        self.wait = 3.0
+        self.timeout = 10.0
+        self.nice = 5
+        self._executor = None
+        self._pid = None
+        self._local_slots = threading.BoundedSemaphore(1)
+        self._guard = threading.Lock()
+        self._stats = {'hashes': 0, 'verificaciones': 0, 'rehashes': 0, 'rechazados': 0}
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configurar algoritmo, pool y admisión desde la aplicación Flask"""
+        self.app = app
+        app.password_hasher = self
+
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+        app.config.setdefault('PASSWORD_HASH_PROCESSES', 1)
+        app.config.setdefault('PASSWORD_HASH_CONCURRENCY', max(1, (os.cpu_count() or 2) // 2))
+        app.config.setdefault('PASSWORD_HASH_WAIT', 3.0)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10.0)
+        app.config.setdefault('PASSWORD_HASH_NICE', 5)
+
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        # Con spawn los procesos del pool reimportarían app.py (Windows)
+        forkserver = 'forkserver' in multiprocessing.get_all_start_methods()
+        self.processes = app.config['PASSWORD_HASH_PROCESSES'] if forkserver else 0
+        self.concurrency = app.config['PASSWORD_HASH_CONCURRENCY']
+        self.wait = app.config['PASSWORD_HASH_WAIT']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self.nice = app.config['PASSWORD_HASH_NICE']
+        self._local_slots = threading.BoundedSemaphore(self.concurrency)
+
+        # Parámetros completos del método (valida la configuración al arrancar)
+        self.target_prefix = method_prefix(generate_password_hash('', self.method))
+        modo = f"{self.processes} proceso(s)" if self.processes else "en línea"
+        print(f"🔑 Hash de contraseñas: {self.target_prefix} ({modo}, máx. {self.concurrency} simultáneos)")
+
+    def _get_executor(self):
+        """
+        Pool propio de cada worker (se crea después del fork de gunicorn).
+        Un fork del worker copiaría locks tomados por sus hilos; el forkserver
+        es un proceso nuevo (fork + exec) que solo precarga este módulo, no app.py
+        """
+        with self._guard:
+            if self._executor is None or self._pid != os.getpid():
+                contexto = multiprocessing.get_context('forkserver')
+                contexto.set_forkserver_preload([__name__])
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=contexto,
+                                                     initializer=_lower_priority, initargs=(self.nice,))
+                self._pid = os.getpid()
+            return self._executor
+
+    def _acquire_slot(self):
+        """Slot de hash en todo el nodo; None si no se libera ninguno a tiempo"""
+        deadline = time.monotonic() + self.wait
+        if not self._local_slots.acquire(timeout=self.wait):
+            return None
+        while True:
+            for i in range(self.concurrency):
+                if cache.acquire_lock(f'{SLOT_PREFIX}{i}', ttl=60):
+                    return f'{SLOT_PREFIX}{i}'
+            if time.monotonic() >= deadline:
+                self._local_slots.release()
+                return None
+            time.sleep(0.02)
+
+    def _release_slot(self, slot, owner=None):
+        cache.release_lock(slot, owner)
+        self._local_slots.release()
+
+    def _run(self, fn, *args):
+        slot = self._acquire_slot()
+        if slot is None:
+            self._stats['rechazados'] += 1
+            raise PasswordHashingBusy("Hay demasiadas solicitudes en este momento. Intenta de nuevo en unos segundos")
+        if not self.processes:
+            try:
+                return fn(*args)
+            finally:
+                self._release_slot(slot)
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._release_slot(slot)
+            raise
+        # El slot se libera cuando el cálculo termina, aunque el request ya no espere
+        # (el callback corre en otro hilo: se indica el dueño del lock)
+        owner = cache.lock_owner()
+        future.add_done_callback(lambda _: self._release_slot(slot, owner))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            self._stats['rechazados'] += 1
+            raise PasswordHashingBusy("El servidor está ocupado. Intenta de nuevo en unos segundos")
+        except BrokenProcessPool:
+            # Un proceso del pool murió: se recrea en el próximo uso
+            print("⚠️ Pool de hash reiniciado", file=sys.stderr)
+            self._executor = None
+            return fn(*args)
+
+    def hash(self, password):
+        """Hash con los parámetros configurados"""
+        self._stats['hashes'] += 1
+        return self._run(_hash, password, self.method)
+
+    def verify(self, stored, password):
+        """Verificar una contraseña contra su hash guardado"""
+        return self.verify_and_update(stored, password, rehash=False)[0]
+
+    def verify_and_update(self, stored, password, rehash=True):
+        """
+        Verificar una contraseña; con rehash=True y parámetros desactualizados
+        devuelve también el hash nuevo (en la misma tarea del pool).
+
+        Returns:
+            tuple: (válida, hash nuevo o None)
+        """
+        self._stats['verificaciones'] += 1
+        ok, nuevo = self._run(_verify, stored, password, self.method,
+                              self.target_prefix if rehash else method_prefix(stored))
+        if nuevo:
+            self._stats['rehashes'] += 1
+        return ok, nuevo
+
+    def needs_rehash(self, stored):
+        """El hash guardado usa parámetros distintos a PASSWORD_HASH_METHOD"""
+        return method_prefix(stored) != self.target_prefix
+
+    def stats(self):
+        """Estadísticas del worker actual"""
+        return {**self._stats, 'metodo': self.target_prefix, 'procesos': self.processes,
+                'concurrencia': self.concurrency}
+
+
+# Instancia global
+password_hasher = PasswordHasher()
@@ -0,0 +1,168 @@
+"""
+⚡ Registro de sentencias preparadas para las consultas más frecuentes
+Cada sentencia se registra con un nombre, se prepara en el servidor una sola
+vez por conexión del pool y luego se ejecuta por nombre desde utils/db_helpers.py.
+Opcionalmente cada sentencia define su row factory (ver utils/records.py).
+Lleva estadísticas de cuántas ejecuciones reutilizaron el plan preparado.
+"""
+
+import threading
+import weakref
+from utils.records import record_row, FilaMenu, PedidoRestaurante
+
+
+class PreparedStatementRegistry:
+    """Registro de sentencias SQL con nombre, preparadas por conexión"""
+
+    def __init__(self):
+        self._statements = {}
+        self._row_factories = {}
+        # Nombres ya preparados en cada conexión (se limpia al cerrarse la conexión)
+        self._prepared = weakref.WeakKeyDictionary()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, sql, row_factory=None):
+        """
+        Registrar una sentencia con su nombre.
+        row_factory: opcional, para filas compactas en lugar de dict_row
+        """
+        self._statements[name] = sql
+        self._row_factories[name] = row_factory
+        self._stats[name] = {'ejecuciones': 0, 'preparaciones': 0}
+
+    def get_sql(self, name):
+        """Obtener el SQL de una sentencia registrada"""
+        if name not in self._statements:
+            raise KeyError(f"Sentencia preparada no registrada: {name}")
+        return self._statements[name]
+
+    def execute(self, db, name, params=None):
+        """
+        Ejecutar una sentencia registrada en la conexión dada.
+        La primera ejecución en cada conexión la prepara en el servidor;
+        las siguientes reutilizan el plan (prepare=True en psycopg).
+
+        Returns:
+            cursor: Cursor con el resultado (el llamador debe cerrarlo)
+        """
+        sql = self.get_sql(name)
+        row_factory = self._row_factories[name]
+        cursor = db.cursor(row_factory=row_factory) if row_factory else db.cursor()
+        cursor.execute(sql, params or (), prepare=True)
+
+        with self._lock:
+            prepared = self._prepared.setdefault(db, set())
+            stats = self._stats[name]
+            stats['ejecuciones'] += 1
+            if name not in prepared:
+                prepared.add(name)
+                stats['preparaciones'] += 1
+
+        return cursor
+
+    def stats(self):
+        """Estadísticas de uso de los planes preparados (por proceso)"""
+        with self._lock:
+            report = {}
+            for name, stats in self._stats.items():
+                reutilizados = stats['ejecuciones'] - stats['preparaciones']
+                report[name] = {
+                    'ejecuciones': stats['ejecuciones'],
+                    'preparaciones': stats['preparaciones'],
+                    'usos_plan_preparado': reutilizados,
+                    'porcentaje_reutilizado': round(100 * reutilizados / stats['ejecuciones'], 1)
+                    if stats['ejecuciones'] else 0.0
+                }
+            return report
+
+
+# Instancia global del registro
+prepared_statements = PreparedStatementRegistry()
+
+# =====================================================
+# Sentencias registradas (páginas de mayor tráfico)
+# =====================================================
+
+# cliente.menu: restaurantes activos con sus productos y categorías
+prepared_statements.register('cliente_menu', """
+    SELECT r.idres, r.nomres, p.idpro, p.nompro, p.despro, p.prepro, c.tipcat
+    FROM restaurantes r
+    LEFT JOIN productos p ON r.idres = p.idres
+    LEFT JOIN categorias c ON p.idcat = c.idcat
+    WHERE r.estres = 'activo'
+    ORDER BY r.nomres, p.nompro
+""", row_factory=record_row(FilaMenu))
+
+# utils/menu_cache.py: recarga selectiva de algunos restaurantes del menú
+prepared_statements.register('cliente_menu_restaurantes', """
+    SELECT r.idres, r.nomres, p.idpro, p.nompro, p.despro, p.prepro, c.tipcat
+    FROM restaurantes r
+    LEFT JOIN productos p ON r.idres = p.idres
+    LEFT JOIN categorias c ON p.idcat = c.idcat
+    WHERE r.estres = 'activo' AND r.idres = ANY(%s)
+    ORDER BY r.nomres, p.nompro
+""", row_factory=record_row(FilaMenu))
+
+# cliente.mostrar_carrito: productos del carrito del cliente
+prepared_statements.register('cliente_carrito', """
+    SELECT c.idpro, p.nompro, p.prepro, c.canprocar
+    FROM carritos c
+    JOIN productos p ON c.idpro = p.idpro
+    WHERE c.idusu = %s
+""")
+
+# cliente.mis_pedidos (GET condicional): validador barato del historial.
+# en_curso cuenta los pedidos cuyo tiempo restante todavía cambia con el reloj
+prepared_statements.register('cliente_pedidos_sello', """
+    SELECT COUNT(*) AS pedidos,
+           MAX(p.fecha_actualizacion) AT TIME ZONE current_setting('TimeZone') AS actualizado,
+           COUNT(*) FILTER (
+               WHERE p.fecha_creacion + p.tiempo_estimado_minutos * INTERVAL '1 minute' > LOCALTIMESTAMP
+           ) AS en_curso,
+           (SELECT COUNT(*) FROM pagos pg JOIN pedidos x ON pg.idped = x.idped
+            WHERE x.idusu = %s AND pg.estado = 'pagado') AS pagados
+    FROM pedidos p
+    WHERE p.idusu = %s
+""")
+
+# restaurante.listar_pedidos: pedidos del restaurante con su total
+prepared_statements.register('restaurante_pedidos', """
+    SELECT p.idped, u.nomusu AS cliente,
+           p.estped, p.fecha_creacion, p.fecha_actualizacion,
+           COALESCE(SUM(dp.cantidad * dp.precio_unitario), 0) AS total
+    FROM pedidos p
+    JOIN usuarios u ON p.idusu = u.idusu
+    LEFT JOIN detalle_pedidos dp ON p.idped = dp.idped
+    WHERE p.idres = %s
+    GROUP BY p.idped, u.nomusu, p.estped, p.fecha_creacion, p.fecha_actualizacion
+    ORDER BY p.fecha_creacion DESC
+""", row_factory=record_row(PedidoRestaurante))
+
+# repartidor.listar_pedidos: pedidos asignados al repartidor
+prepared_statements.register('repartidor_pedidos_asignados', """
+    SELECT p.idped, u.nomusu as cliente, u.dirusu, r.nomres,
+           p.estped, p.fecha_creacion,
+           COALESCE(SUM(dp.cantidad * dp.precio_unitario), 0) as total
+    FROM pedidos p
+    JOIN usuarios u ON p.idusu = u.idusu
+    JOIN restaurantes r ON p.idres = r.idres
+    LEFT JOIN detalle_pedidos dp ON p.idped = dp.idped
+    WHERE p.idrep = %s
+    GROUP BY p.idped, u.nomusu, u.dirusu, r.nomres, p.estped, p.fecha_creacion
+    ORDER BY p.fecha_creacion DESC
+""")
+
+# repartidor.listar_pedidos: pedidos sin repartidor (pendiente, aceptado o preparando)
+prepared_statements.register('repartidor_pedidos_disponibles', """
+    SELECT p.idped, u.nomusu as cliente, u.dirusu, r.nomres,
+           p.estped, p.fecha_creacion,
+           COALESCE(SUM(dp.cantidad * dp.precio_unitario), 0) as total
+    FROM pedidos p
+    JOIN usuarios u ON p.idusu = u.idusu
+    JOIN restaurantes r ON p.idres = r.idres
+    LEFT JOIN detalle_pedidos dp ON p.idped = dp.idped
+    WHERE p.estped IN ('pendiente', 'aceptado', 'preparando') AND p.idrep IS NULL
+    GROUP BY p.idped, u.nomusu, u.dirusu, r.nomres, p.estped, p.fecha_creacion
+    ORDER BY p.fecha_creacion ASC
+""")
@@ -0,0 +1,70 @@
+"""
+🔒 Archivos compartidos entre workers en un directorio privado
+La caché (pickle), las sesiones SQLite y los buckets del límite de login
+viven en archivos que todos los workers leen. Un archivo con nombre fijo en
+/tmp lo puede crear o reemplazar antes cualquier usuario del servidor
+(ejecución de código vía pickle, sesiones falsas, enlaces simbólicos). Aquí:
+- Por defecto los archivos van en app.instance_path, creado con modo 0700
+- Los archivos se abren sin seguir enlaces simbólicos (O_NOFOLLOW), se
+  exige que pertenezcan al usuario del proceso y se dejan en modo 0600
+
+Uso:
+    path = app.config['CACHE_SQLITE_PATH'] or default_path(app, 'domiweb-cache.sqlite3')
+    ensure_private_file(path)
+    fd = open_private_file(path)
+"""
+
+import os
+import stat
+
+
+def private_dir(app):
+    """Directorio de la instancia (0700), propio del usuario del proceso"""
+    directorio = app.instance_path
+    os.makedirs(directorio, mode=0o700, exist_ok=True)
+    info = os.lstat(directorio)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"{directorio} no es un directorio propio del usuario {os.getuid()}")
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        os.chmod(directorio, 0o700)
+    return directorio
+
+
+def default_path(app, filename):
+    """Ruta por defecto de un archivo compartido dentro del directorio privado"""
+    return os.path.join(private_dir(app), filename)
+
+
+def open_private_file(path, flags=os.O_RDWR):
+    """
+    Abrir (o crear) un archivo privado y devolver su descriptor.
+    Rechaza enlaces simbólicos y archivos de otro usuario (PermissionError).
+    """
+    directorio = os.path.dirname(path)
+    if directorio:
+        os.makedirs(directorio, mode=0o700, exist_ok=True)
+    fd = os.open(path, flags | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+    try:
+        info = os.fstat(fd)
+        if not stat.S_ISREG(info.st_mode) or info.st_uid != os.getuid():
+            raise PermissionError(f"{path} no es un archivo propio del usuario {os.getuid()}")
+        if stat.S_IMODE(info.st_mode) & 0o077:
+            os.fchmod(fd, 0o600)
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def ensure_private_file(path):
+    """Validar (o crear) un archivo privado antes de abrirlo con otra API (sqlite3)"""
+    os.close(open_private_file(path))
+    # SQLite crea -wal y -shm con los permisos del archivo principal; si ya
+    # existen deben ser del mismo usuario
+    for sufijo in ('-wal', '-shm'):
+        try:
+            info = os.lstat(path + sufijo)
+        except FileNotFoundError:
+            continue
+        if not stat.S_ISREG(info.st_mode) or info.st_uid != os.getuid():
+            raise PermissionError(f"{path + sufijo} no es un archivo propio del usuario {os.getuid()}")
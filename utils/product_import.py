@@ -0,0 +1,248 @@
+"""
+📦 Importación masiva de productos (CSV o JSON)
+Flujo:
+1. Leer el archivo subido (CSV con encabezados o JSON: lista de objetos)
+2. Validar cada fila con las mismas reglas de InputValidator que crear_producto
+3. Cargar las filas válidas con COPY a una tabla temporal (staging)
+4. Fusionar en productos con una sola sentencia: actualiza los productos del
+   restaurante con el mismo nombre e inserta los nuevos
+
+Todo ocurre en una transacción; las filas inválidas se devuelven en el reporte.
+
+Columnas: nompro, despro, prepro, stopro y la categoría como idcat o por
+nombre en la columna categoria.
+"""
+
+import csv
+import io
+import json
+import time
+from utils.input_validator import input_validator
+from utils.category_cache import category_cache
+
+# Mismas reglas que el formulario de crear_producto
+REGLAS_PRODUCTO = {
+    'nompro': 'name',
+    'despro': 'description',
+    'prepro': 'price',
+    'stopro': 'quantity',
+}
+
+# Límite de la columna productos.despro
+MAX_DESCRIPCION = 255
+
+COLUMNAS_STAGING = ('fila', 'idcat', 'nompro', 'despro', 'prepro', 'stopro')
+
+
+class ProductImportError(ValueError):
+    """Error del archivo completo (formato, codificación, tamaño)"""
+
+
+def leer_archivo(archivo, max_filas):
+    """
+    Leer un archivo subido (FileStorage) y devolver una lista de diccionarios.
+    El formato se detecta por extensión (.csv / .json) o tipo MIME.
+    """
+    nombre = (archivo.filename or '').lower()
+    try:
+        contenido = archivo.read().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ProductImportError("El archivo debe estar codificado en UTF-8")
+
+    if nombre.endswith('.json') or archivo.mimetype == 'application/json':
+        try:
+            datos = json.loads(contenido)
+        except json.JSONDecodeError as e:
+            raise ProductImportError(f"JSON inválido: {e}")
+        if isinstance(datos, dict):
+            datos = datos.get('productos')
+        if not isinstance(datos, list) or not all(isinstance(d, dict) for d in datos):
+            raise ProductImportError("El JSON debe ser una lista de productos (objetos)")
+        filas = datos
+    elif nombre.endswith('.csv') or archivo.mimetype in ('text/csv', 'application/vnd.ms-excel'):
+        try:
+            dialecto = csv.Sniffer().sniff(contenido[:4096], delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        lector = csv.DictReader(io.StringIO(contenido), dialect=dialecto)
+        filas = [
+            {(clave or '').strip().lower(): valor for clave, valor in fila.items()}
+            for fila in lector
+        ]
+    else:
+        raise ProductImportError("Formato no soportado: sube un archivo .csv o .json")
+
+    if not filas:
+        raise ProductImportError("El archivo no contiene productos")
+    if len(filas) > max_filas:
+        raise ProductImportError(f"Demasiados productos ({len(filas)}); máximo {max_filas} por archivo")
+    return filas
+
+
+def _normalizar_fila(fila):
+    """
+    Llevar los valores de una fila JSON a texto, como los de un CSV.
+    Listas, objetos y booleanos no son valores de producto, y una cantidad
+    con decimales (2.7) es un error de la fila, no se trunca.
+
+    Returns:
+        tuple: (fila normalizada, errores por campo)
+    """
+    normalizada = {}
+    errores = {}
+    for campo, valor in fila.items():
+        if valor is None or isinstance(valor, str):
+            normalizada[campo] = valor
+        elif isinstance(valor, bool) or not isinstance(valor, (int, float)):
+            errores[campo] = 'Valor inválido (debe ser texto o número)'
+        elif isinstance(valor, float) and campo in ('stopro', 'idcat'):
+            if valor.is_integer():
+                normalizada[campo] = str(int(valor))
+            else:
+                errores[campo] = 'Debe ser un número entero'
+        else:
+            normalizada[campo] = str(valor)
+    return normalizada, errores
+
+
+def validar_filas(filas, categorias):
+    """
+    Validar cada fila con InputValidator y resolver su categoría.
+
+    Args:
+        filas: Lista de diccionarios leídos del archivo
+        categorias: Filas de la tabla categorias (idcat, tipcat)
+
+    Returns:
+        tuple: (filas válidas como tuplas de COLUMNAS_STAGING, lista de errores)
+    """
+    por_id = {c['idcat'] for c in categorias}
+    por_nombre = {c['tipcat'].strip().lower(): c['idcat'] for c in categorias}
+
+    validas = []
+    errores = []
+    nombres_vistos = {}
+
+    for numero, fila in enumerate(filas, start=1):
+        fila, errores_tipo = _normalizar_fila(fila)
+        resultado = input_validator.validate_form_data(fila, REGLAS_PRODUCTO)
+        errores_fila = {**resultado['errors'], **errores_tipo}
+        valores = resultado['values']
+
+        if len(valores.get('despro', '')) > MAX_DESCRIPCION:
+            errores_fila['despro'] = f'Descripción demasiado larga (máximo {MAX_DESCRIPCION} caracteres)'
+
+        # Categoría por id o por nombre
+        idcat = None
+        if str(fila.get('idcat') or '').strip():
+            try:
+                idcat = int(str(fila['idcat']).strip())
+            except ValueError:
+                idcat = None
+            if idcat not in por_id:
+                errores_fila['idcat'] = 'Categoría inexistente'
+        elif str(fila.get('categoria') or '').strip():
+            idcat = por_nombre.get(str(fila['categoria']).strip().lower())
+            if idcat is None:
+                errores_fila['categoria'] = f"Categoría inexistente: {fila['categoria']}"
+        else:
+            errores_fila['idcat'] = 'Categoría es requerida (idcat o categoria)'
+
+        # Nombres repetidos dentro del mismo archivo
+        if 'nompro' in valores:
+            clave = valores['nompro'].lower()
+            if clave in nombres_vistos:
+                errores_fila['nompro'] = f'Producto duplicado en el archivo (fila {nombres_vistos[clave]})'
+            else:
+                nombres_vistos[clave] = numero
+
+        if errores_fila:
+            errores.append({'fila': numero, 'nompro': fila.get('nompro'), 'errores': errores_fila})
+        else:
+            validas.append((numero, idcat, valores['nompro'], valores['despro'] or None,
+                            valores['prepro'], valores['stopro']))
+
+    return validas, errores
+
+
+def cargar_productos(db, idres, validas):
+    """
+    Cargar las filas válidas con COPY y fusionarlas en productos (una transacción).
+
+    Returns:
+        dict: {'insertados': n, 'actualizados': n}
+    """
+    with db.transaction():
+        cursor = db.cursor()
+        try:
+            # Serializar importaciones concurrentes del mismo restaurante
+            cursor.execute("SELECT idres FROM restaurantes WHERE idres = %s FOR UPDATE", (idres,))
+
+            cursor.execute("""
+                CREATE TEMP TABLE productos_staging (
+                    fila INT NOT NULL,
+                    idcat INT NOT NULL,
+                    nompro VARCHAR(100) NOT NULL,
+                    despro VARCHAR(255),
+                    prepro DECIMAL(10, 2) NOT NULL,
+                    stopro INT NOT NULL
+                ) ON COMMIT DROP
+            """)
+
+            with cursor.copy(
+                f"COPY productos_staging ({', '.join(COLUMNAS_STAGING)}) FROM STDIN"
+            ) as copy:
+                for fila in validas:
+                    copy.write_row(fila)
+
+            # Una sola sentencia: actualizar existentes (mismo nombre) e insertar nuevos
+            cursor.execute("""
+                WITH actualizados AS (
+                    UPDATE productos p
+                    SET idcat = s.idcat, despro = s.despro, prepro = s.prepro, stopro = s.stopro
+                    FROM productos_staging s
+                    WHERE p.idres = %(idres)s AND lower(p.nompro) = lower(s.nompro)
+                    RETURNING p.idpro
+                ), insertados AS (
+                    INSERT INTO productos (idres, idcat, nompro, despro, prepro, stopro)
+                    SELECT %(idres)s, s.idcat, s.nompro, s.despro, s.prepro, s.stopro
+                    FROM productos_staging s
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM productos p
+                        WHERE p.idres = %(idres)s AND lower(p.nompro) = lower(s.nompro)
+                    )
+                    ORDER BY s.fila
+                    RETURNING idpro
+                )
+                SELECT (SELECT COUNT(*) FROM insertados) AS insertados,
+                       (SELECT COUNT(*) FROM actualizados) AS actualizados
+            """, {'idres': idres})
+            resultado = cursor.fetchone()
+        finally:
+            cursor.close()
+
+    return {'insertados': resultado['insertados'], 'actualizados': resultado['actualizados']}
+
+
+def importar_productos(db, idres, archivo, max_filas):
+    """
+    Importar un archivo de productos para un restaurante.
+
+    Returns:
+        dict: Reporte con totales y errores por fila
+    """
+    inicio = time.perf_counter()
+    filas = leer_archivo(archivo, max_filas)
+    validas, errores = validar_filas(filas, category_cache.get_all())
+    resultado = {'insertados': 0, 'actualizados': 0}
+    if validas:
+        resultado = cargar_productos(db, idres, validas)
+
+    return {
+        'total_filas': len(filas),
+        'filas_validas': len(validas),
+        'filas_con_error': len(errores),
+        **resultado,
+        'errores': errores,
+        'duracion_ms': round((time.perf_counter() - inicio) * 1000, 1),
+    }
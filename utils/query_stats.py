@@ -0,0 +1,178 @@
+"""
+📊 Instrumentación de consultas SQL
+Todas las conexiones del pool usan InstrumentedCursor, que registra por cada
+sentencia: huella (fingerprint) de la consulta, duración, filas devueltas y
+el endpoint que la ejecutó. Con eso se alimenta:
+- Log de consultas lentas (umbral DB_SLOW_QUERY_MS)
+- Contadores agregados por ruta y por consulta (por worker)
+- Cabecera Server-Timing con el tiempo de BD y número de consultas del request
+
+Nota: en modo pipeline la duración solo mide el envío; el tiempo de espera
+se acumula en la sentencia que sincroniza.
+"""
+
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import psycopg
+from flask import g, request, has_request_context
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+
+def fingerprint(query):
+    """Normalizar una consulta para agrupar las que solo cambian en literales"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    elif not isinstance(query, str):
+        # sql.Composed u otros objetos de psycopg
+        query = str(query)
+    query = _STRING_LITERAL.sub('?', query)
+    query = _NUMBER_LITERAL.sub('?', query)
+    return _WHITESPACE.sub(' ', query).strip()[:300]
+
+
+class QueryStats:
+    """Agregador de estadísticas de consultas del worker"""
+
+    def __init__(self, app=None):
+        self.app = app
+        self.slow_query_ms = 200
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._queries = {}
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Registrar hooks de request en la aplicación Flask"""
+        self.app = app
+        app.query_stats = self
+
+        app.config.setdefault('DB_SLOW_QUERY_MS', 200)
+        app.config.setdefault('DB_SERVER_TIMING', True)
+        self.slow_query_ms = app.config['DB_SLOW_QUERY_MS']
+
+        app.after_request(self._add_server_timing)
+        app.teardown_request(self._record_request)
+
+    def record(self, query, duration_ms, rows):
+        """Registrar una sentencia ejecutada"""
+        endpoint = '-'
+        if has_request_context():
+            endpoint = request.endpoint or '-'
+            g.db_queries = g.get('db_queries', 0) + 1
+            g.db_time_ms = g.get('db_time_ms', 0.0) + duration_ms
+
+        key = fingerprint(query)
+        if not key:
+            return
+
+        with self._lock:
+            stats = self._queries.get(key)
+            if stats is None:
+                stats = self._queries[key] = {
+                    'consulta': key, 'ejecuciones': 0, 'total_ms': 0.0,
+                    'max_ms': 0.0, 'filas': 0, 'endpoints': set()
+                }
+            stats['ejecuciones'] += 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+            stats['filas'] += max(rows, 0)
+            stats['endpoints'].add(endpoint)
+
+        if duration_ms >= self.slow_query_ms:
+            print(f"🐢 Consulta lenta ({duration_ms:.1f} ms, {rows} filas) "
+                  f"en {endpoint}: {key}", file=sys.stderr)
+
+    def _add_server_timing(self, response):
+        """Agregar cabecera Server-Timing con tiempo de BD y número de consultas"""
+        if self.app.config['DB_SERVER_TIMING'] and g.get('db_queries'):
+            response.headers.add(
+                'Server-Timing',
+                f'db;desc="{g.db_queries} consultas";dur={g.db_time_ms:.2f}'
+            )
+        return response
+
+    def _record_request(self, error=None):
+        """Acumular totales del request en los contadores por ruta"""
+        endpoint = request.endpoint or '-'
+        queries = g.get('db_queries', 0)
+        db_ms = g.get('db_time_ms', 0.0)
+        with self._lock:
+            stats = self._routes.get(endpoint)
+            if stats is None:
+                stats = self._routes[endpoint] = {
+                    'requests': 0, 'consultas': 0, 'total_ms': 0.0, 'max_ms': 0.0
+                }
+            stats['requests'] += 1
+            stats['consultas'] += queries
+            stats['total_ms'] += db_ms
+            stats['max_ms'] = max(stats['max_ms'], db_ms)
+
+    def snapshot(self, top=20):
+        """Resumen por ruta y las consultas que más tiempo de BD consumen"""
+        with self._lock:
+            routes = {
+                endpoint: {
+                    **stats,
+                    'total_ms': round(stats['total_ms'], 2),
+                    'max_ms': round(stats['max_ms'], 2),
+                    'promedio_ms': round(stats['total_ms'] / stats['requests'], 2),
+                    'consultas_por_request': round(stats['consultas'] / stats['requests'], 2)
+                }
+                for endpoint, stats in self._routes.items()
+            }
+            queries = sorted(self._queries.values(), key=lambda q: q['total_ms'], reverse=True)[:top]
+            queries = [
+                {
+                    **stats,
+                    'total_ms': round(stats['total_ms'], 2),
+                    'max_ms': round(stats['max_ms'], 2),
+                    'promedio_ms': round(stats['total_ms'] / stats['ejecuciones'], 2),
+                    'endpoints': sorted(stats['endpoints'])
+                }
+                for stats in queries
+            ]
+        return {'rutas': routes, 'consultas': queries}
+
+
+# Instancia global del agregador
+query_stats = QueryStats()
+
+
+class InstrumentedCursor(psycopg.Cursor):
+    """Cursor que mide cada sentencia y la reporta a query_stats"""
+
+    def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        rows = -1
+        try:
+            result = super().execute(query, params, **kwargs)
+            rows = self.rowcount
+            return result
+        finally:
+            query_stats.record(query, (time.perf_counter() - start) * 1000, rows)
+
+    def executemany(self, query, params_seq, **kwargs):
+        start = time.perf_counter()
+        rows = -1
+        try:
+            result = super().executemany(query, params_seq, **kwargs)
+            rows = self.rowcount
+            return result
+        finally:
+            query_stats.record(query, (time.perf_counter() - start) * 1000, rows)
+
+    @contextmanager
+    def copy(self, statement, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            with super().copy(statement, params, **kwargs) as copy:
+                yield copy
+        finally:
+            query_stats.record(statement, (time.perf_counter() - start) * 1000, self.rowcount)
@@ -0,0 +1,227 @@
+"""
+🚦 Límite de intentos de login en memoria compartida (token bucket)
+La protección por cuenta de PostgreSQL (intentos_fallidos, log_intentos_acceso)
+cuesta varias escrituras por intento. Este limitador rechaza antes de tocar
+la BD o calcular un hash:
+- Un bucket por IP (LOGIN_RATE_LIMIT_IP) y otro por email (LOGIN_RATE_LIMIT_EMAIL),
+  en formato "intentos/segundos": "30/60" = ráfaga de 30 y 30 por minuto
+- Los buckets viven en un archivo mapeado en memoria (mmap) compartido por
+  todos los workers de gunicorn del nodo; fcntl.flock serializa las
+  actualizaciones (microsegundos, sin E/S real: el archivo está en caché)
+- Tabla de tamaño fijo (RATE_LIMIT_SLOTS) con direccionamiento abierto; si
+  la ventana de sondeo está llena se reutiliza el bucket más viejo.
+  Las claves se guardan como huella blake2b con SECRET_KEY (no se pueden
+  fabricar colisiones a propósito)
+- El archivo va por defecto en instance/ (privado); se rechaza si es un
+  enlace simbólico o pertenece a otro usuario (utils/private_files.py)
+- Sin fcntl (Windows) los buckets quedan en la memoria de cada worker
+
+Uso:
+    espera = login_limiter.check(ip, email)
+    if espera:  # segundos hasta el próximo intento permitido
+        ...
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from utils.private_files import default_path, open_private_file
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_HEADER = struct.Struct('<8sQ')
+_SLOT = struct.Struct('<Qdd')  # huella, tokens, última actualización
+_MAGIC = b'DWRLv1\x00\x00'
+_PROBES = 8
+
+
+def parse_rate(value):
+    """'30/60' -> (30.0, 60.0)"""
+    intentos, segundos = str(value).split('/', 1)
+    return float(intentos), float(segundos)
+
+
+def _refill(tokens, updated, now, capacity, period):
+    return min(capacity, tokens + (now - updated) * capacity / period)
+
+
+class SharedTokenBuckets:
+    """Tabla de token buckets en un archivo mmap compartido entre procesos"""
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self.size = _HEADER.size + slots * _SLOT.size
+        self._pid = None
+        self._fd = None
+        self._map = None
+        self._thread_lock = threading.Lock()
+
+    def _open(self):
+        """mmap propio de cada proceso (se abre después del fork de gunicorn)"""
+        if self._pid == os.getpid():
+            return
+        # Sin seguir enlaces y solo si es del usuario del proceso (antes de truncar o mapear)
+        fd = open_private_file(self.path)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(fd, _HEADER.size, 0)
+            if len(header) < _HEADER.size or _HEADER.unpack(header) != (_MAGIC, self.slots) \
+                    or os.fstat(fd).st_size != self.size:
+                # Archivo nuevo o de otro tamaño: se reinicia
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.size)
+                os.pwrite(fd, _HEADER.pack(_MAGIC, self.slots), 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(fd, self.size)
+        self._fd = fd
+        self._pid = os.getpid()
+
+    def take(self, key, capacity, period):
+        """Consumir un token de key; devuelve 0 o los segundos hasta el próximo token"""
+        with self._thread_lock:
+            self._open()
+            fingerprint = key or 1
+            start = fingerprint % self.slots
+            now = time.time()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                target = reusable = oldest = None
+                oldest_updated = now
+                for probe in range(_PROBES):
+                    offset = _HEADER.size + ((start + probe) % self.slots) * _SLOT.size
+                    slot_fp, tokens, updated = _SLOT.unpack_from(self._map, offset)
+                    if slot_fp == fingerprint:
+                        target = offset
+                        break
+                    if slot_fp == 0 or now - updated >= period:
+                        # Vacío o ya lleno de nuevo: equivale a un bucket nuevo
+                        reusable = reusable or offset
+                    elif updated < oldest_updated:
+                        oldest, oldest_updated = offset, updated
+
+                if target is None:
+                    target = reusable or oldest or _HEADER.size + start * _SLOT.size
+                    tokens, updated = capacity, now
+
+                tokens = _refill(tokens, updated, now, capacity, period)
+                if tokens < 1:
+                    _SLOT.pack_into(self._map, target, fingerprint, tokens, now)
+                    return (1 - tokens) * period / capacity
+                _SLOT.pack_into(self._map, target, fingerprint, tokens - 1, now)
+                return 0
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class LocalTokenBuckets:
+    """Token buckets en la memoria del worker (sin fcntl)"""
+
+    def __init__(self, slots):
+        self.slots = slots
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, period):
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = _refill(tokens, updated, now, capacity, period)
+            self._buckets[key] = (tokens - 1 if tokens >= 1 else tokens, now)
+            while len(self._buckets) > self.slots:
+                self._buckets.popitem(last=False)
+        return 0 if tokens >= 1 else (1 - tokens) * period / capacity
+
+
+class LoginRateLimiter:
+    """Límite de intentos de login por IP y por email"""
+
+    def __init__(self, app=None):
+        self.app = app
+        self.enabled = True
+        self.ip_rate = (30.0, 60.0)
+        self.email_rate = (10.0, 60.0)
+        self.buckets = None
+        self._secret = b''
+        self._stats = {'permitidos': 0, 'rechazados_ip': 0, 'rechazados_email': 0}
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configurar límites y almacenamiento desde la aplicación Flask"""
+        self.app = app
+        app.login_limiter = self
+
+        app.config.setdefault('LOGIN_RATE_LIMIT', True)
+        app.config.setdefault('LOGIN_RATE_LIMIT_IP', '30/60')
+        app.config.setdefault('LOGIN_RATE_LIMIT_EMAIL', '10/60')
+        app.config.setdefault('RATE_LIMIT_PATH', None)
+        app.config.setdefault('RATE_LIMIT_SLOTS', 65536)
+
+        self.enabled = app.config['LOGIN_RATE_LIMIT']
+        self.ip_rate = parse_rate(app.config['LOGIN_RATE_LIMIT_IP'])
+        self.email_rate = parse_rate(app.config['LOGIN_RATE_LIMIT_EMAIL'])
+        self._secret = (app.config.get('SECRET_KEY') or '').encode()[:64]
+
+        slots = app.config['RATE_LIMIT_SLOTS']
+        if fcntl is None:
+            self.buckets = LocalTokenBuckets(slots)
+            print("⚠️ Límite de login por worker (sin fcntl no hay memoria compartida)", file=sys.stderr)
+        else:
+            path = app.config['RATE_LIMIT_PATH'] or default_path(app, 'domiweb-ratelimit.bin')
+            self.buckets = SharedTokenBuckets(path, slots)
+
+    def _fingerprint(self, kind, value):
+        digest = hashlib.blake2b(f'{kind}:{value}'.encode(), digest_size=8, key=self._secret).digest()
+        return int.from_bytes(digest, 'little')
+
+    def _take(self, kind, value, rate):
+        if isinstance(self.buckets, SharedTokenBuckets):
+            key = self._fingerprint(kind, value)
+        else:
+            key = f'{kind}:{value}'
+        try:
+            return self.buckets.take(key, *rate)
+        except OSError as e:
+            # Sin el archivo compartido no se bloquea el login: queda la protección de la BD
+            print(f"⚠️ Límite de login no disponible: {e}", file=sys.stderr)
+            return 0
+
+    def check(self, ip, email):
+        """
+        Registrar un intento de login.
+
+        Returns:
+            int: 0 si se permite; si no, segundos hasta el próximo intento
+        """
+        if not self.enabled:
+            return 0
+        espera = self._take('ip', ip, self.ip_rate)
+        if espera:
+            self._stats['rechazados_ip'] += 1
+            return max(1, int(espera + 0.999))
+        email = (email or '').strip().lower()
+        if email:
+            espera = self._take('email', email, self.email_rate)
+            if espera:
+                self._stats['rechazados_email'] += 1
+                return max(1, int(espera + 0.999))
+        self._stats['permitidos'] += 1
+        return 0
+
+    def stats(self):
+        """Estadísticas del worker actual"""
+        return {**self._stats, 'compartido': isinstance(self.buckets, SharedTokenBuckets)}
+
+
+# Instancia global
+login_limiter = LoginRateLimiter()
@@ -0,0 +1,136 @@
+"""
+🧱 Filas compactas para los listados grandes
+Por defecto las conexiones usan dict_row: cada fila es un diccionario completo.
+Para las consultas de mayor volumen se puede pedir, de forma opcional, que
+cada fila se construya como un registro con __slots__ (sin __dict__ por fila)
+o como tupla simple.
+
+Los registros mantienen acceso por atributo (`pedido.idped`, como en las
+plantillas) y por clave (`pedido['idped']`, como en el código existente).
+
+Uso:
+    Pedido = record_class('Pedido', ('idped', 'estped'), extra=('tiempo_restante',))
+    cursor = db.cursor(row_factory=record_row(Pedido))
+    execute_query(query, params, row_factory=record_row(Pedido))
+    prepared_statements.register('nombre', sql, row_factory=record_row(Pedido))
+"""
+
+from psycopg.rows import tuple_row  # noqa: F401  (re-exportado para filas como tuplas)
+
+
+class Record:
+    """Base de los registros con __slots__ generados por record_class"""
+
+    __slots__ = ()
+    _fields = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            key = self._fields[key]
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def update(self, values):
+        """Asignar varios campos (solo los declarados en la clase)"""
+        for key, value in values.items():
+            if key in self.__slots__:
+                setattr(self, key, value)
+
+    def _asdict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __eq__(self, other):
+        if not isinstance(other, Record):
+            return NotImplemented
+        return self._asdict() == other._asdict()
+
+    def __repr__(self):
+        campos = ', '.join(f'{key}={getattr(self, key)!r}' for key in self._fields)
+        return f'{type(self).__name__}({campos})'
+
+
+def record_class(name, fields, extra=()):
+    """
+    Crear una clase de registro con __slots__.
+
+    Args:
+        name: Nombre de la clase
+        fields: Columnas de la consulta, en el mismo orden del SELECT
+        extra: Campos adicionales calculados en Python (inician en None)
+    """
+    fields = tuple(fields)
+    extra = tuple(extra)
+    args = ', '.join(fields)
+    body = ''.join(f'\n    self.{f} = {f}' for f in fields)
+    body += ''.join(f'\n    self.{f} = None' for f in extra)
+    namespace = {}
+    exec(f'def __init__(self, {args}):{body}', namespace)
+    return type(name, (Record,), {
+        '__slots__': fields + extra,
+        '_fields': fields,
+        '__init__': namespace['__init__'],
+    })
+
+
+def record_row(cls):
+    """
+    Row factory de psycopg que construye instancias de `cls` por posición.
+    Valida una vez por consulta que las columnas coincidan con la clase.
+    """
+    def factory(cursor):
+        description = cursor.description
+        if description is not None:
+            columnas = tuple(col.name for col in description)
+            if columnas != cls._fields:
+                raise TypeError(
+                    f"Las columnas {columnas} no coinciden con {cls.__name__}{cls._fields}"
+                )
+
+        def make_row(values):
+            return cls(*values)
+
+        return make_row
+
+    factory.__name__ = f'record_row_{cls.__name__}'
+    return factory
+
+
+# =====================================================
+# Registros de los listados de mayor tráfico
+# =====================================================
+
+# admin.list_users
+Usuario = record_class('Usuario', ('idusu', 'nomusu', 'corusu', 'dirusu', 'rolusu', 'estusu'))
+
+# cliente.menu (sentencia preparada 'cliente_menu')
+FilaMenu = record_class('FilaMenu', ('idres', 'nomres', 'idpro', 'nompro', 'despro', 'prepro', 'tipcat'))
+
+# restaurante.listar_pedidos (sentencia preparada 'restaurante_pedidos')
+PedidoRestaurante = record_class('PedidoRestaurante', (
+    'idped', 'cliente', 'estped', 'fecha_creacion', 'fecha_actualizacion', 'total'
+))
+
+# cliente.mis_pedidos, con los campos de seguimiento de DeliveryCalculator
+PedidoCliente = record_class('PedidoCliente', (
+    'idped', 'nomres', 'estped', 'fecha_creacion', 'tiempo_estimado_minutos',
+    'hora_estimada_entrega', 'total', 'metodo', 'estado_pago',
+    # Validador del GET condicional (mismos valores que 'cliente_pedidos_sello')
+    'sello_pedidos', 'sello_actualizado', 'sello_en_curso', 'sello_pagados'
+), extra=(
+    'estado', 'tiempo_estimado_original', 'tiempo_restante',
+    'hora_estimada', 'porcentaje_completado'
+))
@@ -5,24 +5,61 @@ Proporciona middleware y utilidades para gestionar automáticamente:
 - Renovación automática de sesiones
 - Alertas de sesión próxima a expirar
 - Logout automático por seguridad
+
+Las marcas de tiempo (login_time, last_activity) se guardan como enteros
+epoch. last_activity solo se reescribe cuando avanza al menos
+SESSION_ACTIVITY_GRANULARITY segundos: la mayoría de los requests no
+modifican la sesión y el backend no la vuelve a guardar. Las sesiones
+anteriores con fechas ISO se siguen aceptando y se convierten al renovarlas.
+
+Exenciones (se deciden una vez por endpoint, no con prefijos de ruta):
+- @session_exempt: la vista (o blueprint.session_exempt = True) no pasa
+  por la verificación de timeout (login, registro, /session/...)
+- @sessionless: además no se carga la sesión (static, /health); solo
+  para rutas sin variables que nunca leen ni escriben la sesión
+
+Token de estado: una cookie chica y firmada (SESSION_STATUS_COOKIE, solo
+enviada a /session) con el vencimiento de la sesión en epoch. Se reemite
+cuando la sesión cambia y /session/ping la lee sin cargar la sesión, así
+el sondeo de las pestañas abiertas no toca el almacén de sesiones.
 """
 
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import session, request, jsonify, redirect, url_for, flash, current_app
+from itsdangerous import BadSignature, Signer
 import time
 
+# El token de estado solo viaja a los endpoints de /session
+STATUS_COOKIE_PATH = '/session'
+
 
 class SessionTimeoutError(Exception):
     """Excepción personalizada para timeout de sesión"""
     pass
 
 
+def session_exempt(f):
+    """Decorador: la vista no verifica el timeout de sesión"""
+    f.session_exempt = True
+    return f
+
+
+def sessionless(f):
+    """Decorador: la vista no usa la sesión (ni se carga ni se verifica)"""
+    f.session_exempt = True
+    f.sessionless = True
+    return f
+
+
 class SessionManager:
     """Gestor centralizado de sesiones con timeout automático"""
     
     def __init__(self, app=None):
         self.app = app
+        # endpoint -> (exento del timeout, sin sesión)
+        self._policies = {}
+        self._sessionless_paths = None
         if app:
             self.init_app(app)
     
@@ -33,9 +70,46 @@ class SessionManager:
         # Configuraciones por defecto
         app.config.setdefault('SESSION_TIMEOUT_MINUTES', 30)
         app.config.setdefault('SESSION_WARNING_MINUTES', 5)
+        app.config.setdefault('SESSION_ACTIVITY_GRANULARITY', 60)
+        app.config.setdefault('SESSION_STATUS_COOKIE', 'session_status')
         
         # Registrar middleware
         app.before_request(self.check_session_timeout)
+        app.after_request(self.sync_status_cookie)
+    
+    def endpoint_policy(self, app, endpoint):
+        """
+        (exento, sin_sesion) de un endpoint, calculado una sola vez a partir de
+        los atributos de la vista y de su blueprint
+        """
+        policy = self._policies.get(endpoint)
+        if policy is None:
+            view = app.view_functions.get(endpoint)
+            blueprint_name, _, name = (endpoint or '').rpartition('.')
+            blueprint = app.blueprints.get(blueprint_name)
+            no_session = (endpoint is None or name == 'static'
+                          or getattr(view, 'sessionless', False)
+                          or getattr(blueprint, 'sessionless', False))
+            exempt = (no_session
+                      or getattr(view, 'session_exempt', False)
+                      or getattr(blueprint, 'session_exempt', False))
+            policy = self._policies[endpoint] = (exempt, no_session)
+        return policy
+    
+    def skips_session(self, app, request):
+        """
+        El request no necesita sesión: archivos estáticos o rutas @sessionless.
+        Lo usa utils/session_store.py antes de leer la cookie o el almacén
+        (la sesión se abre antes de resolver el endpoint, así que se compara la ruta).
+        """
+        if app.static_url_path and request.path.startswith(app.static_url_path + '/'):
+            return True
+        if self._sessionless_paths is None:
+            self._sessionless_paths = frozenset(
+                rule.rule for rule in app.url_map.iter_rules()
+                if not rule.arguments and self.endpoint_policy(app, rule.endpoint)[1]
+            )
+        return request.path in self._sessionless_paths
     
     def start_session(self, user_id, role, remember_me=False):
         """
@@ -46,15 +120,15 @@ class SessionManager:
             role: Rol del usuario
             remember_me: Si la sesión debe ser recordada
         """
-        now = datetime.now()
+        now = int(time.time())
         timeout_minutes = current_app.config.get('SESSION_TIMEOUT_MINUTES', 30)
         
         # Configurar datos de sesión
         session.permanent = remember_me
         session['user_id'] = user_id
         session['role'] = role
-        session['login_time'] = now.isoformat()
-        session['last_activity'] = now.isoformat()
+        session['login_time'] = now
+        session['last_activity'] = now
         session['timeout_minutes'] = timeout_minutes
         session['session_token'] = self._generate_session_token(user_id)
         
@@ -64,31 +138,58 @@ class SessionManager:
         else:
             session.permanent_session_lifetime = timedelta(minutes=timeout_minutes)
     
-    def refresh_session(self):
-        """Renovar la actividad de la sesión actual"""
-        if 'user_id' in session:
-            session['last_activity'] = datetime.now().isoformat()
-            session.modified = True
+    @staticmethod
+    def _epoch(value):
+        """Marca de tiempo de la sesión como epoch (acepta el formato ISO anterior)"""
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return int(datetime.fromisoformat(value).timestamp())
+        return int(value)
+    
+    def refresh_session(self, force=False):
+        """
+        Renovar la actividad de la sesión actual.
+        Solo modifica la sesión si last_activity avanza al menos
+        SESSION_ACTIVITY_GRANULARITY segundos (o con force=True).
+        
+        Returns:
+            bool: True si la sesión se modificó
+        """
+        if 'user_id' not in session:
+            return False
+        
+        now = int(time.time())
+        stored = session.get('last_activity')
+        granularity = current_app.config.get('SESSION_ACTIVITY_GRANULARITY', 60)
+        if force or not isinstance(stored, int) or now - stored >= granularity:
+            session['last_activity'] = now
+            return True
+        return False
+    
+    def seconds_until_timeout(self):
+        """Segundos hasta el timeout de la sesión actual (enteros, sin fechas)"""
+        last_activity = self._epoch(session['last_activity'])
+        return session.get('timeout_minutes', 30) * 60 - (int(time.time()) - last_activity)
     
     def get_session_info(self):
         """Obtener información completa de la sesión actual"""
         if 'user_id' not in session:
             return None
         
-        last_activity = datetime.fromisoformat(session['last_activity'])
-        login_time = datetime.fromisoformat(session['login_time'])
+        last_activity = self._epoch(session['last_activity'])
+        login_time = self._epoch(session['login_time'])
         timeout_minutes = session.get('timeout_minutes', 30)
         warning_minutes = current_app.config.get('SESSION_WARNING_MINUTES', 5)
         
-        now = datetime.now()
-        time_since_activity = (now - last_activity).total_seconds() / 60
+        time_since_activity = (time.time() - last_activity) / 60
         time_until_timeout = timeout_minutes - time_since_activity
         
         return {
             'user_id': session['user_id'],
             'role': session['role'],
-            'login_time': login_time,
-            'last_activity': last_activity,
+            'login_time': datetime.fromtimestamp(login_time),
+            'last_activity': datetime.fromtimestamp(last_activity),
             'timeout_minutes': timeout_minutes,
             'time_since_activity': time_since_activity,
             'time_until_timeout': time_until_timeout,
@@ -99,37 +200,70 @@ class SessionManager:
     
     def check_session_timeout(self):
         """Verificar si la sesión ha expirado (middleware)"""
-        # Excluir rutas que no requieren autenticación
-        excluded_paths = ['/auth/login', '/auth/register', '/auth/logout', 
-                         '/auth/forgot-password', '/auth/reset-password',
-                         '/static/', '/session/']
-        
-        if any(request.path.startswith(path) for path in excluded_paths):
+        # Excluir endpoints que no requieren autenticación (@session_exempt / @sessionless)
+        if self.endpoint_policy(current_app, request.endpoint)[0]:
             return
         
         # Verificar si hay sesión activa
         if 'user_id' not in session:
             return
         
-        info = self.get_session_info()
-        if not info:
-            return
+        remaining = self.seconds_until_timeout()
         
         # Si la sesión ha expirado
-        if info['is_expired']:
+        if remaining <= 0:
             self.end_session('timeout')
             flash('Tu sesión ha expirado por inactividad. Por favor, inicia sesión nuevamente.', 'warning')
             return redirect(url_for('auth.login'))
         
         # Si es una solicitud AJAX, devolver información de sesión
         if request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            if info['needs_warning']:
+            warning_minutes = current_app.config.get('SESSION_WARNING_MINUTES', 5)
+            if remaining <= warning_minutes * 60:
+                info = self.get_session_info()
                 return jsonify({
                     'session_warning': True,
                     'time_remaining': info['time_until_timeout'],
                     'message': f'Tu sesión expirará en {int(info["time_until_timeout"])} minutos'
                 })
     
+    @staticmethod
+    def _status_signer():
+        return Signer(current_app.secret_key, salt='session-status')
+    
+    def read_status(self):
+        """Vencimiento (epoch) según el token de estado del request, o None si falta o es inválido"""
+        token = request.cookies.get(current_app.config['SESSION_STATUS_COOKIE'])
+        if not token:
+            return None
+        try:
+            return int(self._status_signer().unsign(token))
+        except (BadSignature, ValueError):
+            return None
+    
+    def sync_status_cookie(self, response):
+        """Reemitir el token de estado cuando cambia la sesión (after_request)"""
+        if self.endpoint_policy(current_app, request.endpoint)[1]:
+            return response
+        if current_app.session_interface.is_null_session(session):
+            return response
+        
+        name = current_app.config['SESSION_STATUS_COOKIE']
+        last_activity = session.get('last_activity')
+        if 'user_id' in session and last_activity is not None:
+            # Sin token (p. ej. sesión anterior a este cambio): se emite en /session/status
+            missing = request.path.startswith(STATUS_COOKIE_PATH + '/') and name not in request.cookies
+            if session.modified or missing:
+                deadline = self._epoch(last_activity) + session.get('timeout_minutes', 30) * 60
+                response.set_cookie(name, self._status_signer().sign(str(deadline)).decode(),
+                                    path=STATUS_COOKIE_PATH, httponly=True,
+                                    secure=current_app.config.get('SESSION_COOKIE_SECURE', False),
+                                    samesite='Lax')
+        elif session.modified:
+            # Logout o timeout
+            response.delete_cookie(name, path=STATUS_COOKIE_PATH)
+        return response
+    
     def end_session(self, reason='manual'):
         """
         Terminar la sesión actual
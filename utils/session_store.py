@@ -0,0 +1,342 @@
+"""
+🍪 Almacenamiento de sesiones intercambiable (SESSION_BACKEND)
+- cookie (por defecto): cookie firmada con SECRET_KEY. La sesión es chica
+  (usuario, rol, marcas de tiempo, flashes), no hay E/S en el servidor y
+  funciona igual en cualquier nodo
+- sqlite: sesión en el servidor, archivo SQLite (WAL) compartido por los
+  workers de un mismo nodo; vencimiento indexado. El archivo debe ser
+  privado del usuario del proceso (por defecto en instance/, ver utils/private_files.py)
+- postgres: sesión en el servidor, tabla sesiones (UNLOGGED) en el primario;
+  compartida entre nodos (ver database/migracion_sesiones.sql)
+- filesystem: el Flask-Session anterior (./flask_session), solo por compatibilidad
+
+Migración: si llega una cookie de sesión del almacenamiento anterior
+(un id de Flask-Session), los datos se leen del archivo en SESSION_FILE_DIR,
+se pasan al backend actual y el archivo se borra. Los usuarios no pierden
+la sesión al cambiar de backend.
+
+Los archivos estáticos y las rutas @sessionless no leen la cookie ni el almacén.
+
+Los backends de servidor solo escriben cuando la sesión cambió o cuando
+pasó la mitad de su vida (para renovar el vencimiento), no en cada request.
+"""
+
+import os
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SecureCookieSession, SecureCookieSessionInterface
+from utils.private_files import default_path, ensure_private_file
+from utils.session_manager import session_manager
+
+BACKENDS = ('cookie', 'sqlite', 'postgres', 'filesystem')
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at);
+"""
+
+
+class LegacyFileSessions:
+    """Lectura (una sola vez) de las sesiones guardadas por Flask-Session en archivos"""
+
+    KEY_PREFIX = 'session:'
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._cache = None
+        self.migradas = 0
+
+    def _files(self):
+        if self._cache is None and self.directory and os.path.isdir(self.directory):
+            from cachelib.file import FileSystemCache
+            self._cache = FileSystemCache(self.directory)
+        return self._cache
+
+    @staticmethod
+    def looks_like_legacy(value):
+        """Los ids de Flask-Session son uuid4; las cookies firmadas llevan '.'"""
+        return bool(value) and '.' not in value and len(value) <= 64
+
+    def pop(self, sid):
+        """Datos de la sesión anterior (y borrar su archivo) o None"""
+        files = self._files()
+        if files is None:
+            return None
+        try:
+            data = files.get(self.KEY_PREFIX + sid)
+            if data is not None:
+                files.delete(self.KEY_PREFIX + sid)
+                self.migradas += 1
+            return data
+        except Exception as e:
+            print(f"⚠️ No se pudo migrar la sesión anterior: {e}", file=sys.stderr)
+            return None
+
+
+class SignedCookieSessionInterface(SecureCookieSessionInterface):
+    """Cookie firmada de Flask con migración de sesiones en archivos"""
+
+    def __init__(self, legacy):
+        self.legacy = legacy
+
+    def open_session(self, app, request):
+        if session_manager.skips_session(app, request):
+            return self.session_class()
+        session = super().open_session(app, request)
+        if session is not None and not session:
+            value = request.cookies.get(self.get_cookie_name(app))
+            if self.legacy.looks_like_legacy(value):
+                data = self.legacy.pop(value)
+                if data:
+                    session = self.session_class(data)
+                    session.modified = True
+        return session
+
+
+class ServerSession(SecureCookieSession):
+    """Sesión guardada en el servidor; la cookie solo lleva el id"""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires_at = expires_at
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Base de los backends de servidor: id aleatorio en la cookie, datos en el almacén"""
+
+    session_class = ServerSession
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, legacy, purge_interval=300):
+        self.legacy = legacy
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+
+    # Operaciones de cada backend
+    def load(self, sid):
+        """(datos serializados, expires_at) o None"""
+        raise NotImplementedError
+
+    def store(self, sid, data, expires_at):
+        raise NotImplementedError
+
+    def delete(self, sid):
+        raise NotImplementedError
+
+    def purge(self):
+        """Borrar las sesiones vencidas (usa el índice de vencimiento)"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _generate_sid():
+        return secrets.token_urlsafe(32)
+
+    def open_session(self, app, request):
+        if session_manager.skips_session(app, request):
+            return self.session_class()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return self.session_class(sid=self._generate_sid())
+
+        try:
+            row = self.load(sid)
+        except Exception as e:
+            # Sin almacén no se puede saber quién es: sesión nula (no borra la cookie)
+            print(f"❌ Error leyendo la sesión: {e}", file=sys.stderr)
+            return None
+
+        if row is not None:
+            data, expires_at = row
+            return self.session_class(self.serializer.loads(data), sid=sid, expires_at=expires_at)
+
+        data = self.legacy.pop(sid) if self.legacy.looks_like_legacy(sid) else None
+        if data:
+            session = self.session_class(data, sid=sid)
+            session.modified = True
+            return session
+        return self.session_class(sid=self._generate_sid())
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if session.sid is None:
+            # Request sin sesión (static / @sessionless): nada que guardar
+            return
+
+        if not session:
+            if session.modified:
+                self.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add("Cookie")
+            return
+
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        renew = session.expires_at is None or session.expires_at - now < lifetime / 2
+        if not (session.modified or renew):
+            return
+
+        session.expires_at = now + lifetime
+        self.store(session.sid, self.serializer.dumps(dict(session)), session.expires_at)
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                            httponly=httponly, domain=domain, path=path,
+                            secure=secure, samesite=samesite)
+        response.vary.add("Cookie")
+
+        if now - self._last_purge > self.purge_interval:
+            self._last_purge = now
+            try:
+                self.purge()
+            except Exception as e:
+                print(f"⚠️ Error purgando sesiones vencidas: {e}", file=sys.stderr)
+
+
+class SQLiteSessionInterface(ServerSideSessionInterface):
+    """Sesiones en un archivo SQLite compartido por los workers del nodo"""
+
+    def __init__(self, path, legacy, purge_interval=300):
+        super().__init__(legacy, purge_interval)
+        self.path = path
+        self._pid = None
+        self._thread_local = threading.local()
+
+    def _conn(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread_local = threading.local()
+        conn = getattr(self._thread_local, 'conn', None)
+        if conn is None:
+            # Quien pueda escribir el archivo puede fabricar sesiones: debe ser privado
+            ensure_private_file(self.path)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SQLITE_SCHEMA)
+            self._thread_local.conn = conn
+        return conn
+
+    def load(self, sid):
+        return self._conn().execute(
+            'SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?', (sid, time.time())
+        ).fetchone()
+
+    def store(self, sid, data, expires_at):
+        self._conn().execute('INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)',
+                             (sid, data, expires_at))
+
+    def delete(self, sid):
+        self._conn().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def purge(self):
+        self._conn().execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),))
+
+
+class PostgresSessionInterface(ServerSideSessionInterface):
+    """Sesiones en la tabla sesiones del primario (compartidas entre nodos)"""
+
+    def __init__(self, db_pool, legacy, purge_interval=300):
+        super().__init__(legacy, purge_interval)
+        self.db_pool = db_pool
+
+    def _execute(self, query, params):
+        # Conexión propia y breve: no ocupa la conexión del request
+        with self.db_pool.get_pool().connection() as conn:
+            cursor = conn.execute(query, params)
+            return cursor.fetchone() if cursor.description else None
+
+    def load(self, sid):
+        row = self._execute("""
+            SELECT datos, EXTRACT(EPOCH FROM expira)::float AS expira
+            FROM sesiones WHERE sid = %s AND expira > now()
+        """, (sid,))
+        return (row['datos'], row['expira']) if row else None
+
+    def store(self, sid, data, expires_at):
+        self._execute("""
+            INSERT INTO sesiones (sid, datos, expira) VALUES (%s, %s, to_timestamp(%s))
+            ON CONFLICT (sid) DO UPDATE SET datos = EXCLUDED.datos, expira = EXCLUDED.expira
+        """, (sid, data, expires_at))
+
+    def delete(self, sid):
+        self._execute("DELETE FROM sesiones WHERE sid = %s", (sid,))
+
+    def purge(self):
+        self._execute("DELETE FROM sesiones WHERE expira <= now()", ())
+
+
+class SessionStore:
+    """Selecciona e instala el backend de sesiones según SESSION_BACKEND"""
+
+    def __init__(self, app=None):
+        self.app = app
+        self.backend = None
+        self.interface = None
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Instalar el session_interface de la aplicación Flask"""
+        self.app = app
+        app.session_store = self
+
+        app.config.setdefault('SESSION_BACKEND', 'cookie')
+        app.config.setdefault('SESSION_FILE_DIR', './flask_session')
+        app.config.setdefault('SESSION_SQLITE_PATH', None)
+        app.config.setdefault('SESSION_PURGE_INTERVAL', 300)
+
+        backend = app.config['SESSION_BACKEND']
+        if backend not in BACKENDS:
+            raise ValueError(f"SESSION_BACKEND inválido: {backend} (opciones: {', '.join(BACKENDS)})")
+        self.backend = backend
+
+        if backend == 'filesystem':
+            from flask_session import Session
+            app.config['SESSION_TYPE'] = 'filesystem'
+            Session(app)
+            self.interface = app.session_interface
+            print(f"🗂️ Sesiones en archivos (Flask-Session): {app.config['SESSION_FILE_DIR']}")
+            return
+
+        legacy = LegacyFileSessions(app.config['SESSION_FILE_DIR'])
+        purge_interval = app.config['SESSION_PURGE_INTERVAL']
+        if backend == 'cookie':
+            self.interface = SignedCookieSessionInterface(legacy)
+        elif backend == 'sqlite':
+            path = app.config['SESSION_SQLITE_PATH'] or default_path(app, 'domiweb-sessions.sqlite3')
+            self.interface = SQLiteSessionInterface(path, legacy, purge_interval)
+            self.interface._conn()  # Valida el archivo al arrancar
+        else:
+            self.interface = PostgresSessionInterface(app.db_pool, legacy, purge_interval)
+
+        app.session_interface = self.interface
+        print(f"🍪 Sesiones: backend {backend}")
+
+    def stats(self):
+        """Backend en uso y sesiones migradas desde archivos en este worker"""
+        legacy = getattr(self.interface, 'legacy', None)
+        return {
+            'backend': self.backend,
+            'migradas_desde_archivos': legacy.migradas if legacy else 0,
+        }
+
+
+# Instancia global
+session_store = SessionStore()
@@ -0,0 +1,181 @@
+"""
+🛬 Single-flight: una sola carga en vuelo por clave (hilos y workers)
+Cuando una entrada cara de la caché vence en hora pico, todos los requests
+concurrentes repetirían la misma consulta. Con single-flight:
+- Dentro del worker los hilos esperan a un único cálculo (threading.Lock)
+- Entre workers se coordina con un lock en la caché compartida
+  (utils/cache.py): quien no lo obtiene espera a que el valor aparezca,
+  sin ocupar conexiones de PostgreSQL mientras espera
+- Stale-while-revalidate (get_or_load): pasado el TTL el valor sigue
+  guardado durante SINGLE_FLIGHT_STALE_TTL segundos; un solo request lo
+  recalcula y los demás reciben la copia anterior sin esperar
+
+Si la espera supera SINGLE_FLIGHT_TIMEOUT el request calcula por su cuenta
+(se prefiere una consulta repetida antes que un request colgado).
+Las invalidaciones explícitas (cache.delete) borran también la copia
+anterior, así que nunca se sirve un dato invalidado a propósito.
+
+Uso:
+    stats = single_flight.get_or_load('repartidor_dashboard', idrep, cargar, ttl=5)
+    menu = single_flight.run('menu:indice', cargar_menu, ready=menu_en_cache)
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from utils.cache import cache
+
+LOCK_PREFIX = 'single_flight:'
+
+
+class SingleFlight:
+    """Coalescencia de cargas concurrentes con opción de servir datos obsoletos"""
+
+    def __init__(self, app=None):
+        self.app = app
+        self.wait_timeout = 5.0
+        self.stale_ttl = 60
+        self.lock_ttl = 30
+        self.poll_interval = 0.05
+        # clave -> [threading.Lock, hilos que lo usan]
+        self._inflight = {}
+        self._guard = threading.Lock()
+        self._stats = {'calculos': 0, 'esperas_resueltas': 0, 'obsoletos_servidos': 0, 'esperas_vencidas': 0}
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configurar tiempos desde la aplicación Flask"""
+        self.app = app
+        app.single_flight = self
+        app.config.setdefault('SINGLE_FLIGHT_TIMEOUT', 5.0)
+        app.config.setdefault('SINGLE_FLIGHT_STALE_TTL', 60)
+        self.wait_timeout = app.config['SINGLE_FLIGHT_TIMEOUT']
+        self.stale_ttl = app.config['SINGLE_FLIGHT_STALE_TTL']
+        # El lock entre workers vence solo si el worker que calcula muere
+        self.lock_ttl = max(30, self.wait_timeout * 2)
+
+    @contextmanager
+    def _thread_lock(self, key):
+        """Lock por clave dentro del worker (se descarta cuando nadie lo usa)"""
+        with self._guard:
+            entry = self._inflight.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            yield entry[0]
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    self._inflight.pop(key, None)
+
+    def run(self, key, compute, ready=None):
+        """
+        Ejecutar compute() una sola vez entre los requests concurrentes de key.
+
+        Args:
+            key: Identificador de la carga
+            compute: Función que calcula (y normalmente guarda en caché) el valor
+            ready: Opcional; devuelve el valor si otro request ya lo dejó en
+                   caché, o None. Los que esperaban lo usan en lugar de calcular.
+        """
+        with self._thread_lock(key) as lock:
+            acquired = lock.acquire(timeout=self.wait_timeout)
+            try:
+                if ready is not None:
+                    value = ready()
+                    if value is not None:
+                        self._stats['esperas_resueltas'] += 1
+                        return value
+
+                deadline = time.monotonic() + self.wait_timeout
+                owner = cache.acquire_lock(LOCK_PREFIX + key, self.lock_ttl)
+                while not owner and time.monotonic() < deadline:
+                    time.sleep(self.poll_interval)
+                    if ready is not None:
+                        value = ready()
+                        if value is not None:
+                            self._stats['esperas_resueltas'] += 1
+                            return value
+                    owner = cache.acquire_lock(LOCK_PREFIX + key, self.lock_ttl)
+
+                if not (owner and acquired):
+                    self._stats['esperas_vencidas'] += 1
+                try:
+                    self._stats['calculos'] += 1
+                    return compute()
+                finally:
+                    if owner:
+                        cache.release_lock(LOCK_PREFIX + key)
+            finally:
+                if acquired:
+                    lock.release()
+
+    def _try_refresh(self, key):
+        """Tomar los locks sin esperar; devuelve una función para liberarlos o None"""
+        with self._guard:
+            entry = self._inflight.get(key)
+            if entry is None:
+                entry = self._inflight[key] = [threading.Lock(), 0]
+            if not entry[0].acquire(blocking=False):
+                return None
+            entry[1] += 1
+
+        def release_thread():
+            with self._guard:
+                entry[0].release()
+                entry[1] -= 1
+                if not entry[1]:
+                    self._inflight.pop(key, None)
+
+        if not cache.acquire_lock(LOCK_PREFIX + key, self.lock_ttl):
+            release_thread()
+            return None
+
+        def release():
+            cache.release_lock(LOCK_PREFIX + key)
+            release_thread()
+        return release
+
+    def get_or_load(self, namespace, key, loader, ttl, stale_ttl=None):
+        """
+        Valor de la caché compartida con carga coalescida y stale-while-revalidate.
+        loader() no debe devolver None.
+        """
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        flight_key = f'{namespace}:{key}'
+
+        def load():
+            value = loader()
+            cache.set(namespace, key, (value, time.time() + ttl), ttl=ttl + stale_ttl)
+            return value
+
+        envelope = cache.get(namespace, key)
+        if envelope is not None:
+            value, fresh_until = envelope
+            if fresh_until > time.time():
+                return value
+            # Vencido: un solo request recalcula, los demás reciben la copia anterior
+            release = self._try_refresh(flight_key)
+            if release is None:
+                self._stats['obsoletos_servidos'] += 1
+                return value
+            try:
+                self._stats['calculos'] += 1
+                return load()
+            finally:
+                release()
+
+        def ready():
+            current = cache.get(namespace, key)
+            return current[0] if current is not None else None
+
+        return self.run(flight_key, load, ready=ready)
+
+    def stats(self):
+        """Estadísticas del worker actual"""
+        return {**self._stats, 'en_vuelo': len(self._inflight)}
+
+
+# Instancia global
+single_flight = SingleFlight()